@@ -0,0 +1,80 @@
+"""add_data_isolation_indexes
+
+Revision ID: 333d93894882
+Revises: 9f013ab7798a
+Create Date: 2026-10-18 10:05:13.572941
+
+将 migrations/add_data_isolation_indexes.py 中的索引纳入 Alembic 管理。
+投票写入依赖 idx_vote_unique_per_voter_phase 做冲突判断，因此该索引必须存在。
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '333d93894882'
+down_revision: Union[str, None] = '9f013ab7798a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (索引名, 表名, 列, 是否唯一)
+INDEXES = [
+    ('idx_vote_unique_per_voter_phase', 'vote_records', ['contest_id', 'voter_id', 'vote_phase'], True),
+    ('idx_score_unique_per_judge_debater', 'judge_scores', ['contest_id', 'judge_id', 'debater_id'], True),
+    ('idx_users_class_id_role', 'users', ['class_id', 'role'], False),
+    ('idx_users_class_id_team_side', 'users', ['class_id', 'team_side', 'debater_position'], False),
+    ('idx_contests_class_id', 'contests', ['class_id'], False),
+]
+
+
+# 唯一索引 -> (表名, 分组列)，创建前检查重复数据
+UNIQUE_KEYS = [
+    ('vote_records', 'contest_id, voter_id, vote_phase'),
+    ('judge_scores', 'contest_id, judge_id, debater_id'),
+]
+
+
+def _existing_indexes(table_name: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def _duplicate_count(table_name: str, columns: str) -> int:
+    """会被唯一索引拒绝的多余行数（每组保留最早的一条）"""
+    return op.get_bind().execute(sa.text(
+        f"SELECT COUNT(*) FROM {table_name} WHERE id NOT IN "
+        f"(SELECT MIN(id) FROM {table_name} GROUP BY {columns})"
+    )).scalar()
+
+
+def upgrade() -> None:
+    # 存在重复数据时不自动删除：默认中止迁移，确认后使用 `alembic -x dedupe=true upgrade head` 保留每组最早的一条
+    dedupe = context.get_x_argument(as_dictionary=True).get('dedupe', '').lower() == 'true'
+    duplicates = {table_name: _duplicate_count(table_name, columns) for table_name, columns in UNIQUE_KEYS}
+    found = {table_name: count for table_name, count in duplicates.items() if count}
+    if found and not dedupe:
+        raise RuntimeError(
+            f"存在重复数据，无法创建唯一索引: {found}。"
+            "请先人工核对，或使用 `alembic -x dedupe=true upgrade head` 删除重复行（每组保留最早的一条）"
+        )
+    for table_name, columns in UNIQUE_KEYS:
+        if duplicates[table_name]:
+            print(f"删除 {table_name} 中的 {duplicates[table_name]} 条重复数据")
+            op.execute(
+                f"DELETE FROM {table_name} WHERE id NOT IN ("
+                f"SELECT MIN(id) FROM {table_name} GROUP BY {columns})"
+            )
+
+    # 手动脚本可能已经创建过这些索引，跳过已存在的
+    for name, table_name, columns, unique in INDEXES:
+        if name not in _existing_indexes(table_name):
+            op.create_index(name, table_name, columns, unique=unique)
+
+
+def downgrade() -> None:
+    # 这些索引都声明在模型上，init_db（create_all）和旧的手动脚本也会创建，
+    # 回滚时无法区分是否由本迁移创建；删除唯一索引还会使投票写入的冲突判断失效，因此全部保留
+    pass
@@ -0,0 +1,32 @@
+"""add_must_change_password_to_users
+
+Revision ID: 5c2e8d41a7b3
+Revises: 333d93894882
+Create Date: 2026-10-18 13:20:41.207365
+
+新增 users.must_change_password，已有账号默认为 False。
+仍在使用默认密码的旧账号需要运行 migrations/backfill_must_change_password.py 回填，
+回填需要对每个账号做一次 bcrypt 校验，因此不放在迁移中执行。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8d41a7b3'
+down_revision: Union[str, None] = '333d93894882'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column('must_change_password', sa.Boolean(), server_default=sa.false(), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'must_change_password')
@@ -19,9 +19,37 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24小时
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60  # 登录用户缓存有效期，0 表示关闭缓存
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000  # 登录用户缓存最多条目数
+    PASSWORD_HASH_WORKERS: int = 4  # 密码哈希线程池并发上限
     
     DATABASE_TYPE: str = "sqlite"  # postgres or sqlite
 
+    # 投票写入配置：开启后投票先进入内存队列，由后台任务按批写入
+    VOTE_WRITE_BEHIND: bool = False
+    VOTE_FLUSH_INTERVAL_MS: int = 20  # 最长攒批时间（毫秒）
+    VOTE_FLUSH_MAX_ROWS: int = 200  # 单批最多写入行数
+    VOTE_QUEUE_MAX_SIZE: int = 10000  # 队列容量，满时投票请求等待
+    VOTE_PROGRESS_INTERVAL_MS: int = 300  # 投票进度合并广播间隔（200~500 毫秒）
+
+    # WebSocket 发送配置：每个连接一个有上限的发送队列
+    WS_SEND_QUEUE_SIZE: int = 100  # 单个连接最多排队的消息数，满时丢弃最旧的
+    WS_SLOW_CLIENT_TIMEOUT_SECONDS: int = 10  # 队列已满且单条消息发送超过该时长时断开该连接
+    WS_SWEEP_INTERVAL_SECONDS: int = 15  # 清理半开连接的周期
+    WS_IDLE_TIMEOUT_SECONDS: int = 30  # 发送过心跳的客户端超过该时长无消息视为半开连接（前端每 5 秒 ping 一次）
+    WS_REPLAY_BUFFER_SIZE: int = 64  # 每个班级保留的最近消息数，用于断线重连补发（应小于 WS_SEND_QUEUE_SIZE）
+    TIMER_RESYNC_SECONDS: int = 10  # 倒计时期间重新广播截止时间的间隔，客户端据此校准本地倒数
+    LONG_POLL_TIMEOUT_SECONDS: int = 25  # 管理端长轮询（wait_for_change_since）最长等待时间
+    STAGE_TRANSITION_RETRIES: int = 3  # 阶段切换遇到并发修改时，重新读取状态后重试的次数
+    AUTO_CLOSE_VOTING_SECONDS: int = 0  # 开启赛前/赛后投票时默认多少秒后自动结束，0 表示不计时
+    AUTO_CLOSE_VOTE_RATIO: float = 0.0  # 投票人数达到观众总数的该比例时自动结束投票，0 表示不按比例结束
+
+    # 广播总线配置：多 worker 部署时所有广播经总线发送到每个 worker
+    BROADCAST_BACKEND: str = "local"  # local（单进程）、postgres（LISTEN/NOTIFY，需要 PostgreSQL）或 auto（UVICORN_WORKERS > 1 时用 postgres）
+    UVICORN_WORKERS: int = 1  # uvicorn worker 数，BROADCAST_BACKEND=auto 时据此选择总线
+    BROADCAST_CHANNEL: str = "ws_broadcast"  # NOTIFY 频道名
+    BROADCAST_LEADER_LOCK_KEY: int = 724001  # 选举倒计时执行进程使用的 advisory lock 键
+
     @property
     def DATABASE_URL(self) -> str:
         if self.DATABASE_TYPE == "sqlite":
@@ -2,12 +2,22 @@ import subprocess
 import json
 import sys
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, HTTPException, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
 from app.routers import auth_router, admin_router, vote_router, judge_score_router
 from app.routers.vote_records import router as vote_records_router
 from app.websocket import manager
+from app.websocket.manager import connection_role, ROLE_SCREEN, ROLE_ADMIN
+from app.websocket.backplane import backplane
+from app.config import settings
+from app.database import async_session_maker
+from app.schemas.vote import VoteSubmission, VoteResponse
+from app.services.auth import get_principal_from_token, authorize_connection_class
+from app.services.password_hasher import password_hasher
+from app.services.vote_ingest import vote_write_queue, cast_vote
 
 
 def run_migrations():
@@ -31,7 +41,20 @@ def run_migrations():
 async def lifespan(app: FastAPI):
     # 启动时运行数据库迁移
     run_migrations()
+    try:
+        await backplane.start()
+    except Exception as e:
+        # 总线不可用时退化为单进程广播
+        print(f"广播总线启动失败，仅在本进程广播: {e}")
+    if settings.VOTE_WRITE_BEHIND:
+        vote_write_queue.start()
     yield
+    # 关闭时写完队列中剩余的投票，并发出最后一次投票进度
+    await vote_write_queue.stop()
+    await manager.stop_progress_ticker()
+    await manager.stop_sweeper()
+    await backplane.stop()
+    password_hasher.shutdown()
 
 
 app = FastAPI(
@@ -64,25 +87,108 @@ async def root():
 
 
 
+async def handle_ws_vote(websocket: WebSocket, token: str | None, data: dict):
+    """
+    处理 WebSocket 上的 VOTE 消息，通过 id 字段回传确认
+
+    每张选票都按连接携带的 token 重新解析身份（缓存命中时不访问数据库），
+    token 过期、用户被修改或删除后不会继续沿用连接建立时的身份
+    """
+    correlation_id = data.get("id")
+    
+    def ack(ok: bool, **fields):
+        return {"type": "VOTE_ACK", "id": correlation_id, "ok": ok, **fields}
+    
+    # 回复同样经过该连接的发送队列，避免与广播并发写同一个 socket
+    
+    if not token:
+        manager.send_personal(websocket, ack(False, status=401, detail="无法验证凭据"))
+        return
+    
+    try:
+        vote_data = VoteSubmission(**(data.get("data") or {}))
+    except (ValidationError, TypeError):
+        manager.send_personal(websocket, ack(False, status=422, detail="投票参数无效"))
+        return
+    
+    try:
+        async with async_session_maker() as db:
+            user = await get_principal_from_token(db, token)
+            if user is None:
+                manager.send_personal(websocket, ack(False, status=401, detail="登录已过期，请重新登录"))
+                return
+            vote_record = await cast_vote(db, user, vote_data)
+    except HTTPException as e:
+        manager.send_personal(websocket, ack(False, status=e.status_code, detail=e.detail))
+        return
+    except Exception as e:
+        # 写入队列关闭、数据库错误等：回复失败确认，保持连接继续接收消息
+        print(f"WebSocket 投票失败: {e}")
+        manager.send_personal(websocket, ack(False, status=500, detail="投票失败，请重试"))
+        return
+    
+    manager.send_personal(websocket, ack(True, data=jsonable_encoder(VoteResponse(**vote_record))))
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, class_id: int | None = Query(None)):
-    """WebSocket 连接端点，支持按班级隔离"""
-    await manager.connect(websocket, class_id)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    class_id: int | None = Query(None),
+    token: str | None = Query(None),
+    encoding: str | None = Query(None),
+    resume_from: int | None = Query(None),
+    epoch: str | None = Query(None)
+):
+    """
+    WebSocket 连接端点，支持按班级隔离；携带 token 时在连接建立时鉴权一次。
+    encoding=msgpack 时服务端推送 MessagePack 二进制帧（需要安装 msgpack），否则为 JSON 文本帧。
+    重连时携带 resume_from（上次收到的 seq）和 epoch，服务端补发错过的消息或发送状态快照。
+    未指定 class_id 的连接需要发送 {"action": "SUBSCRIBE", "class_id": N} 选择班级后才会收到广播。
+
+    携带了 token 但验证失败、或无权访问请求的班级时拒绝连接（1008）；
+    非管理员用户的班级由服务端确定（观众固定为所属班级），不能通过 SUBSCRIBE 切换。
+    未携带 token 的连接视为大屏，只接收广播和选择班级，投票一律回复 401。
+    """
+    user = None
+    if token:
+        async with async_session_maker() as db:
+            user = await get_principal_from_token(db, token)
+            if user is None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+            try:
+                class_id = await authorize_connection_class(db, user, class_id)
+            except HTTPException:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+    
+    # 按 token 中的角色订阅 (class_id, 角色) 主题；未携带 token 的连接视为大屏
+    role = connection_role(user.role if user else None)
+    # 只有大屏和管理员可以通过 SUBSCRIBE 选择班级
+    can_subscribe = role in (ROLE_SCREEN, ROLE_ADMIN)
+    await manager.connect(websocket, class_id, encoding=encoding, resume_from=resume_from, epoch=epoch, role=role)
     try:
         while True:
             # 使用 receive_text 避免 JSON 解析错误导致连接断开
             text = await websocket.receive_text()
+            manager.touch(websocket)
             
             # 处理 ping 消息
             if text == "ping":
-                await websocket.send_text("pong")
+                manager.send_personal(websocket, "pong")
                 continue
             
             try:
                 data = json.loads(text)
                 # 处理客户端消息
                 if data.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    manager.send_personal(websocket, {"type": "pong"})
+                elif data.get("action") == "SUBSCRIBE" and isinstance(data.get("class_id"), int):
+                    # 未指定班级的连接（如大屏）选择要接收的班级
+                    if can_subscribe:
+                        manager.subscribe(websocket, data["class_id"])
+                elif data.get("action") == "VOTE":
+                    await handle_ws_vote(websocket, token, data)
                 elif data.get("action") == "SNATCH":
                     # 提问逻辑通过 HTTP API 处理，这里仅保持连接
                     pass
@@ -95,4 +201,3 @@ async def websocket_endpoint(websocket: WebSocket, class_id: int | None = Query(
         pass
     finally:
         manager.disconnect(websocket, class_id)
-
@@ -6,8 +6,10 @@ from app.models.teacher_class import TeacherClass
 from app.models.contest import Contest
 from app.models.vote_record import VoteRecord
 from app.models.judge_score import JudgeScore
+from app.models.contest_result_snapshot import ContestResultSnapshot
 
 __all__ = [
     "User", "SystemSettings", "Workspace", "Class", 
-    "TeacherClass", "Contest", "VoteRecord", "JudgeScore"
+    "TeacherClass", "Contest", "VoteRecord", "JudgeScore",
+    "ContestResultSnapshot"
 ]
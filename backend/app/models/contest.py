@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, ForeignKey, DateTime
+from sqlalchemy import String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -21,4 +21,9 @@ class Contest(Base):
     # 关系
     class_ = relationship("Class", back_populates="contests")
     vote_records = relationship("VoteRecord", back_populates="contest", cascade="all, delete-orphan")
-    judge_scores = relationship("JudgeScore", back_populates="contest", cascade="all, delete-orphan")
\ No newline at end of file
+    judge_scores = relationship("JudgeScore", back_populates="contest", cascade="all, delete-orphan")
+    result_snapshot = relationship("ContestResultSnapshot", back_populates="contest", uselist=False, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("idx_contests_class_id", "class_id"),
+    )
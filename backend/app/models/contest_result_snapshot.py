@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import ForeignKey, DateTime, Text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.database import Base
+
+
+class ContestResultSnapshot(Base):
+    """比赛结果快照 - 进入结果封存阶段时计算一次，揭晓时直接读取"""
+    __tablename__ = "contest_result_snapshots"
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    contest_id: Mapped[int] = mapped_column(ForeignKey("contests.id"), nullable=False, unique=True)
+    class_id: Mapped[int] = mapped_column(ForeignKey("classes.id"), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # 完整结果的 JSON
+    sealed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    # 关系
+    contest = relationship("Contest", back_populates="result_snapshot")
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import ForeignKey, Float, DateTime
+from sqlalchemy import ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -31,5 +31,7 @@ class JudgeScore(Base):
     debater = relationship("User", foreign_keys=[debater_id])
     
     __table_args__ = (
+        # 同一评委对同一辩手只能评分一次
+        Index("idx_score_unique_per_judge_debater", "contest_id", "judge_id", "debater_id", unique=True),
         {"sqlite_autoincrement": True},
     )
\ No newline at end of file
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import String, Enum, ForeignKey, Integer, Boolean
+from sqlalchemy import String, Enum, ForeignKey, Integer, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -28,6 +28,9 @@ class User(Base):
     # 学生团队的班级关联（学生只属于一个班级）
     class_id: Mapped[int | None] = mapped_column(ForeignKey("classes.id"), nullable=True)
     
+    # 是否仍在使用默认密码：创建账号时写入，修改密码后清除，登录时无需再做一次 bcrypt 校验
+    must_change_password: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    
     # 答辩状态：标记学生团队是否已完成答辩
     has_presented: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     
@@ -40,3 +43,8 @@ class User(Base):
     
     # 关系
     class_associations = relationship("TeacherClass", back_populates="teacher", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("idx_users_class_id_role", "class_id", "role"),
+        Index("idx_users_class_id_team_side", "class_id", "team_side", "debater_position"),
+    )
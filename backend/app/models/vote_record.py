@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, ForeignKey, DateTime
+from sqlalchemy import String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -21,5 +21,7 @@ class VoteRecord(Base):
     voter = relationship("User", foreign_keys=[voter_id])
     
     __table_args__ = (
+        # 同一观众在同一阶段只能投票一次，投票写入依赖该索引做冲突判断
+        Index("idx_vote_unique_per_voter_phase", "contest_id", "voter_id", "vote_phase", unique=True),
         {"sqlite_autoincrement": True},
     )
\ No newline at end of file
@@ -1,6 +1,5 @@
-import time
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy import select, func, delete
+from fastapi import APIRouter, Depends, Query, HTTPException, UploadFile, File, Request, Response
+from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -9,17 +8,46 @@ from app.models.system_settings import SystemSettings, SystemStage
 from app.models.class_ import Class
 from app.models.teacher_class import TeacherClass
 from app.models.contest import Contest
-from app.models.vote_record import VoteRecord
-from app.models.judge_score import JudgeScore
 from app.schemas.user import UserResponse, UserCreate, UserImport
 from app.schemas.system import StageSetRequest, SystemStateResponse, ScoreProgressResponse
-from app.services.auth import get_password_hash
-from app.services.system_state import update_debate_stage
+from app.services.auth import get_password_hash_async, DEFAULT_PASSWORD
+from app.services.account_import import import_accounts, import_roster_file
+from app.services.class_changes import class_changes, wait_for_change
+from app.services.class_state_cache import class_state_cache, publish_class_state, invalidate_class_state
+from app.services.deadline_scheduler import deadline_scheduler
+from app.services.debate_progress import debate_progress, adjust_roster, invalidate_roster, roster_roles
+from app.services.password_hasher import password_hasher
+from app.services.phase_closer import phase_closer, arm_phase_close
+from app.services.principal_cache import invalidate_principals, principal_cache
+from app.services.stage_machine import stage_machine, UNCHANGED
+from app.services.system_state import transition_stage
+from app.services.vote_tally import vote_tally, release_tallies
+from app.services.vote_ingest import vote_write_queue
+from app.services.result_snapshot import compute_contest_results, get_sealed_results
 from app.websocket import manager
+from app.websocket.backplane import backplane
 
 router = APIRouter(prefix="/admin", tags=["管理员"])
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """请求头 If-None-Match 是否包含当前 ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _conditional(request: Request, response: Response, etag: str) -> Response | None:
+    """设置 ETag；客户端缓存仍然有效时返回 304 响应"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 @router.get("/students", response_model=list[UserResponse])
 async def get_students(class_id: int = Query(...), db: AsyncSession = Depends(get_db)):
     """获取赛场内的所有观众"""
@@ -44,7 +72,8 @@ async def create_student(data: UserCreate, db: AsyncSession = Depends(get_db)):
         
     user = User(
         username=data.username,
-        password_hash=get_password_hash(data.password),
+        password_hash=await get_password_hash_async(data.password),
+        must_change_password=data.password == DEFAULT_PASSWORD,
         role=UserRole.audience,
         display_name=data.display_name or data.username,
         class_id=data.class_id,
@@ -53,34 +82,24 @@ async def create_student(data: UserCreate, db: AsyncSession = Depends(get_db)):
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    await adjust_roster(user.class_id, audience=1)
     return user
 
 
 @router.post("/students/import", status_code=201)
 async def import_students(data: UserImport, db: AsyncSession = Depends(get_db)):
     """批量导入观众账号"""
-    success_count = 0
-    errors = []
-    
-    for item in data.users:
-        # 检查用户名是否存在
-        result = await db.execute(select(User).where(User.username == item.username))
-        if result.scalar_one_or_none():
-            errors.append(f"用户 {item.username} 已存在")
-            continue
-            
-        user = User(
-            username=item.username,
-            password_hash=get_password_hash(item.password),
-            role=UserRole.audience,
-            display_name=item.display_name or item.username,
-            class_id=data.class_id,
-            workspace_id=1
-        )
-        db.add(user)
-        success_count += 1
-        
-    await db.commit()
+    result = await import_accounts(
+        db,
+        data.users,
+        role=UserRole.audience,
+        class_id=data.class_id,
+        link_class=False,
+        exists_message=lambda username: f"用户 {username} 已存在"
+    )
+    success_count = result["created_count"]
+    errors = result["errors"]
+    await adjust_roster(data.class_id, audience=success_count)
     
     return {
         "success_count": success_count,
@@ -90,6 +109,45 @@ async def import_students(data: UserImport, db: AsyncSession = Depends(get_db)):
     }
 
 
+@router.post("/students/import/file", status_code=201)
+async def import_students_file(
+    class_id: int = Query(...),
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """从 CSV/XLSX 名单文件批量导入观众账号，导入进度通过 WebSocket 推送"""
+    # 最近一次上报的进度；中途出错时之前的块已经提交，名单人数和最终进度以此为准
+    progress = {"rows_parsed": 0, "created_count": 0, "failed_count": 0}
+    
+    async def report_progress(current: dict, done: bool = False):
+        progress.update(current)
+        await manager.broadcast_to_class(class_id, {
+            "type": "IMPORT_PROGRESS",
+            "data": {"class_id": class_id, "filename": file.filename, "done": done, **progress}
+        })
+    
+    try:
+        result = await import_roster_file(db, file.filename, file.file, class_id, on_progress=report_progress)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await file.close()
+        await adjust_roster(class_id, audience=progress["created_count"])
+        await report_progress(progress, done=True)
+    
+    created_count = result["created_count"]
+    failed_count = result["failed_count"]
+    
+    return {
+        "rows_parsed": result["rows_parsed"],
+        "success_count": created_count,
+        "created_count": created_count,
+        "failed_count": failed_count,
+        "errors": result["errors"],
+        "message": f"成功导入 {created_count} 个账号" + (f"，{failed_count} 个失败" if failed_count else "")
+    }
+
+
 @router.get("/teachers", response_model=list[UserResponse])
 async def get_teachers(class_id: int = Query(...), db: AsyncSession = Depends(get_db)):
     """获取赛场内的所有评委"""
@@ -112,7 +170,8 @@ async def create_teacher(data: UserCreate, db: AsyncSession = Depends(get_db)):
         
     user = User(
         username=data.username,
-        password_hash=get_password_hash(data.password),
+        password_hash=await get_password_hash_async(data.password),
+        must_change_password=data.password == DEFAULT_PASSWORD,
         role=UserRole.judge, # 使用 judge 角色
         display_name=data.display_name,
         workspace_id=1
@@ -126,6 +185,7 @@ async def create_teacher(data: UserCreate, db: AsyncSession = Depends(get_db)):
         tc = TeacherClass(teacher_id=user.id, class_id=data.class_id)
         db.add(tc)
         await db.commit()
+        await adjust_roster(data.class_id, judge=1)
         
     return user
 
@@ -133,37 +193,20 @@ async def create_teacher(data: UserCreate, db: AsyncSession = Depends(get_db)):
 @router.post("/teachers/import")
 async def import_teachers(data: UserImport, db: AsyncSession = Depends(get_db)):
     """批量导入评委"""
-    created_count = 0
-    errors = []
-    
-    for teacher_data in data.users:
-        try:
-            # 检查用户名是否存在
-            result = await db.execute(select(User).where(User.username == teacher_data.username))
-            if result.scalar_one_or_none():
-                errors.append(f"用户名 {teacher_data.username} 已存在")
-                continue
-            
-            user = User(
-                username=teacher_data.username,
-                password_hash=get_password_hash(teacher_data.password or '123456'),
-                role=UserRole.judge,
-                display_name=teacher_data.display_name,
-                workspace_id=1
-            )
-            db.add(user)
-            await db.flush()  # 获取user.id
-            
-            # 关联到赛场
-            if teacher_data.class_id:
-                tc = TeacherClass(teacher_id=user.id, class_id=teacher_data.class_id)
-                db.add(tc)
-            
-            created_count += 1
-        except Exception as e:
-            errors.append(f"创建 {teacher_data.username} 失败: {str(e)}")
-    
-    await db.commit()
+    result = await import_accounts(
+        db,
+        data.users,
+        role=UserRole.judge,
+        class_id=None,
+        link_class=True,
+        exists_message=lambda username: f"用户名 {username} 已存在",
+        default_password=DEFAULT_PASSWORD
+    )
+    created_count = result["created_count"]
+    errors = result["errors"]
+    if created_count:
+        # 每行关联的赛场不同，直接让所有班级的名单计数重新预热
+        await invalidate_roster()
     
     return {
         "created_count": created_count,
@@ -187,18 +230,20 @@ async def add_teacher_to_class(class_id: int = Query(...), teacher_id: int = Que
     tc = TeacherClass(teacher_id=teacher_id, class_id=class_id)
     db.add(tc)
     await db.commit()
+    await adjust_roster(class_id, judge=1)
     return {"message": "添加成功"}
 
 
 @router.delete("/teachers/{teacher_id}")
 async def remove_teacher_from_class(teacher_id: int, class_id: int = Query(...), db: AsyncSession = Depends(get_db)):
     """从赛场移除评委"""
-    await db.execute(
+    result = await db.execute(
         delete(TeacherClass)
         .where(TeacherClass.class_id == class_id)
         .where(TeacherClass.teacher_id == teacher_id)
     )
     await db.commit()
+    await adjust_roster(class_id, judge=-result.rowcount)
     return {"message": "移除成功"}
 
 
@@ -210,12 +255,23 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
         
+    # 用户从所在班级名单中移除的角色
+    user_class_id = user.class_id
+    removed = roster_roles(user.role, user_class_id, user.team_side, user.debater_position)
+    judge_class_ids = []
+    
     # 如果是评委，还要删除关联
     if user.role == UserRole.judge:
+        links = await db.execute(select(TeacherClass.class_id).where(TeacherClass.teacher_id == user_id))
+        judge_class_ids = links.scalars().all()
         await db.execute(delete(TeacherClass).where(TeacherClass.teacher_id == user_id))
         
     await db.delete(user)
     await db.commit()
+    await invalidate_principals(user_id=user_id)
+    await adjust_roster(user_class_id, **{role: -count for role, count in removed.items()})
+    for judge_class_id in judge_class_ids:
+        await adjust_roster(judge_class_id, judge=-1)
     return {"message": "删除成功"}
 
 
@@ -234,10 +290,20 @@ async def get_teams(class_id: int = Query(...), db: AsyncSession = Depends(get_d
 
 
 @router.get("/state", response_model=SystemStateResponse)
-async def get_system_state(class_id: int = Query(...), db: AsyncSession = Depends(get_db)):
-    """获取当前班级的系统状态"""
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
+async def get_system_state(
+    request: Request,
+    response: Response,
+    class_id: int = Query(...),
+    wait_for_change_since: int | None = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    获取当前班级的系统状态
+
+    支持 If-None-Match（ETag 由 update_time 和倒计时组成，未变化时返回 304；当前团队的名称、主题缓存在状态中，修改时 update_time 一并递增）；
+    传入 wait_for_change_since=<update_time> 时等待到状态比该时间更新或超时再返回。
+    """
+    settings = await class_state_cache.get(db, class_id)
     
     if not settings:
         # 创建该班级的默认状态
@@ -245,16 +311,19 @@ async def get_system_state(class_id: int = Query(...), db: AsyncSession = Depend
         db.add(settings)
         await db.commit()
         await db.refresh(settings)
+        settings = await publish_class_state(settings)
+    
+    if wait_for_change_since is not None:
+        async def state_changed() -> bool:
+            state = await class_state_cache.get(db, class_id)
+            return state is None or state.update_time > wait_for_change_since
+        await wait_for_change(class_id, state_changed)
+        settings = await class_state_cache.get(db, class_id) or settings
     
-    # 获取当前团队名称和主题
-    team_name = None
-    team_topic = None
-    if settings.current_team_id:
-        team_result = await db.execute(select(User).where(User.id == settings.current_team_id))
-        team = team_result.scalar_one_or_none()
-        if team:
-            team_name = team.display_name
-            team_topic = team.topic
+    etag = f'W/"state-{class_id}-{settings.update_time}-{manager.get_countdown(class_id)}"'
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
     
     # 获取当前倒计时
     current_countdown = manager.get_countdown(class_id)
@@ -269,8 +338,8 @@ async def get_system_state(class_id: int = Query(...), db: AsyncSession = Depend
         class_id=settings.class_id,
         current_stage=settings.current_stage,
         current_team_id=settings.current_team_id,
-        current_team_name=team_name,
-        current_team_topic=team_topic,
+        current_team_name=settings.current_team_name,
+        current_team_topic=settings.current_team_topic,
         snatch_slots_remaining=settings.snatch_slots_remaining,
         snatch_start_time=settings.snatch_start_time,
         countdown=manager.get_countdown(class_id),
@@ -285,58 +354,20 @@ async def get_system_state(class_id: int = Query(...), db: AsyncSession = Depend
 @router.post("/stage/set", response_model=SystemStateResponse)
 async def set_stage(data: StageSetRequest, class_id: int = Query(...), db: AsyncSession = Depends(get_db)):
     """设置系统阶段"""
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
-    
-    if not settings:
-        settings = SystemSettings(class_id=class_id)
-        db.add(settings)
-    
-    settings.current_stage = data.stage
-    settings.update_time = int(time.time() * 1000)
-    
-    if data.target_team_id is not None:
-        settings.current_team_id = data.target_team_id
-    
-    await db.commit()
-    await db.refresh(settings)
-    
-    # 获取当前团队信息
-    team_name = None
-    team_topic = None
-    if settings.current_team_id:
-        team_result = await db.execute(select(User).where(User.id == settings.current_team_id))
-        team = team_result.scalar_one_or_none()
-        if team:
-            team_name = team.display_name
-            team_topic = team.topic
-            
-    # 构造 WebSocket 消息数据
-    state_data = {
-        "class_id": settings.class_id,
-        "current_stage": settings.current_stage,
-        "current_team_id": settings.current_team_id,
-        "current_team_name": team_name,
-        "current_team_topic": team_topic,
-        "snatch_slots_remaining": settings.snatch_slots_remaining,
-        "countdown": manager.get_countdown(class_id),
-        "teacher_avg_score": None,
-        "student_avg_score": None,
-        "update_time": settings.update_time
-    }
-    
-    # 广播状态更新
-    await manager.broadcast_to_class(class_id, {
-        "type": "STATE_UPDATE",
-        "data": state_data
-    })
+    transition = await transition_stage(
+        db,
+        class_id,
+        data.stage,
+        current_team_id=data.target_team_id if data.target_team_id is not None else UNCHANGED
+    )
+    settings = transition.state
     
     return SystemStateResponse(
         class_id=settings.class_id,
         current_stage=settings.current_stage,
         current_team_id=settings.current_team_id,
-        current_team_name=team_name,
-        current_team_topic=team_topic,
+        current_team_name=settings.current_team_name,
+        current_team_topic=settings.current_team_topic,
         snatch_slots_remaining=settings.snatch_slots_remaining,
         snatch_start_time=settings.snatch_start_time,
         countdown=manager.get_countdown(class_id),
@@ -392,6 +423,7 @@ async def create_class(
     )
     db.add(settings)
     await db.commit()
+    await publish_class_state(settings)
     
     return {
         "id": class_.id,
@@ -431,8 +463,13 @@ async def delete_class(
     if not class_:
         raise HTTPException(status_code=404, detail="场次不存在")
     
+    contest_ids = (await db.execute(select(Contest.id).where(Contest.class_id == class_id))).scalars().all()
     await db.delete(class_)
     await db.commit()
+    await invalidate_principals(class_id=class_id)
+    await invalidate_class_state(class_id)
+    await invalidate_roster(class_id)
+    await release_tallies(contest_ids)
     return {"message": "场次删除成功"}
 
 
@@ -460,22 +497,12 @@ async def create_contest(
     db.add(contest)
     await db.flush()  # 获取 contest.id
     
-    # 更新系统设置中的当前比赛ID
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
-    
-    if not settings:
-        settings = SystemSettings(class_id=class_id)
-        db.add(settings)
-    
-    settings.contest_id = contest.id
-    settings.update_time = int(time.time() * 1000)
-    
-    await db.commit()
+    # 更新系统设置中的当前比赛ID（与比赛一起提交，按 update_time 比较并写入）
+    settings = await stage_machine.update(db, class_id, contest_id=contest.id)
     await db.refresh(contest)
     
-    # 获取更新后的设置以确保数据完整
-    await db.refresh(settings)
+    class_state_cache.put_contest(contest)
+    settings = await publish_class_state(settings)
 
     # 广播状态更新，通知所有端有了新的比赛
     await manager.broadcast_debate_update(
@@ -489,11 +516,7 @@ async def create_contest(
             "con_topic": contest.con_topic
         },
         class_id=class_id,
-        voting_enabled={
-            "pre_voting": settings.pre_voting_enabled,
-            "post_voting": settings.post_voting_enabled,
-            "judge_scoring": settings.judge_scoring_enabled
-        },
+        voting_enabled=settings.voting_enabled,
         results_revealed=settings.results_revealed,
         progress={}, # 新比赛无进度
         update_time=settings.update_time
@@ -504,23 +527,37 @@ async def create_contest(
 
 @router.get("/debate/contest")
 async def get_current_contest(
+    request: Request,
+    response: Response,
     class_id: int = Query(...), 
+    wait_for_change_since: int | None = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取班级当前的最新比赛"""
-    # 优先从系统设置中获取当前激活的比赛ID
-    settings_result = await db.execute(
-        select(SystemSettings).where(SystemSettings.class_id == class_id)
-    )
-    settings = settings_result.scalar_one_or_none()
+    """
+    获取班级当前的最新比赛
+
+    创建比赛会更新 update_time，ETag 直接由 update_time 组成；
+    wait_for_change_since 的用法同 /admin/state。
+    """
+    # 优先从系统设置中获取当前激活的比赛ID（读取缓存）
+    settings = await class_state_cache.get(db, class_id)
+    
+    if settings and wait_for_change_since is not None:
+        async def state_changed() -> bool:
+            state = await class_state_cache.get(db, class_id)
+            return state is None or state.update_time > wait_for_change_since
+        await wait_for_change(class_id, state_changed)
+        settings = await class_state_cache.get(db, class_id)
+    
+    if settings:
+        not_modified = _conditional(request, response, f'W/"contest-{class_id}-{settings.update_time}"')
+        if not_modified is not None:
+            return not_modified
     
     contest = None
     if settings and settings.contest_id:
         # 如果系统设置指明了当前比赛，直接获取该比赛
-        contest_result = await db.execute(
-            select(Contest).where(Contest.id == settings.contest_id)
-        )
-        contest = contest_result.scalar_one_or_none()
+        contest = await class_state_cache.get_contest(db, settings.contest_id)
         
     if not contest:
         # 如果没有指定或指定的比赛不存在，降级为获取最新创建的比赛
@@ -556,9 +593,18 @@ async def set_debate_stage(
     stage: str = Query(...),
     class_id: int = Query(...),
     contest_id: int | None = Query(None),
+    expected_update_time: int | None = Query(None),
+    auto_close_seconds: int | None = Query(None, ge=0),
+    auto_close_ratio: float | None = Query(None, ge=0, le=1),
     db: AsyncSession = Depends(get_db)
 ):
-    """设置辩论赛阶段"""
+    """
+    设置辩论赛阶段
+
+    按阶段转换表校验：不允许的切换返回 400；传入 expected_update_time 且状态已被其他操作修改时返回 409。
+    开启赛前/赛后投票时，auto_close_seconds 秒后或投票人数达到观众总数的 auto_close_ratio 时
+    （以先到者为准）自动进入下一阶段；未传入时使用 AUTO_CLOSE_VOTING_SECONDS / AUTO_CLOSE_VOTE_RATIO，0 表示关闭该条件。
+    """
     try:
         # 尝试将字符串转换为枚举，确保有效性
         stage_enum = SystemStage(stage)
@@ -566,32 +612,39 @@ async def set_debate_stage(
         raise HTTPException(status_code=400, detail=f"无效的阶段: {stage}")
 
     # 使用服务层函数统一处理状态更新
-    success = await update_debate_stage(db, class_id, stage_enum, contest_id)
-    
-    if not success:
-        raise HTTPException(status_code=500, detail="更新状态失败")
-    
-    return {"message": "Stage updated"}
+    transition = await transition_stage(
+        db,
+        class_id,
+        stage_enum,
+        contest_id=contest_id if contest_id else UNCHANGED,
+        expected_update_time=expected_update_time
+    )
+
+    plan = await arm_phase_close(transition.state, auto_close_seconds, auto_close_ratio)
+
+    return {"message": "Stage updated", "auto_close": plan.to_dict() if plan else None}
 
 
 @router.get("/debate/progress")
 async def get_debate_progress(
+    request: Request,
+    response: Response,
     class_id: int = Query(...),
+    wait_for_change_since: int | None = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取投票和评分进度"""
-    # 获取系统设置以确定当前比赛
-    settings_result = await db.execute(
-        select(SystemSettings).where(SystemSettings.class_id == class_id)
-    )
-    settings = settings_result.scalar_one_or_none()
+    """
+    获取投票和评分进度
+
+    ETag 由班级状态、投票、名单和评分计数的版本组成。传入 wait_for_change_since 时，
+    等待到状态比该时间更新、或进度与 If-None-Match（未携带时为请求到达时的进度）不同，或超时。
+    """
+    # 获取系统设置以确定当前比赛（读取缓存）
+    settings = await class_state_cache.get(db, class_id)
     
     contest = None
     if settings and settings.contest_id:
-        contest_result = await db.execute(
-            select(Contest).where(Contest.id == settings.contest_id)
-        )
-        contest = contest_result.scalar_one_or_none()
+        contest = await class_state_cache.get_contest(db, settings.contest_id)
         
     if not contest:
         result = await db.execute(
@@ -604,93 +657,117 @@ async def get_debate_progress(
     
     if not contest:
         return {}
-        
-    contest_id = contest.id
-    
-    # 使用 SystemSettings 中的投票开启标志
-    pre_voting_enabled = False
-    post_voting_enabled = False
-    judge_scoring_enabled = False
-    
-    if settings:
-        pre_voting_enabled = settings.pre_voting_enabled or False
-        post_voting_enabled = settings.post_voting_enabled or False
-        judge_scoring_enabled = settings.judge_scoring_enabled or False
-    
-    # 计算观众总数（排除辩手和评委）
-    audience_count_res = await db.execute(
-        select(func.count(User.id))
-        .where(User.class_id == class_id)
-        .where(User.role == UserRole.audience)
-    )
-    total_audience = audience_count_res.scalar() or 0
-    
-    pre_votes_res = await db.execute(
-        select(func.count(VoteRecord.id))
-        .where(VoteRecord.contest_id == contest_id)
-        .where(VoteRecord.vote_phase == "pre_debate")
-    )
-    pre_submitted = pre_votes_res.scalar() or 0
-    
-    post_votes_res = await db.execute(
-        select(func.count(VoteRecord.id))
-        .where(VoteRecord.contest_id == contest_id)
-        .where(VoteRecord.vote_phase == "post_debate")
-    )
-    post_submitted = post_votes_res.scalar() or 0
-    
-    judge_count_res = await db.execute(
-        select(func.count(TeacherClass.teacher_id))
-        .where(TeacherClass.class_id == class_id)
-    )
-    total_judges = judge_count_res.scalar() or 0
-    
-    # 修改：计算评委评分进度（需要所有辩手都被评分）
-    # 1. 获取辩手总数
-    debaters_count_res = await db.execute(
-        select(func.count(User.id))
-        .where(User.class_id == class_id)
-        .where(User.team_side.isnot(None))
-        .where(User.debater_position.isnot(None))
-    )
-    total_debaters = debaters_count_res.scalar() or 0
-    
-    # 2. 统计每个评委的已评分数量
-    completed_judges_count = 0
-    if total_debaters > 0:
-        judge_scores_res = await db.execute(
-            select(JudgeScore.judge_id, func.count(JudgeScore.id))
-            .where(JudgeScore.contest_id == contest_id)
-            .group_by(JudgeScore.judge_id)
-        )
-        for _, count in judge_scores_res.all():
-            if count >= total_debaters:
-                completed_judges_count += 1
     
+    etag = f'W/"progress-{await debate_progress.version(db, class_id, contest.id)}"'
+    if wait_for_change_since is not None:
+        baseline = etag
+        
+        async def progress_changed() -> bool:
+            state = await class_state_cache.get(db, class_id)
+            if state is None or state.update_time > wait_for_change_since:
+                return True
+            current = f'W/"progress-{await debate_progress.version(db, class_id, contest.id)}"'
+            if request.headers.get("if-none-match"):
+                return not _etag_matches(request, current)
+            return current != baseline
+        await wait_for_change(class_id, progress_changed)
+        etag = f'W/"progress-{await debate_progress.version(db, class_id, contest.id)}"'
+    
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+        
+    # 进度读取内存计数（名单、投票、评分），不再逐项查询数据库
+    return await debate_progress.get(db, class_id, contest.id)
+
+
+@router.get("/debate/tally/reconcile")
+async def reconcile_vote_tally(
+    contest_id: int = Query(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """核对内存投票计数与数据库，不一致时以数据库为准重建"""
+    contest = await db.get(Contest, contest_id)
+    if not contest:
+        raise HTTPException(status_code=404, detail="比赛不存在")
+    return await vote_tally.reconcile(db, contest_id)
+
+
+@router.get("/debate/vote-queue/metrics")
+async def get_vote_queue_metrics():
+    """投票批量写入队列的深度与写入延迟"""
+    return vote_write_queue.metrics()
+
+
+@router.get("/debate/vote-progress/metrics")
+async def get_vote_progress_metrics():
+    """投票进度合并广播的次数与被合并的更新数"""
+    return manager.progress_metrics()
+
+
+@router.get("/ws/connections/metrics")
+async def get_ws_connection_metrics():
+    """每个 WebSocket 连接的发送队列深度、丢弃数和发送延迟"""
+    return manager.connection_metrics()
+
+
+@router.get("/ws/backplane/metrics")
+async def get_ws_backplane_metrics():
+    """广播总线的后端、leader 状态和发布/分发计数"""
+    return backplane.metrics()
+
+
+@router.get("/ws/timers/metrics")
+async def get_ws_timer_metrics():
+    """倒计时调度器的待触发事件数和触发延迟"""
     return {
-        "voting_enabled": {
-            "pre_voting": pre_voting_enabled,
-            "post_voting": post_voting_enabled,
-            "judge_scoring": judge_scoring_enabled
-        },
-        "pre_voting_progress": {
-            "total": total_audience,
-            "submitted": pre_submitted,
-            "percentage": int(pre_submitted / total_audience * 100) if total_audience > 0 else 0
-        },
-        "post_voting_progress": {
-            "total": total_audience,
-            "submitted": post_submitted,
-            "percentage": int(post_submitted / total_audience * 100) if total_audience > 0 else 0
-        },
-        "judge_scoring_progress": {
-            "total": total_judges,
-            "submitted": completed_judges_count,
-            "percentage": int(completed_judges_count / total_judges * 100) if total_judges > 0 else 0
-        }
+        **deadline_scheduler.metrics(),
+        "countdowns": {class_id: manager.get_countdown(class_id) for class_id in manager.countdown_deadlines}
     }
 
 
+@router.get("/debate/progress/metrics")
+async def get_debate_progress_metrics():
+    """进度计数：各班级名单人数与预热次数"""
+    return debate_progress.metrics()
+
+
+@router.get("/debate/stage-machine/metrics")
+async def get_stage_machine_metrics():
+    """阶段切换的成功、无变化、冲突和拒绝次数"""
+    return stage_machine.metrics()
+
+
+@router.get("/debate/auto-close/metrics")
+async def get_auto_close_metrics():
+    """投票阶段自动结束的待触发条件，以及按计时、按比例结束和被手动切换取代的次数"""
+    return phase_closer.metrics()
+
+
+@router.get("/debate/long-poll/metrics")
+async def get_long_poll_metrics():
+    """长轮询的等待数、唤醒数和超时数"""
+    return class_changes.metrics()
+
+
+@router.get("/debate/state-cache/stats")
+async def get_class_state_cache_stats():
+    """班级状态缓存的命中/未命中统计"""
+    return class_state_cache.stats()
+
+
+@router.get("/auth/principal-cache/stats")
+async def get_principal_cache_stats():
+    """登录用户缓存的命中/未命中统计"""
+    return principal_cache.stats()
+
+
+@router.get("/auth/password-hasher/metrics")
+async def get_password_hasher_metrics():
+    """密码哈希线程池的排队与执行耗时"""
+    return password_hasher.metrics()
+
+
 @router.post("/debate/reveal-results")
 async def reveal_debate_results(
     class_id: int = Query(...),
@@ -698,16 +775,12 @@ async def reveal_debate_results(
 ):
     """揭晓比赛结果"""
     try:
-        # 获取系统设置
-        result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-        settings = result.scalar_one_or_none()
+        # 获取系统设置（读取缓存）
+        settings = await class_state_cache.get(db, class_id)
 
         contest = None
         if settings and settings.contest_id:
-            contest_result = await db.execute(
-                select(Contest).where(Contest.id == settings.contest_id)
-            )
-            contest = contest_result.scalar_one_or_none()
+            contest = await class_state_cache.get_contest(db, settings.contest_id)
             
         if not contest:
             # 获取最新比赛
@@ -719,56 +792,13 @@ async def reveal_debate_results(
             )
             contest = contest_result.scalar_one_or_none()
         
-        if settings:
-            settings.current_stage = "RESULTS_REVEALED"
-            settings.update_time = int(time.time() * 1000)
-            await db.commit()
-            
-            # 广播状态更新
-            await manager.broadcast_to_class(class_id, {
-                "type": "STATE_UPDATE",
-                "data": {
-                    "current_stage": "RESULTS_REVEALED"
-                }
-            })
-            
-            # 尝试获取和广播比赛结果
-            try:
-                from app.services.calculation import get_calculation_service
-                calc_service = get_calculation_service(db)
-                contest_result_data = await calc_service.calculate_contest_result(contest.id)
-                
-                # 准备结果数据
-                results_data = {
-                    "contest_id": contest_result_data.contest_id,
-                    "winning_team": contest_result_data.winning_team,
-                    "pro_team_swing": contest_result_data.pro_team_swing,
-                    "con_team_swing": contest_result_data.con_team_swing,
-                    "total_votes_cast": contest_result_data.total_votes_cast,
-                    "debater_rankings": [
-                        {
-                            "debater_id": ranking.debater_id,
-                            "debater_name": ranking.debater_name,
-                            "team_side": ranking.team_side,
-                            "final_score": ranking.final_score,
-                            "rank": ranking.rank
-                        }
-                        for ranking in contest_result_data.debater_rankings
-                    ]
-                }
-                
-                # 广播结果揭晓数据
-                await manager.broadcast_to_class(class_id, {
-                    "type": "results_reveal",
-                    "data": {
-                        "results": results_data
-                    }
-                })
-            except Exception as e:
-                # 如果计算结果失败，记录错误但不阻止状态更新
-                print(f"计算比赛结果失败: {str(e)}")
-                import traceback
-                traceback.print_exc()
+        # 经阶段状态机切换，提交后广播状态和封存时计算好的结果快照
+        await transition_stage(
+            db,
+            class_id,
+            SystemStage.RESULTS_REVEALED,
+            contest_id=contest.id if contest and (not settings or contest.id != settings.contest_id) else UNCHANGED
+        )
             
         return {"message": "Results revealed"}
     except HTTPException:
@@ -792,6 +822,8 @@ async def update_user_debate_role(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    before = roster_roles(user.role, user.class_id, user.team_side, user.debater_position)
+    
     # 允许设置为None以移除角色
     user.team_side = team_side
     user.debater_position = debater_position
@@ -804,6 +836,11 @@ async def update_user_debate_role(
     # 但为了安全，我们只在分配时强制转为 student
         
     await db.commit()
+    await invalidate_principals(user_id=user_id)
+    after = roster_roles(user.role, user.class_id, user.team_side, user.debater_position)
+    await adjust_roster(user.class_id, **{
+        role: after.get(role, 0) - before.get(role, 0) for role in before.keys() | after.keys()
+    })
     return {"message": "Role updated"}
 
 
@@ -841,43 +878,19 @@ async def reset_debate_system(
             
         print(f"已重置 {len(students)} 名学生的辩手状态")
         
-        # 5. 广播更详细的重置消息，强制前端刷新
-        broadcast_data = {
-            "type": "debate_update", # 使用标准 update 消息
-            "data": {
-                "stage": "IDLE",
-                "contest": None, # 明确告知没有比赛
-                "class_id": class_id,
-                "voting_enabled": {
-                    "pre_voting": False,
-                    "post_voting": False,
-                    "judge_scoring": False
-                },
-                "results_revealed": False,
-                "progress": {},
-                "update_time": settings.update_time
-            }
-        }
-        
-        await manager.broadcast_to_class(class_id, broadcast_data)
-        
-        await db.commit()
+        # 5. 经阶段状态机回到 IDLE 并清除当前比赛，与辩手角色的修改一起提交，
+        #    提交后广播一次（contest 为 None，前端据此刷新）
+        await transition_stage(db, class_id, SystemStage.IDLE, contest_id=None)
         print(f"事务已提交")
-        
-        # 7. 广播系统重置消息
-        try:
-            await manager.broadcast_to_class(class_id, {
-                "type": "STATE_UPDATE",
-                "data": {
-                    "current_stage": "IDLE",
-                    "update_time": settings.update_time
-                }
-            })
-            print(f"已广播重置消息")
-        except Exception as broadcast_error:
-            print(f"广播消息失败（非致命错误）: {str(broadcast_error)}")
+        await invalidate_principals(class_id=class_id)
+        await invalidate_roster(class_id)
+        # 历史比赛不再有新选票，释放其内存计数（需要时重新预热）
+        await release_tallies(contest_ids)
         
         return {"message": "系统已重置到初始状态"}
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         print(f"重置系统失败: {str(e)}")
@@ -892,38 +905,11 @@ async def get_debate_results(
     db: AsyncSession = Depends(get_db)
 ):
     """获取辩论结果（计算但不揭晓）"""
-    from app.services.calculation import get_calculation_service
-    
-    calc_service = get_calculation_service(db)
-    contest_result = await calc_service.calculate_contest_result(contest_id)
-    
-    return {
-        "contest_id": contest_result.contest_id,
-        "winning_team": contest_result.winning_team,
-        "pro_team_swing": contest_result.pro_team_swing,
-        "con_team_swing": contest_result.con_team_swing,
-        "total_votes_cast": contest_result.total_votes_cast,
-        "debater_rankings": [
-            {
-                "debater_id": ranking.debater_id,
-                "debater_name": ranking.debater_name,
-                "team_side": ranking.team_side,
-                "final_score": ranking.final_score,
-                "logical_reasoning_avg": ranking.logical_reasoning_avg,
-                "debate_skills_avg": ranking.debate_skills_avg,
-                "rank": ranking.rank
-            }
-            for ranking in contest_result.debater_rankings
-        ],
-        "vote_analysis": [
-            {
-                "team_side": analysis.team_side,
-                "team_name": analysis.team_name,
-                "pre_debate_votes": analysis.pre_debate_votes,
-                "post_debate_votes": analysis.post_debate_votes,
-                "swing_vote": analysis.swing_vote,
-                "vote_percentage_change": analysis.vote_percentage_change
-            }
-            for analysis in contest_result.vote_analysis
-        ]
-    }
\ No newline at end of file
+    # 已封存的比赛直接返回快照，否则按当前数据实时计算
+    results = await get_sealed_results(db, contest_id)
+    if results is None:
+        try:
+            results = await compute_contest_results(db, contest_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="比赛不存在")
+    return results
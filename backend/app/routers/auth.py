@@ -8,7 +8,11 @@ from app.models.class_ import Class
 from app.models.teacher_class import TeacherClass
 from app.models.workspace import Workspace
 from app.schemas.user import UserLogin, Token, UserResponse, ClassInfo, SelectClassRequest, SelectClassResponse
-from app.services.auth import authenticate_user, create_access_token, verify_password, get_password_hash
+from app.services.auth import (
+    authenticate_user, create_access_token, verify_password_async, get_password_hash_async, DEFAULT_PASSWORD
+)
+from app.services.class_state_cache import class_state_cache, publish_class_state
+from app.services.stage_machine import stage_machine
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
@@ -100,8 +104,8 @@ async def login(data: UserLogin, db: AsyncSession = Depends(get_db)):
     
     access_token = create_access_token(data={"sub": str(user.id), "role": returned_role.value})
     
-    # 检查是否使用默认密码
-    need_change_password = verify_password("123456", user.password_hash)
+    # 检查是否使用默认密码（创建账号时已记录，无需再做一次哈希校验）
+    need_change_password = user.must_change_password
     
     # 检查学生或观众是否需要设置主题
     need_set_topic = (returned_role in [UserRole.student, UserRole.audience] and not user.topic)
@@ -186,16 +190,16 @@ async def change_password(
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 验证旧密码
-    if not verify_password(old_password, user.password_hash):
+    if not await verify_password_async(old_password, user.password_hash):
         raise HTTPException(status_code=401, detail="原密码错误")
     
     # 不允许设置为默认密码
-    if new_password == "123456":
+    if new_password == DEFAULT_PASSWORD:
         raise HTTPException(status_code=400, detail="不能使用默认密码")
     
     # 更新密码
-    from app.services.auth import get_password_hash
-    user.password_hash = get_password_hash(new_password)
+    user.password_hash = await get_password_hash_async(new_password)
+    user.must_change_password = False
     await db.commit()
     
     return {"message": "密码修改成功"}
@@ -224,7 +228,12 @@ async def set_topic(
     
     # 更新主题
     user.topic = topic.strip()
-    await db.commit()
+    state = await class_state_cache.get(db, user.class_id) if user.class_id else None
+    if state is not None and state.current_team_id == user.id:
+        # 当前团队的主题缓存在班级状态中：与主题一起递增版本，客户端的 ETag 随之失效
+        await publish_class_state(await stage_machine.update(db, user.class_id))
+    else:
+        await db.commit()
     
     return {"message": "主题设置成功", "topic": user.topic}
 
@@ -7,7 +7,6 @@ from app.database import get_db
 from app.models.user import User, UserRole
 from app.models.contest import Contest
 from app.models.judge_score import JudgeScore
-from app.models.system_settings import SystemSettings
 from app.schemas.judge_score import (
     JudgeScoreSubmission, 
     JudgeScoreResponse, 
@@ -16,6 +15,9 @@ from app.schemas.judge_score import (
     ContestResult
 )
 from app.services.auth import get_current_user
+from app.services.class_state_cache import class_state_cache
+from app.services.debate_progress import record_judge_score
+from app.services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/judge-scores", tags=["评委评分"])
 
@@ -23,7 +25,7 @@ router = APIRouter(prefix="/judge-scores", tags=["评委评分"])
 @router.get("/debaters/{contest_id}")
 async def get_debaters(
     contest_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取比赛中的所有辩手（供评委打分使用）"""
@@ -59,7 +61,7 @@ async def get_debaters(
 @router.post("/submit", response_model=JudgeScoreResponse)
 async def submit_judge_score(
     score_data: JudgeScoreSubmission,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """提交评委评分"""
@@ -68,12 +70,16 @@ async def submit_judge_score(
     if current_user.role not in [UserRole.judge, UserRole.teacher]:
         raise HTTPException(status_code=403, detail="只有评委可以评分")
     
-    # 验证比赛存在
-    result = await db.execute(select(Contest).where(Contest.id == score_data.contest_id))
-    contest = result.scalar_one_or_none()
+    # 验证比赛存在（读取缓存）
+    contest = await class_state_cache.get_contest(db, score_data.contest_id)
     if not contest:
         raise HTTPException(status_code=404, detail="比赛不存在")
     
+    # 检查系统状态是否允许评分（读取缓存，不查询数据库）
+    system_settings = await class_state_cache.get(db, contest.class_id)
+    if not system_settings or not system_settings.judge_scoring_enabled:
+        raise HTTPException(status_code=400, detail="评委评分未开启")
+    
     # 验证辩手存在
     result = await db.execute(select(User).where(User.id == score_data.debater_id))
     debater = result.scalar_one_or_none()
@@ -84,14 +90,6 @@ async def submit_judge_score(
     if debater.class_id != contest.class_id:
         raise HTTPException(status_code=400, detail="辩手不属于该比赛班级")
     
-    # 检查系统状态是否允许评分
-    result = await db.execute(
-        select(SystemSettings).where(SystemSettings.class_id == contest.class_id)
-    )
-    system_settings = result.scalar_one_or_none()
-    if not system_settings or not system_settings.judge_scoring_enabled:
-        raise HTTPException(status_code=400, detail="评委评分未开启")
-    
     # 检查是否已经评过分
     result = await db.execute(
         select(JudgeScore)
@@ -130,6 +128,7 @@ async def submit_judge_score(
     db.add(judge_score)
     await db.commit()
     await db.refresh(judge_score)
+    await record_judge_score(contest.class_id, judge_score.contest_id, judge_score.judge_id, judge_score.debater_id)
     
     return JudgeScoreResponse(
         id=judge_score.id,
@@ -150,7 +149,7 @@ async def submit_judge_score(
 @router.get("/my-scores/{contest_id}")
 async def get_my_scores(
     contest_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取当前评委的评分记录"""
@@ -195,7 +194,7 @@ async def get_my_scores(
 @router.get("/debater-rankings/{contest_id}", response_model=List[DebaterRanking])
 async def get_debater_rankings(
     contest_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取辩手排名（仅管理员可见）"""
@@ -265,7 +264,7 @@ async def get_debater_rankings(
 @router.get("/progress/{contest_id}")
 async def get_scoring_progress(
     contest_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取评分进度（管理员可见）"""
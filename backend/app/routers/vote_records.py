@@ -8,6 +8,7 @@ from app.models.contest import Contest
 from app.models.vote_record import VoteRecord
 from app.models.judge_score import JudgeScore
 from app.services.auth import get_current_user
+from app.services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/api", tags=["记录查询"])
 
@@ -15,7 +16,7 @@ router = APIRouter(prefix="/api", tags=["记录查询"])
 @router.get("/vote/records")
 async def get_vote_records(
     contest_id: int = Query(...),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取投票记录详情（管理员查看）"""
@@ -54,7 +55,7 @@ async def get_vote_records(
 @router.get("/judge/scores")
 async def get_judge_scores(
     contest_id: int = Query(...),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取评委评分记录（管理员查看）"""
@@ -0,0 +1,248 @@
+"""
+批量导入账号
+一次导入上千个座位时，逐行查重、串行哈希和逐行提交都会成为瓶颈。
+这里按集合处理：分块 IN 查询一次性查出已存在的用户名，密码在哈希线程池中并行计算，
+用户和评委-赛场关联都用多行 INSERT 写入，逐行的错误信息保持不变。
+
+名单文件（CSV/XLSX）按块流式解析，每块解析完立即写入，内存占用与文件大小无关。
+"""
+import asyncio
+import codecs
+import csv
+import zipfile
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.models.teacher_class import TeacherClass
+from app.models.user import User, UserRole
+from app.schemas.user import UserCreate
+from app.services.auth import DEFAULT_PASSWORD, get_password_hash_async
+
+# 单条 IN 查询 / 单条多行 INSERT 的最大行数（SQLite 默认最多 999 个绑定参数）
+IMPORT_CHUNK_SIZE = 500
+# 名单文件导入时最多返回的错误条数，失败总数仍完整统计
+MAX_REPORTED_ERRORS = 1000
+
+# 名单文件表头，与管理端 Excel 导入识别的表头一致
+USERNAME_HEADERS = ("用户名", "username", "账号")
+PASSWORD_HEADERS = ("密码", "password")
+
+
+def _chunks(items: List[Any], size: int = IMPORT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def find_existing_usernames(db: AsyncSession, usernames: List[str]) -> set[str]:
+    """分块查询已存在的用户名"""
+    existing: set[str] = set()
+    for chunk in _chunks(usernames):
+        result = await db.execute(select(User.username).where(User.username.in_(chunk)))
+        existing.update(result.scalars().all())
+    return existing
+
+
+async def import_accounts(
+    db: AsyncSession,
+    users: List[UserCreate],
+    role: UserRole,
+    class_id: int | None,
+    link_class: bool,
+    exists_message: Callable[[str], str],
+    default_password: str | None = None
+) -> Dict[str, Any]:
+    """
+    批量创建账号并提交
+
+    Args:
+        db: 数据库会话
+        users: 待导入的账号
+        role: 新账号的角色
+        class_id: 账号所属班级（观众）；为 None 时不写入 users.class_id
+        link_class: 是否按每行的 class_id 写入评委-赛场关联
+        exists_message: 用户名已存在时的错误信息
+        default_password: 未填写密码时使用的密码
+
+    Returns:
+        Dict[str, Any]: created_count 与逐行错误列表 errors
+    """
+    errors: List[str] = []
+
+    # 1. 查重：数据库中已存在的用户名，以及同一批次内重复的用户名
+    existing = await find_existing_usernames(db, list({item.username for item in users}))
+    pending: List[UserCreate] = []
+    for item in users:
+        if item.username in existing:
+            errors.append(exists_message(item.username))
+            continue
+        existing.add(item.username)
+        pending.append(item)
+
+    # 2. 并行计算密码哈希，不阻塞事件循环
+    passwords = [item.password or default_password for item in pending]
+    hashes = await asyncio.gather(*[get_password_hash_async(password) for password in passwords])
+
+    rows = [
+        {
+            "username": item.username,
+            "password_hash": password_hash,
+            "must_change_password": password == DEFAULT_PASSWORD,
+            "role": role,
+            "display_name": item.display_name or item.username,
+            "class_id": class_id,
+            "workspace_id": 1
+        }
+        for item, password, password_hash in zip(pending, passwords, hashes)
+    ]
+
+    # 3. 分块多行写入；某一块失败时只回滚该块，并为其中每一行记录错误
+    created_count = 0
+    for chunk_items, chunk_rows in zip(_chunks(pending), _chunks(rows)):
+        try:
+            async with db.begin_nested():
+                result = await db.execute(
+                    insert(User).returning(User.id, User.username),
+                    chunk_rows
+                )
+                user_ids = {username: user_id for user_id, username in result.all()}
+
+                if link_class:
+                    links = [
+                        {"teacher_id": user_ids[item.username], "class_id": item.class_id}
+                        for item in chunk_items
+                        if item.class_id
+                    ]
+                    if links:
+                        await db.execute(insert(TeacherClass), links)
+            created_count += len(chunk_rows)
+        except Exception as e:
+            errors.extend(f"创建 {item.username} 失败: {str(e)}" for item in chunk_items)
+
+    await db.commit()
+    return {"created_count": created_count, "errors": errors}
+
+
+def _pick(row: Dict[str, Any], headers: tuple) -> str:
+    for header in headers:
+        value = row.get(header)
+        if value is not None and str(value).strip():
+            return str(value).strip()
+    return ""
+
+
+def _iter_csv_rows(file: BinaryIO) -> Iterator[Dict[str, Any]]:
+    reader = codecs.getreader("utf-8-sig")(file)
+    yield from csv.DictReader(reader)
+
+
+def _iter_xlsx_rows(file: BinaryIO) -> Iterator[Dict[str, Any]]:
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError("服务器未安装 openpyxl，请上传 CSV 文件")
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        # 扩展名是 .xlsx 但内容不是有效的工作簿（损坏或改了扩展名）
+        raise ValueError("无法读取 xlsx 文件，请确认文件未损坏")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        keys = [str(cell).strip() if cell is not None else "" for cell in header]
+        for values in rows:
+            yield dict(zip(keys, values))
+    finally:
+        workbook.close()
+
+
+def iter_roster_rows(filename: str, file: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """按文件扩展名逐行读取名单文件"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return _iter_csv_rows(file)
+    if name.endswith(".xlsx"):
+        return _iter_xlsx_rows(file)
+    raise ValueError("仅支持 .csv 或 .xlsx 文件")
+
+
+def _next_chunk(rows: Iterator[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+async def import_roster_file(
+    db: AsyncSession,
+    filename: str,
+    file: BinaryIO,
+    class_id: int,
+    on_progress: Callable[[Dict[str, Any]], Awaitable[None]] | None = None
+) -> Dict[str, Any]:
+    """
+    从 CSV/XLSX 名单文件导入观众账号
+
+    每次只解析 IMPORT_CHUNK_SIZE 行（在线程池中解析，不阻塞事件循环），
+    解析完即交给 import_accounts 写入，然后通过 on_progress 上报进度。
+
+    Args:
+        db: 数据库会话
+        filename: 上传的文件名，用于判断格式
+        file: 文件对象
+        class_id: 观众所属班级
+        on_progress: 每块写入后调用，参数为当前进度
+
+    Returns:
+        Dict[str, Any]: rows_parsed、created_count、failed_count 与错误列表 errors
+
+    Raises:
+        ValueError: 文件格式不支持或文件无法解析；之前的块已经提交，已创建的数量以最后一次 on_progress 为准
+    """
+    rows = await run_in_threadpool(iter_roster_rows, filename, file)
+    progress = {"rows_parsed": 0, "created_count": 0, "failed_count": 0}
+    errors: List[str] = []
+
+    while True:
+        chunk = await run_in_threadpool(_next_chunk, rows, IMPORT_CHUNK_SIZE)
+        if not chunk:
+            break
+        progress["rows_parsed"] += len(chunk)
+
+        users = []
+        for row in chunk:
+            username = _pick(row, USERNAME_HEADERS)
+            if not username:
+                continue
+            users.append(UserCreate(
+                username=username,
+                password=_pick(row, PASSWORD_HEADERS) or DEFAULT_PASSWORD,
+                role=UserRole.audience,
+                display_name=username,
+                class_id=class_id
+            ))
+
+        result = await import_accounts(
+            db,
+            users,
+            role=UserRole.audience,
+            class_id=class_id,
+            link_class=False,
+            exists_message=lambda username: f"用户 {username} 已存在"
+        )
+        progress["created_count"] += result["created_count"]
+        progress["failed_count"] += len(result["errors"])
+        errors.extend(result["errors"][:MAX_REPORTED_ERRORS - len(errors)])
+
+        if on_progress:
+            await on_progress(dict(progress))
+
+    return {**progress, "errors": errors}
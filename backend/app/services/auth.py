@@ -8,10 +8,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database import get_db
-from app.models.user import User
+from app.models.teacher_class import TeacherClass
+from app.models.user import User, UserRole
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import UserPrincipal, principal_cache
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 批量创建账号时使用的默认密码，使用该密码的账号登录后需要修改密码
+DEFAULT_PASSWORD = "123456"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -23,6 +28,16 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在哈希线程池中校验密码，不阻塞事件循环"""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在哈希线程池中计算密码哈希，不阻塞事件循环"""
+    return await password_hasher.run(get_password_hash, password)
+
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -36,7 +51,7 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> U
     user = result.scalar_one_or_none()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
@@ -46,10 +61,49 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> User | None:
     return result.scalar_one_or_none()
 
 
+def decode_token(token: str) -> dict | None:
+    """解码 JWT，token 无效或缺少合法的 sub 时返回 None"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    try:
+        int(payload.get("sub"))
+    except (TypeError, ValueError):
+        return None
+    return payload
+
+
+def decode_token_subject(token: str) -> int | None:
+    """解码 JWT 并返回用户ID，token 无效时返回 None"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    return int(payload["sub"])
+
+
+async def get_principal_from_token(db: AsyncSession, token: str) -> UserPrincipal | None:
+    """根据 JWT token 获取用户快照，优先读取缓存；供 HTTP 依赖和 WebSocket 连接鉴权共用"""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    user = await get_user_by_id(db, user_id=int(payload["sub"]))
+    if user is None:
+        return None
+    
+    principal = UserPrincipal.from_user(user)
+    principal_cache.put(token, principal, token_exp=payload.get("exp"))
+    return principal
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
-) -> User:
+) -> UserPrincipal:
     """从 JWT token 中获取当前用户"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,16 +111,35 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = await get_user_by_id(db, user_id=int(user_id))
+    user = await get_principal_from_token(db, token)
     if user is None:
         raise credentials_exception
     
     return user
+
+
+async def authorize_connection_class(db: AsyncSession, user: UserPrincipal, class_id: int | None) -> int | None:
+    """
+    WebSocket 连接可以订阅的班级
+    - 管理员：使用请求的班级
+    - 有所属班级的用户（观众、学生）：固定为所属班级，忽略请求的班级
+    - 评委、教师：请求的班级需要通过 TeacherClass 关联
+
+    Raises:
+        HTTPException: 无权订阅请求的班级
+    """
+    if user.role == UserRole.admin:
+        return class_id
+    if user.class_id is not None:
+        return user.class_id
+    if class_id is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="请先选择班级")
+    if user.role in (UserRole.teacher, UserRole.judge):
+        result = await db.execute(
+            select(TeacherClass.class_id)
+            .where(TeacherClass.teacher_id == user.id)
+            .where(TeacherClass.class_id == class_id)
+        )
+        if result.scalar_one_or_none() is not None:
+            return class_id
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权访问该班级")
@@ -5,6 +5,7 @@
 from typing import List, Dict, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
 
 from app.models.vote_record import VoteRecord
 from app.models.judge_score import JudgeScore
@@ -64,102 +65,163 @@ class ContestResult:
         self.vote_analysis = vote_analysis
 
 
+class ContestTally:
+    """比赛投票汇总：一次分组查询得到的内存结果，胜负、跑票、增长率和统计均由此推导"""
+    def __init__(self, contest_id: int, pro_team_name: str, con_team_name: str,
+                 vote_counts: Dict[Tuple[str, str], int], total_voters: int):
+        self.contest_id = contest_id
+        self.pro_team_name = pro_team_name
+        self.con_team_name = con_team_name
+        # (team_side, vote_phase) -> 票数
+        self.vote_counts = vote_counts
+        # 参与投票的去重人数（跨阶段）
+        self.total_voters = total_voters
+
+    def votes(self, team_side: str, vote_phase: str) -> int:
+        return self.vote_counts.get((team_side, vote_phase), 0)
+
+    def phase_total(self, vote_phase: str) -> int:
+        return sum(count for (_, phase), count in self.vote_counts.items() if phase == vote_phase)
+
+    def team_results(self) -> Tuple[TeamVoteResult, TeamVoteResult]:
+        """正方和反方的投票结果"""
+        pro_result = TeamVoteResult("pro", self.pro_team_name,
+                                    self.votes("pro", "pre_debate"), self.votes("pro", "post_debate"))
+        con_result = TeamVoteResult("con", self.con_team_name,
+                                    self.votes("con", "pre_debate"), self.votes("con", "post_debate"))
+        return pro_result, con_result
+
+    def statistics(self) -> Dict[str, int]:
+        """各阶段投票统计"""
+        pro_result, con_result = self.team_results()
+        total_pre_votes = self.phase_total("pre_debate")
+        total_post_votes = self.phase_total("post_debate")
+        return {
+            "total_pre_votes": total_pre_votes,
+            "total_post_votes": total_post_votes,
+            "pro_pre_votes": pro_result.pre_debate_votes,
+            "pro_post_votes": pro_result.post_debate_votes,
+            "pro_swing_vote": pro_result.swing_vote,
+            "con_pre_votes": con_result.pre_debate_votes,
+            "con_post_votes": con_result.post_debate_votes,
+            "con_swing_vote": con_result.swing_vote,
+            "total_votes_cast": total_pre_votes + total_post_votes
+        }
+
+
+def pick_winner(pro_result: TeamVoteResult, con_result: TeamVoteResult) -> str:
+    """
+    根据双方投票结果确定队伍获胜者
+    规则：
+    Round 1: 比较跑票数 (Swing Vote)
+    Round 2: 跑票数相同，比较增长率 (Growth Rate)
+    Round 3: 增长率相同，比较赛后总票数 (Post Debate Votes)
+    """
+    # Round 1: 比较跑票数 (Swing Vote)
+    if pro_result.swing_vote > con_result.swing_vote:
+        return "pro"
+    elif con_result.swing_vote > pro_result.swing_vote:
+        return "con"
+    else:
+        # Round 2: 跑票数相同，比较增长率 (Growth Rate)
+        if pro_result.growth_rate > con_result.growth_rate:
+            return "pro"
+        elif con_result.growth_rate > pro_result.growth_rate:
+            return "con"
+        else:
+            # Round 3: 增长率相同，比较赛后总票数 (Post Debate Votes)
+            if pro_result.post_debate_votes > con_result.post_debate_votes:
+                return "pro"
+            elif con_result.post_debate_votes > pro_result.post_debate_votes:
+                return "con"
+            else:
+                return "tie"
+
+
 class CalculationService:
     """计算服务类 (异步版)"""
     
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def calculate_swing_votes(self, contest_id: int) -> Tuple[TeamVoteResult, TeamVoteResult]:
+    async def aggregate_votes(self, contest_id: int) -> ContestTally:
         """
-        计算跑票值
+        单次分组查询汇总比赛的全部投票数据
+        
+        比赛信息通过外连接一并取回，去重投票人数通过标量子查询计算，
+        整个汇总只产生一次数据库往返。
         
         Args:
             contest_id: 比赛ID
             
         Returns:
-            Tuple[TeamVoteResult, TeamVoteResult]: 正方和反方的投票结果
+            ContestTally: 投票汇总结果
         """
-        # 获取比赛信息
-        result = await self.db.execute(select(Contest).where(Contest.id == contest_id))
-        contest = result.scalar_one_or_none()
-        
-        if not contest:
-            raise ValueError(f"Contest with id {contest_id} not found")
-        
-        # 统计正方投票
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.team_side == "pro",
-                VoteRecord.vote_phase == "pre_debate"
-            )
+        # 子查询使用别名，避免与外层的 vote_records 自动关联
+        voter = aliased(VoteRecord)
+        total_voters = (
+            select(func.count(func.distinct(voter.voter_id)))
+            .where(voter.contest_id == contest_id)
+            .scalar_subquery()
         )
-        pro_pre_votes = result.scalar() or 0
         
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.team_side == "pro", 
-                VoteRecord.vote_phase == "post_debate"
+        stmt = (
+            select(
+                Contest.pro_team_name,
+                Contest.con_team_name,
+                VoteRecord.team_side,
+                VoteRecord.vote_phase,
+                func.count(VoteRecord.id).label('vote_count'),
+                total_voters.label('total_voters')
             )
-        )
-        pro_post_votes = result.scalar() or 0
-        
-        # 统计反方投票
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.team_side == "con",
-                VoteRecord.vote_phase == "pre_debate"
+            .select_from(Contest)
+            .outerjoin(VoteRecord, VoteRecord.contest_id == Contest.id)
+            .where(Contest.id == contest_id)
+            .group_by(
+                Contest.id, Contest.pro_team_name, Contest.con_team_name,
+                VoteRecord.team_side, VoteRecord.vote_phase
             )
         )
-        con_pre_votes = result.scalar() or 0
+        result = await self.db.execute(stmt)
+        rows = result.all()
         
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.team_side == "con",
-                VoteRecord.vote_phase == "post_debate"
-            )
-        )
-        con_post_votes = result.scalar() or 0
+        if not rows:
+            raise ValueError(f"Contest with id {contest_id} not found")
         
-        # 创建投票结果对象
-        pro_result = TeamVoteResult("pro", contest.pro_team_name, pro_pre_votes, pro_post_votes)
-        con_result = TeamVoteResult("con", contest.con_team_name, con_pre_votes, con_post_votes)
+        vote_counts: Dict[Tuple[str, str], int] = {}
+        for row in rows:
+            # 没有任何投票时外连接会返回一行空值
+            if row.team_side is None or row.vote_phase is None:
+                continue
+            vote_counts[(row.team_side, row.vote_phase)] = row.vote_count
         
-        return pro_result, con_result
+        return ContestTally(
+            contest_id=contest_id,
+            pro_team_name=rows[0].pro_team_name,
+            con_team_name=rows[0].con_team_name,
+            vote_counts=vote_counts,
+            total_voters=rows[0].total_voters or 0
+        )
+    
+    async def calculate_swing_votes(self, contest_id: int) -> Tuple[TeamVoteResult, TeamVoteResult]:
+        """
+        计算跑票值
+        
+        Args:
+            contest_id: 比赛ID
+            
+        Returns:
+            Tuple[TeamVoteResult, TeamVoteResult]: 正方和反方的投票结果
+        """
+        tally = await self.aggregate_votes(contest_id)
+        return tally.team_results()
     
     async def determine_winner(self, contest_id: int) -> str:
         """
-        确定队伍获胜者
-        规则：
-        Round 1: 比较跑票数 (Swing Vote)
-        Round 2: 跑票数相同，比较增长率 (Growth Rate)
-        Round 3: 增长率相同，比较赛后总票数 (Post Debate Votes)
+        确定队伍获胜者，规则见 pick_winner
         """
         pro_result, con_result = await self.calculate_swing_votes(contest_id)
-        
-        # Round 1: 比较跑票数 (Swing Vote)
-        if pro_result.swing_vote > con_result.swing_vote:
-            return "pro"
-        elif con_result.swing_vote > pro_result.swing_vote:
-            return "con"
-        else:
-            # Round 2: 跑票数相同，比较增长率 (Growth Rate)
-            if pro_result.growth_rate > con_result.growth_rate:
-                return "pro"
-            elif con_result.growth_rate > pro_result.growth_rate:
-                return "con"
-            else:
-                # Round 3: 增长率相同，比较赛后总票数 (Post Debate Votes)
-                if pro_result.post_debate_votes > con_result.post_debate_votes:
-                    return "pro"
-                elif con_result.post_debate_votes > pro_result.post_debate_votes:
-                    return "con"
-                else:
-                    return "tie"
+        return pick_winner(pro_result, con_result)
     
     async def get_vote_statistics(self, contest_id: int) -> Dict[str, int]:
         """
@@ -171,37 +233,8 @@ class CalculationService:
         Returns:
             Dict[str, int]: 包含各阶段投票统计的字典
         """
-        # 统计总投票数
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.vote_phase == "pre_debate"
-            )
-        )
-        total_pre_votes = result.scalar() or 0
-        
-        result = await self.db.execute(
-            select(func.count(VoteRecord.id)).where(
-                VoteRecord.contest_id == contest_id,
-                VoteRecord.vote_phase == "post_debate"
-            )
-        )
-        total_post_votes = result.scalar() or 0
-        
-        # 统计各队投票
-        pro_result, con_result = await self.calculate_swing_votes(contest_id)
-        
-        return {
-            "total_pre_votes": total_pre_votes,
-            "total_post_votes": total_post_votes,
-            "pro_pre_votes": pro_result.pre_debate_votes,
-            "pro_post_votes": pro_result.post_debate_votes,
-            "pro_swing_vote": pro_result.swing_vote,
-            "con_pre_votes": con_result.pre_debate_votes,
-            "con_post_votes": con_result.post_debate_votes,
-            "con_swing_vote": con_result.swing_vote,
-            "total_votes_cast": total_pre_votes + total_post_votes
-        }
+        tally = await self.aggregate_votes(contest_id)
+        return tally.statistics()
 
     async def calculate_debater_rankings(self, contest_id: int) -> List[DebaterRanking]:
         """
@@ -289,18 +322,15 @@ class CalculationService:
         Returns:
             ContestResult: 完整的比赛结果
         """
-        # 计算跑票结果
-        pro_result, con_result = await self.calculate_swing_votes(contest_id)
-        
-        # 确定获胜者
-        winning_team = await self.determine_winner(contest_id)
+        # 一次查询汇总全部投票，胜负、跑票和统计均在内存中推导
+        tally = await self.aggregate_votes(contest_id)
+        pro_result, con_result = tally.team_results()
+        winning_team = pick_winner(pro_result, con_result)
+        vote_stats = tally.statistics()
         
         # 计算辩手排名
         debater_rankings = await self.calculate_debater_rankings(contest_id)
         
-        # 获取投票统计
-        vote_stats = await self.get_vote_statistics(contest_id)
-        
         return ContestResult(
             contest_id=contest_id,
             winning_team=winning_team,
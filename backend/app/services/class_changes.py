@@ -0,0 +1,101 @@
+"""
+班级变化通知
+班级状态、投票计数、名单或评分计数变化时调用 notify，
+长轮询请求在对应班级的 asyncio.Condition 上等待，直到关心的数据发生变化或超时。
+每个班级维护一个变化序号，先记下序号再检查数据，检查之后发生的变化不会被漏掉。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from app.config import settings
+
+
+class ClassChangeNotifier:
+    """按班级唤醒长轮询请求"""
+
+    def __init__(self):
+        self._conditions: Dict[int, asyncio.Condition] = {}
+        # class_id -> 变化序号，notify 时同步递增
+        self._seqs: Dict[int, int] = {}
+        # 指标
+        self.notifications = 0
+        self.waiting = 0
+        self.wakeups = 0
+        self.timeouts = 0
+
+    def seq(self, class_id: int) -> int:
+        return self._seqs.get(class_id, 0)
+
+    def notify(self, class_id: int | None = None):
+        """
+        班级数据变化后调用（同步，可在任意事件处理函数中调用）；
+        class_id 为 None 时唤醒所有班级的等待者
+        """
+        class_ids = list(self._conditions) if class_id is None else [class_id]
+        self.notifications += 1
+        for cid in class_ids:
+            self._seqs[cid] = self._seqs.get(cid, 0) + 1
+            condition = self._conditions.get(cid)
+            if condition is not None:
+                asyncio.ensure_future(self._wake(condition))
+
+    @staticmethod
+    async def _wake(condition: asyncio.Condition):
+        async with condition:
+            condition.notify_all()
+
+    async def wait(self, class_id: int, since_seq: int, timeout: float) -> bool:
+        """等待班级的变化序号不再等于 since_seq；超时返回 False"""
+        condition = self._conditions.get(class_id)
+        if condition is None:
+            condition = self._conditions[class_id] = asyncio.Condition()
+        self.waiting += 1
+        try:
+            async with condition:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self.seq(class_id) != since_seq),
+                    timeout
+                )
+            self.wakeups += 1
+            return True
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "classes": len(self._conditions),
+            "waiting": self.waiting,
+            "notifications": self.notifications,
+            "wakeups": self.wakeups,
+            "timeouts": self.timeouts
+        }
+
+
+# 模块级别的通知实例
+class_changes = ClassChangeNotifier()
+
+
+async def wait_for_change(class_id: int, changed: Callable[[], Awaitable[bool]], timeout: float | None = None) -> bool:
+    """
+    长轮询：等待 changed() 返回 True，或超时
+
+    Args:
+        class_id: 班级ID
+        changed: 检查关心的数据是否已经变化
+        timeout: 最长等待秒数，默认 LONG_POLL_TIMEOUT_SECONDS
+
+    Returns:
+        bool: 是否等到了变化
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (settings.LONG_POLL_TIMEOUT_SECONDS if timeout is None else timeout)
+    while True:
+        seq = class_changes.seq(class_id)
+        if await changed():
+            return True
+        remaining = deadline - loop.time()
+        if remaining <= 0 or not await class_changes.wait(class_id, seq, remaining):
+            return False
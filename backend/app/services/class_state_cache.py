@@ -0,0 +1,248 @@
+"""
+班级状态缓存
+按 class_id 缓存 SystemSettings 的只读快照，以 update_time 作为版本号。
+首次读取时从数据库加载，之后投票/评分的开关校验、进度和广播都直接读取快照；
+管理员修改状态并提交后写入新快照，并经广播总线把新快照同步到所有 worker。
+比赛（Contest）创建后不再修改，按 contest_id 一并缓存。
+当前团队的名称和主题随快照一起缓存；修改当前团队的主题时同样递增 update_time。
+"""
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.contest import Contest
+from app.models.system_settings import SystemSettings, SystemStage
+from app.models.user import User
+from app.services.class_changes import class_changes
+from app.websocket.backplane import backplane
+
+
+@dataclass(frozen=True)
+class ClassState:
+    """班级系统状态的只读快照"""
+    class_id: int
+    current_stage: SystemStage
+    current_team_id: int | None
+    contest_id: int | None
+    pre_voting_enabled: bool
+    post_voting_enabled: bool
+    judge_scoring_enabled: bool
+    results_revealed: bool
+    snatch_slots_remaining: int
+    snatch_start_time: int | None
+    update_time: int
+    # 当前团队的名称和主题（由 load_current_team 填充）
+    current_team_name: str | None = None
+    current_team_topic: str | None = None
+
+    @classmethod
+    def from_settings(cls, settings: SystemSettings) -> "ClassState":
+        return cls(
+            class_id=settings.class_id,
+            current_stage=SystemStage(settings.current_stage),
+            current_team_id=settings.current_team_id,
+            contest_id=settings.contest_id,
+            pre_voting_enabled=bool(settings.pre_voting_enabled),
+            post_voting_enabled=bool(settings.post_voting_enabled),
+            judge_scoring_enabled=bool(settings.judge_scoring_enabled),
+            results_revealed=bool(settings.results_revealed),
+            snatch_slots_remaining=settings.snatch_slots_remaining,
+            snatch_start_time=settings.snatch_start_time,
+            update_time=settings.update_time or 0
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ClassState":
+        return cls(**{**data, "current_stage": SystemStage(data["current_stage"])})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "current_stage": self.current_stage.value}
+
+    @property
+    def voting_enabled(self) -> Dict[str, bool]:
+        return {
+            "pre_voting": self.pre_voting_enabled,
+            "post_voting": self.post_voting_enabled,
+            "judge_scoring": self.judge_scoring_enabled
+        }
+
+
+@dataclass(frozen=True)
+class ContestInfo:
+    """比赛配置的只读快照"""
+    id: int
+    class_id: int
+    topic: str
+    pro_team_name: str
+    con_team_name: str
+    pro_topic: str | None = None
+    con_topic: str | None = None
+    created_at: datetime | None = None
+
+    @classmethod
+    def from_contest(cls, contest: Contest) -> "ContestInfo":
+        return cls(
+            id=contest.id,
+            class_id=contest.class_id,
+            topic=contest.topic,
+            pro_team_name=contest.pro_team_name,
+            con_team_name=contest.con_team_name,
+            pro_topic=contest.pro_topic,
+            con_topic=contest.con_topic,
+            created_at=contest.created_at
+        )
+
+
+class ClassStateCache:
+    """进程级班级状态缓存：class_id -> ClassState，contest_id -> ContestInfo"""
+
+    def __init__(self):
+        self._states: Dict[int, ClassState] = {}
+        self._contests: Dict[int, ContestInfo] = {}
+        # 每次失效递增，加载期间发生失效时丢弃加载结果，避免旧数据覆盖
+        self._generations: Dict[int, int] = {}
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.stale_writes = 0
+        self.invalidations = 0
+
+    async def get(self, db: AsyncSession, class_id: int) -> ClassState | None:
+        """读取班级状态，未缓存时从数据库加载；班级没有系统设置时返回 None"""
+        state = self._states.get(class_id)
+        if state is not None:
+            self.hits += 1
+            return state
+        self.misses += 1
+        generation = self._generations.get(class_id, 0)
+        result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
+        settings = result.scalar_one_or_none()
+        if settings is None:
+            return None
+        state = await load_current_team(db, ClassState.from_settings(settings))
+        if self._generations.get(class_id, 0) == generation:
+            return self.put_state(state)
+        return state
+
+    def put(self, settings: SystemSettings) -> ClassState:
+        """状态提交后写入新快照"""
+        return self.put_state(ClassState.from_settings(settings))
+
+    def put_state(self, state: ClassState) -> ClassState:
+        """写入快照；比已缓存版本更旧的快照被忽略，返回当前生效的快照"""
+        cached = self._states.get(state.class_id)
+        if cached is not None and cached.update_time > state.update_time:
+            self.stale_writes += 1
+            return cached
+        self._states[state.class_id] = state
+        self.writes += 1
+        if cached is None or cached != state:
+            class_changes.notify(state.class_id)
+        return state
+
+    def invalidate(self, class_id: int):
+        """丢弃班级状态及该班级的比赛缓存"""
+        self._states.pop(class_id, None)
+        self._generations[class_id] = self._generations.get(class_id, 0) + 1
+        for contest_id, contest in list(self._contests.items()):
+            if contest.class_id == class_id:
+                del self._contests[contest_id]
+        self.invalidations += 1
+        class_changes.notify(class_id)
+
+    async def get_contest(self, db: AsyncSession, contest_id: int) -> ContestInfo | None:
+        """读取比赛配置，未缓存时从数据库加载；比赛不存在时返回 None"""
+        contest = self._contests.get(contest_id)
+        if contest is not None:
+            self.hits += 1
+            return contest
+        self.misses += 1
+        result = await db.execute(select(Contest).where(Contest.id == contest_id))
+        row = result.scalar_one_or_none()
+        if row is None:
+            return None
+        return self.put_contest(row)
+
+    def put_contest(self, contest: Contest) -> ContestInfo:
+        info = ContestInfo.from_contest(contest)
+        self._contests[info.id] = info
+        return info
+
+    def clear(self):
+        for class_id in list(self._states):
+            self._generations[class_id] = self._generations.get(class_id, 0) + 1
+        self._states.clear()
+        self._contests.clear()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "classes": len(self._states),
+            "contests": len(self._contests),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "stale_writes": self.stale_writes,
+            "invalidations": self.invalidations
+        }
+
+
+# 模块级别的缓存实例
+class_state_cache = ClassStateCache()
+
+
+async def load_current_team(db: AsyncSession, state: ClassState) -> ClassState:
+    """读取当前团队的名称和主题，返回填充后的快照"""
+    name = topic = None
+    if state.current_team_id:
+        result = await db.execute(
+            select(User.display_name, User.topic).where(User.id == state.current_team_id)
+        )
+        row = result.one_or_none()
+        if row is not None:
+            name, topic = row
+    return replace(state, current_team_name=name, current_team_topic=topic)
+
+
+def _on_class_state_changed(data: Dict[str, Any]):
+    class_state_cache.put_state(ClassState.from_dict(data["state"]))
+
+
+def _on_class_state_invalidated(data: Dict[str, Any]):
+    class_state_cache.invalidate(data["class_id"])
+
+
+def _on_resync():
+    class_state_cache.clear()
+    class_changes.notify()
+
+
+backplane.subscribe("state.class_changed", _on_class_state_changed)
+backplane.subscribe("state.class_invalidated", _on_class_state_invalidated)
+backplane.on_resync(_on_resync)
+
+
+async def publish_class_state(settings: SystemSettings | ClassState) -> ClassState:
+    """
+    状态提交后调用：写入本进程缓存，并把新快照同步到所有 worker
+
+    Returns:
+        ClassState: 新快照
+    """
+    if isinstance(settings, ClassState):
+        state = class_state_cache.put_state(settings)
+    else:
+        state = class_state_cache.put(settings)
+    await backplane.publish("state.class_changed", {"state": state.to_dict()})
+    return state
+
+
+async def invalidate_class_state(class_id: int):
+    """通知所有 worker 丢弃班级状态（如删除班级后）"""
+    await backplane.publish("state.class_invalidated", {"class_id": class_id})
@@ -0,0 +1,116 @@
+"""
+截止时间调度器
+进程内所有定时事件（各班级倒计时的结束、低频校准等）共用一个最小堆，
+事件循环上只挂一个定时器，指向最早到期的事件，到期时准时触发，
+不再为每个班级各开一个每秒唤醒的协程。
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class DeadlineScheduler:
+    """按事件循环单调时钟（loop.time()）调度的最小堆定时器"""
+
+    def __init__(self):
+        # (到期时间, 序号, key)；被取消或被替换的条目在弹出时跳过
+        self._heap: List[Tuple[float, int, str]] = []
+        # key -> (到期时间, 序号, 回调)
+        self._entries: Dict[str, Tuple[float, int, Callable[[], Any]]] = {}
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_when: float | None = None
+        # 指标
+        self.fired = 0
+        self.failures = 0
+        self.max_lateness_ms = 0.0
+
+    def time(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def schedule(self, key: str, when: float, callback: Callable[[], Any]):
+        """
+        在 when（loop.time() 时间）执行 callback；同一 key 已有事件时替换
+
+        callback 可以是普通函数或返回协程的函数，协程作为独立任务运行，不阻塞其他事件。
+        """
+        seq = next(self._counter)
+        self._entries[key] = (when, seq, callback)
+        heapq.heappush(self._heap, (when, seq, key))
+        self._arm()
+
+    def schedule_in(self, key: str, delay: float, callback: Callable[[], Any]):
+        """在 delay 秒后执行 callback"""
+        self.schedule(key, self.time() + delay, callback)
+
+    def cancel(self, key: str) -> bool:
+        """取消事件，返回事件是否存在"""
+        return self._entries.pop(key, None) is not None
+
+    def has(self, key: str) -> bool:
+        return key in self._entries
+
+    def _discard_stale(self):
+        while self._heap:
+            when, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def _arm(self):
+        """让事件循环上的唯一定时器指向最早到期的事件"""
+        self._discard_stale()
+        if not self._heap:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+                self._timer_when = None
+            return
+        when = self._heap[0][0]
+        if self._timer is not None and self._timer_when == when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_at(when, self._fire)
+        self._timer_when = when
+
+    def _fire(self):
+        self._timer = None
+        self._timer_when = None
+        now = self.time()
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            when, seq, key = heapq.heappop(self._heap)
+            _, _, callback = self._entries.pop(key)
+            self.fired += 1
+            self.max_lateness_ms = max(self.max_lateness_ms, (now - when) * 1000)
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result).add_done_callback(self._on_task_done)
+            except Exception as e:
+                self.failures += 1
+                print(f"定时事件执行失败: {key}: {e}")
+        self._arm()
+
+    def _on_task_done(self, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+            print(f"定时事件执行失败: {task.exception()}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "scheduled": len(self._entries),
+            "fired": self.fired,
+            "failures": self.failures,
+            "max_lateness_ms": round(self.max_lateness_ms, 2)
+        }
+
+
+# 模块级别的调度器实例
+deadline_scheduler = DeadlineScheduler()
@@ -0,0 +1,314 @@
+"""
+辩论进度
+进度由三类进程内计数组成，读取时不查询数据库：
+- 名单计数：每个班级的观众数、评委数（评委-赛场关联）、辩手数，首次访问时预热，
+  之后由创建/导入/删除用户、分配辩手、增删评委的接口按增量更新
+- 投票计数：直接读取 vote_tally
+- 评分计数：每场比赛每位评委已评的辩手，首次访问时预热，之后由评分成功的路径更新；
+  为全部辩手评完分的评委数随评分增量维护
+多 worker 部署时，名单和评分的变化都经广播总线同步到所有进程。
+"""
+import asyncio
+from typing import Any, Dict, Set
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.judge_score import JudgeScore
+from app.models.teacher_class import TeacherClass
+from app.models.user import User, UserRole
+from app.services.class_changes import class_changes
+from app.services.class_state_cache import class_state_cache
+from app.services.vote_tally import vote_tally
+from app.websocket.backplane import backplane
+
+
+# 名单计数的角色
+ROSTER_AUDIENCE = "audience"
+ROSTER_JUDGE = "judge"
+ROSTER_DEBATER = "debater"
+ROSTER_ROLES = (ROSTER_AUDIENCE, ROSTER_JUDGE, ROSTER_DEBATER)
+
+
+def roster_roles(role: UserRole | str | None, class_id: int | None, team_side: str | None, debater_position: str | None) -> Dict[str, int]:
+    """一个用户计入所在班级名单的哪些角色，用于计算增删改前后的差值"""
+    counts = {}
+    if class_id is None:
+        return counts
+    if role == UserRole.audience:
+        counts[ROSTER_AUDIENCE] = 1
+    if team_side and debater_position:
+        counts[ROSTER_DEBATER] = 1
+    return counts
+
+
+def percentage(submitted: int, total: int) -> int:
+    return int(submitted / total * 100) if total > 0 else 0
+
+
+class ContestJudgeProgress:
+    """单场比赛的评委评分计数"""
+
+    def __init__(self, contest_id: int):
+        self.contest_id = contest_id
+        # judge_id -> 已评分的辩手ID集合，重复记录不会重复计数
+        self.scored: Dict[int, Set[int]] = {}
+        # 评完全部辩手的评委数，以及计算它时使用的辩手总数
+        self.completed = 0
+        self.threshold: int | None = None
+        self.warmed = False
+        # 每次计数变化递增，供条件请求判断是否有变化
+        self.version = 0
+
+    def add(self, judge_id: int, debater_id: int) -> bool:
+        debaters = self.scored.setdefault(judge_id, set())
+        if debater_id in debaters:
+            return False
+        debaters.add(debater_id)
+        self.version += 1
+        if self.threshold is not None and len(debaters) == self.threshold:
+            self.completed += 1
+        return True
+
+    def completed_judges(self, total_debaters: int) -> int:
+        """为全部辩手评完分的评委数；辩手总数变化时重新统计一次"""
+        if total_debaters <= 0:
+            return 0
+        if self.threshold != total_debaters:
+            self.threshold = total_debaters
+            self.completed = sum(1 for debaters in self.scored.values() if len(debaters) >= total_debaters)
+        return self.completed
+
+
+class DebateProgressService:
+    """进程级进度计数"""
+
+    def __init__(self):
+        # class_id -> 各角色人数
+        self._rosters: Dict[int, Dict[str, int]] = {}
+        # 名单变化时递增，预热期间发生变化时丢弃预热结果，下次读取重新预热
+        self._roster_generations: Dict[int, int] = {}
+        # 丢弃所有班级名单时递增，与班级的代数一起校验，使尚未缓存的班级的预热也作废
+        self._roster_epoch = 0
+        self._judges: Dict[int, ContestJudgeProgress] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # 指标
+        self.roster_loads = 0
+        self.judge_loads = 0
+        self.reads = 0
+
+    async def roster(self, db: AsyncSession, class_id: int) -> Dict[str, int]:
+        """班级名单计数，首次访问时从数据库预热"""
+        counts = self._rosters.get(class_id)
+        if counts is not None:
+            return counts
+
+        generation = self._roster_generation(class_id)
+        result = await db.execute(
+            select(
+                func.count(User.id).filter(User.role == UserRole.audience),
+                func.count(User.id).filter(User.team_side.isnot(None), User.debater_position.isnot(None))
+            ).where(User.class_id == class_id)
+        )
+        audience, debaters = result.one()
+        judge_result = await db.execute(
+            select(func.count(TeacherClass.teacher_id)).where(TeacherClass.class_id == class_id)
+        )
+        counts = {
+            ROSTER_AUDIENCE: audience or 0,
+            ROSTER_JUDGE: judge_result.scalar() or 0,
+            ROSTER_DEBATER: debaters or 0
+        }
+        self.roster_loads += 1
+        if self._roster_generation(class_id) == generation:
+            self._rosters[class_id] = counts
+        return counts
+
+    def _roster_generation(self, class_id: int) -> tuple[int, int]:
+        return self._roster_epoch, self._roster_generations.get(class_id, 0)
+
+    def peek_roster(self, class_id: int) -> Dict[str, int] | None:
+        """已预热的名单计数，未预热时返回 None（不访问数据库）"""
+        return self._rosters.get(class_id)
+
+    def apply_roster_delta(self, class_id: int, deltas: Dict[str, int]):
+        """按增量更新名单计数；本进程尚未预热该班级时只让进行中的预热作废"""
+        self._roster_generations[class_id] = self._roster_generations.get(class_id, 0) + 1
+        class_changes.notify(class_id)
+        counts = self._rosters.get(class_id)
+        if counts is None:
+            return
+        for role, delta in deltas.items():
+            counts[role] = max(0, counts.get(role, 0) + delta)
+
+    def invalidate_roster(self, class_id: int | None = None):
+        """丢弃名单计数（批量修改后），class_id 为 None 时丢弃所有班级"""
+        if class_id is None:
+            self._rosters.clear()
+            self._roster_epoch += 1
+        else:
+            self._rosters.pop(class_id, None)
+            self._roster_generations[class_id] = self._roster_generations.get(class_id, 0) + 1
+        class_changes.notify(class_id)
+
+    async def judges(self, db: AsyncSession, contest_id: int) -> ContestJudgeProgress:
+        """比赛评分计数，首次访问时从数据库预热"""
+        progress = self._judges.get(contest_id)
+        if progress is None:
+            progress = self._judges[contest_id] = ContestJudgeProgress(contest_id)
+        if progress.warmed:
+            return progress
+
+        lock = self._locks.setdefault(contest_id, asyncio.Lock())
+        async with lock:
+            if not progress.warmed:
+                result = await db.execute(
+                    select(JudgeScore.judge_id, JudgeScore.debater_id)
+                    .where(JudgeScore.contest_id == contest_id)
+                )
+                # 预热期间到达的评分已经通过 record_score 记入，add 是幂等的
+                for judge_id, debater_id in result.all():
+                    progress.add(judge_id, debater_id)
+                progress.warmed = True
+                self.judge_loads += 1
+        return progress
+
+    def record_score(self, contest_id: int, judge_id: int, debater_id: int) -> bool:
+        progress = self._judges.get(contest_id)
+        if progress is None:
+            progress = self._judges[contest_id] = ContestJudgeProgress(contest_id)
+        return progress.add(judge_id, debater_id)
+
+    def invalidate_judges(self, contest_id: int):
+        self._judges.pop(contest_id, None)
+
+    def clear(self):
+        """丢弃所有名单和评分计数（总线重连后）"""
+        self.invalidate_roster(None)
+        self._judges.clear()
+
+    async def version(self, db: AsyncSession, class_id: int, contest_id: int) -> str:
+        """
+        进度数据的版本：班级状态、投票、名单或评分任一变化时改变，用作 ETag
+
+        计数已预热时不访问数据库。
+        """
+        state = await class_state_cache.get(db, class_id)
+        tally = await vote_tally.get(db, contest_id)
+        judges = await self.judges(db, contest_id)
+        return "-".join(str(part) for part in (
+            class_id,
+            state.update_time if state else 0,
+            contest_id,
+            tally.version,
+            self._roster_epoch,
+            self._roster_generations.get(class_id, 0),
+            judges.version
+        ))
+
+    async def get(self, db: AsyncSession, class_id: int, contest_id: int | None = None) -> Dict[str, Any]:
+        """
+        班级当前比赛的投票和评分进度
+
+        Args:
+            db: 数据库会话（仅在计数未预热时使用）
+            class_id: 班级ID
+            contest_id: 比赛ID，默认取班级当前比赛
+
+        Returns:
+            Dict[str, Any]: 进度信息；班级没有比赛时返回空字典
+        """
+        state = await class_state_cache.get(db, class_id)
+        contest_id = contest_id or (state.contest_id if state else None)
+        if not contest_id:
+            return {}
+
+        roster = await self.roster(db, class_id)
+        tally = await vote_tally.get(db, contest_id)
+        judges = await self.judges(db, contest_id)
+        self.reads += 1
+
+        total_audience = roster[ROSTER_AUDIENCE]
+        total_judges = roster[ROSTER_JUDGE]
+        pre_votes = tally.phase_total("pre_debate")
+        post_votes = tally.phase_total("post_debate")
+        judges_completed = judges.completed_judges(roster[ROSTER_DEBATER])
+
+        return {
+            "contest_id": contest_id,
+            "current_stage": state.current_stage.value if state else None,
+            "pre_voting_progress": {
+                "submitted": pre_votes,
+                "total": total_audience,
+                "percentage": percentage(pre_votes, total_audience)
+            },
+            "post_voting_progress": {
+                "submitted": post_votes,
+                "total": total_audience,
+                "percentage": percentage(post_votes, total_audience)
+            },
+            "judge_scoring_progress": {
+                "submitted": judges_completed,
+                "total": total_judges,
+                "percentage": percentage(judges_completed, total_judges)
+            },
+            "voting_enabled": state.voting_enabled if state else {
+                "pre_voting": False,
+                "post_voting": False,
+                "judge_scoring": False
+            },
+            "results_revealed": state.results_revealed if state else False
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "rosters": {class_id: dict(counts) for class_id, counts in self._rosters.items()},
+            "contests": len(self._judges),
+            "roster_loads": self.roster_loads,
+            "judge_loads": self.judge_loads,
+            "reads": self.reads
+        }
+
+
+# 模块级别的进度实例
+debate_progress = DebateProgressService()
+
+
+def _on_roster_changed(data: Dict[str, Any]):
+    if data.get("deltas") is None:
+        debate_progress.invalidate_roster(data.get("class_id"))
+    else:
+        debate_progress.apply_roster_delta(data["class_id"], data["deltas"])
+
+
+def _on_score_recorded(data: Dict[str, Any]):
+    if debate_progress.record_score(data["contest_id"], data["judge_id"], data["debater_id"]):
+        class_changes.notify(data["class_id"])
+
+
+backplane.subscribe("roster.changed", _on_roster_changed)
+backplane.subscribe("judge_score.recorded", _on_score_recorded)
+backplane.on_resync(debate_progress.clear)
+
+
+async def adjust_roster(class_id: int | None, **deltas: int):
+    """通知所有 worker 按增量更新班级名单计数，如 adjust_roster(1, audience=3)"""
+    deltas = {role: delta for role, delta in deltas.items() if delta}
+    if class_id is None or not deltas:
+        return
+    await backplane.publish("roster.changed", {"class_id": class_id, "deltas": deltas})
+
+
+async def invalidate_roster(class_id: int | None = None):
+    """通知所有 worker 丢弃名单计数，下次读取时重新预热；class_id 为 None 时作用于所有班级"""
+    await backplane.publish("roster.changed", {"class_id": class_id, "deltas": None})
+
+
+async def record_judge_score(class_id: int, contest_id: int, judge_id: int, debater_id: int):
+    """评分写入成功后调用，通知所有 worker 更新评分计数"""
+    await backplane.publish("judge_score.recorded", {
+        "class_id": class_id,
+        "contest_id": contest_id,
+        "judge_id": judge_id,
+        "debater_id": debater_id
+    })
@@ -0,0 +1,91 @@
+"""
+密码哈希线程池
+bcrypt 计算一次需要上百毫秒，直接在异步接口中调用会阻塞整个事件循环，
+导致 WebSocket 广播和倒计时停顿。所有哈希和校验都放入有并发上限的线程池执行，
+bcrypt 计算期间会释放 GIL，线程池足以让事件循环保持响应。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import settings
+
+
+class PasswordHasher:
+    """有并发上限的密码哈希执行器，记录排队和执行耗时"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor: ThreadPoolExecutor | None = None
+        # 指标
+        self.submitted = 0
+        self.completed = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.total_queue_ms = 0.0
+        self.max_queue_ms = 0.0
+        self.total_run_ms = 0.0
+        self.max_run_ms = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """在线程池中执行 func(*args)，等待期间不阻塞事件循环"""
+        enqueued_at = time.perf_counter()
+
+        def job():
+            started_at = time.perf_counter()
+            result = func(*args)
+            return result, started_at, time.perf_counter()
+
+        self.submitted += 1
+        self.in_flight += 1
+        try:
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), job
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        queue_ms = (started_at - enqueued_at) * 1000
+        run_ms = (finished_at - started_at) * 1000
+        self.completed += 1
+        self.total_queue_ms += queue_ms
+        self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+        self.total_run_ms += run_ms
+        self.max_run_ms = max(self.max_run_ms, run_ms)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """并发、排队和执行耗时指标"""
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.max_workers, 0),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failures": self.failures,
+            "avg_queue_ms": round(self.total_queue_ms / self.completed, 2) if self.completed else 0.0,
+            "max_queue_ms": round(self.max_queue_ms, 2),
+            "avg_run_ms": round(self.total_run_ms / self.completed, 2) if self.completed else 0.0,
+            "max_run_ms": round(self.max_run_ms, 2)
+        }
+
+
+# 模块级别的哈希执行器实例
+password_hasher = PasswordHasher(max_workers=settings.PASSWORD_HASH_WORKERS)
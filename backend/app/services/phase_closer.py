@@ -0,0 +1,233 @@
+"""
+投票阶段自动结束
+管理员开启赛前/赛后投票时可以同时设置自动结束条件："N 秒后，或名单中一定比例的观众投完票，以先到者为准"。
+- 计时：复用 manager.start_countdown，倒计时结束回调只在 leader 上执行
+- 比例：每张选票更新内存计数后（_on_vote_recorded）由 leader 读取计数和名单人数判断，不查询投票表
+两者都走正常的阶段转换（transition_stage），并以开启投票时的 update_time 作为期望版本：
+管理员在此期间手动切换过阶段时转换返回 409，自动结束被放弃，不会覆盖管理员的操作。
+"""
+import math
+from dataclasses import dataclass, asdict
+from typing import Any, Dict
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session_maker
+from app.models.system_settings import SystemStage
+from app.services.class_state_cache import ClassState
+from app.services.deadline_scheduler import deadline_scheduler
+from app.services.debate_progress import debate_progress, ROSTER_AUDIENCE
+from app.services.system_state import transition_stage
+from app.services.vote_tally import ContestVoteTally, vote_tally
+from app.websocket import manager
+from app.websocket.backplane import backplane
+
+
+# 倒计时结束回调名称
+PHASE_CLOSE_HANDLER = "phase_close"
+
+# 可以自动结束的阶段 -> (结束后进入的阶段, 对应的投票阶段)
+AUTO_CLOSE_RULES = {
+    SystemStage.PRE_VOTING: (SystemStage.DEBATE_IN_PROGRESS, "pre_debate"),
+    SystemStage.POST_VOTING: (SystemStage.JUDGE_SCORING, "post_debate")
+}
+
+# 结束原因
+REASON_TIMEOUT = "timeout"
+REASON_RATIO = "ratio"
+
+
+@dataclass(frozen=True)
+class PhaseClosePlan:
+    """一次投票阶段的自动结束条件"""
+    class_id: int
+    stage: SystemStage
+    close_to: SystemStage
+    vote_phase: str
+    contest_id: int | None
+    # 开启投票后的状态版本，结束时作为期望版本
+    update_time: int
+    # 投票人数达到名单观众数的该比例时结束，0 表示不按比例结束
+    ratio: float
+    # 倒计时截止时间（毫秒时间戳），None 表示不计时
+    deadline: int | None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PhaseClosePlan":
+        return cls(**{
+            **data,
+            "stage": SystemStage(data["stage"]),
+            "close_to": SystemStage(data["close_to"])
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "stage": self.stage.value, "close_to": self.close_to.value}
+
+
+class PhaseCloser:
+    """按班级保存自动结束条件；所有 worker 都保存，只有 leader 判断和执行"""
+
+    def __init__(self):
+        self._plans: Dict[int, PhaseClosePlan] = {}
+        # 指标
+        self.armed = 0
+        self.closed_by_timeout = 0
+        self.closed_by_ratio = 0
+        self.superseded = 0
+        self.skipped = 0
+
+    def get(self, class_id: int) -> PhaseClosePlan | None:
+        return self._plans.get(class_id)
+
+    def put(self, plan: PhaseClosePlan):
+        self._plans[plan.class_id] = plan
+        self.armed += 1
+
+    def discard(self, class_id: int) -> PhaseClosePlan | None:
+        return self._plans.pop(class_id, None)
+
+    @staticmethod
+    def _reached(plan: PhaseClosePlan, tally: ContestVoteTally, roster: Dict[str, int]) -> bool:
+        total = roster[ROSTER_AUDIENCE]
+        if total <= 0:
+            return False
+        return tally.phase_total(plan.vote_phase) >= math.ceil(total * plan.ratio)
+
+    async def ratio_reached(self, db: AsyncSession, plan: PhaseClosePlan) -> bool:
+        """当前投票阶段的投票人数是否达到名单观众数的 plan.ratio（读取内存计数，未预热时预热）"""
+        if plan.ratio <= 0 or not plan.contest_id:
+            return False
+        roster = await debate_progress.roster(db, plan.class_id)
+        tally = await vote_tally.get(db, plan.contest_id)
+        return self._reached(plan, tally, roster)
+
+    def trigger(self, class_id: int, reason: str):
+        """
+        满足结束条件：立即取出条件，之后到达的选票和倒计时不会重复触发；
+        转换交给调度器在独立任务中执行，不阻塞选票事件的处理
+        """
+        plan = self._plans.pop(class_id, None)
+        if plan is None:
+            return
+        deadline_scheduler.schedule_in(
+            f"phase_close:{class_id}",
+            0,
+            lambda: self._close(plan, reason)
+        )
+
+    async def _close(self, plan: PhaseClosePlan, reason: str):
+        async with async_session_maker() as db:
+            try:
+                await transition_stage(db, plan.class_id, plan.close_to, expected_update_time=plan.update_time)
+            except HTTPException as e:
+                # 状态已被管理员修改，放弃自动结束
+                self.skipped += 1
+                print(f"自动结束投票已放弃: class_id={plan.class_id} stage={plan.stage.value} {e.detail}")
+                return
+
+        if reason == REASON_RATIO:
+            self.closed_by_ratio += 1
+            if plan.deadline is not None and manager.countdown_deadlines.get(plan.class_id) == plan.deadline:
+                await manager.stop_countdown(plan.class_id)
+        else:
+            self.closed_by_timeout += 1
+        print(f"投票阶段已自动结束: class_id={plan.class_id} {plan.stage.value} -> {plan.close_to.value} ({reason})")
+
+    def watching(self, class_id: int, contest_id: int, vote_phase: str) -> PhaseClosePlan | None:
+        """本进程需要按比例检查这张选票时返回对应的条件（只有 leader 检查）"""
+        plan = self._plans.get(class_id)
+        if plan is None or plan.ratio <= 0 or not backplane.is_leader:
+            return None
+        if plan.contest_id != contest_id or plan.vote_phase != vote_phase:
+            return None
+        return plan
+
+    def on_vote(self, plan: PhaseClosePlan, tally: ContestVoteTally, roster: Dict[str, int]):
+        """选票计入内存计数后调用（同步，使用调用方已取得的计数）"""
+        if self._plans.get(plan.class_id) is plan and self._reached(plan, tally, roster):
+            self.trigger(plan.class_id, REASON_RATIO)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "plans": {class_id: plan.to_dict() for class_id, plan in self._plans.items()},
+            "armed": self.armed,
+            "closed_by_timeout": self.closed_by_timeout,
+            "closed_by_ratio": self.closed_by_ratio,
+            "superseded": self.superseded,
+            "skipped": self.skipped
+        }
+
+
+# 模块级别的实例
+phase_closer = PhaseCloser()
+
+
+async def _on_countdown_complete(class_id: int):
+    """倒计时结束（只在 leader 上执行）"""
+    phase_closer.trigger(class_id, REASON_TIMEOUT)
+
+
+async def _on_phase_close_armed(data: Dict[str, Any]):
+    plan = PhaseClosePlan.from_dict(data["plan"])
+    phase_closer.put(plan)
+    if not backplane.is_leader:
+        return
+    # 重新开启投票时计数可能已经达到比例
+    async with async_session_maker() as db:
+        if await phase_closer.ratio_reached(db, plan):
+            phase_closer.trigger(plan.class_id, REASON_RATIO)
+
+
+async def _on_class_state_changed(data: Dict[str, Any]):
+    """班级状态有了更新的版本（管理员手动切换或自动结束）：条件失效，leader 停止对应的倒计时"""
+    state = data["state"]
+    plan = phase_closer.get(state["class_id"])
+    if plan is None or state["update_time"] <= plan.update_time:
+        return
+    phase_closer.discard(plan.class_id)
+    phase_closer.superseded += 1
+    if backplane.is_leader and plan.deadline is not None and manager.countdown_deadlines.get(plan.class_id) == plan.deadline:
+        await manager.stop_countdown(plan.class_id)
+
+
+manager.register_countdown_handler(PHASE_CLOSE_HANDLER, _on_countdown_complete)
+backplane.subscribe("phase_close.armed", _on_phase_close_armed)
+backplane.subscribe("state.class_changed", _on_class_state_changed)
+
+
+async def arm_phase_close(state: ClassState, seconds: int | None = None, ratio: float | None = None) -> PhaseClosePlan | None:
+    """
+    开启投票后调用：设置自动结束条件并同步到所有 worker
+
+    Args:
+        state: 开启投票后的班级状态
+        seconds: 多少秒后结束，0 表示不计时，默认 AUTO_CLOSE_VOTING_SECONDS
+        ratio: 投票人数达到名单观众数的该比例时结束，0 表示不按比例结束，默认 AUTO_CLOSE_VOTE_RATIO
+
+    Returns:
+        PhaseClosePlan | None: 当前阶段不支持自动结束或两个条件都未设置时返回 None
+    """
+    seconds = settings.AUTO_CLOSE_VOTING_SECONDS if seconds is None else seconds
+    ratio = settings.AUTO_CLOSE_VOTE_RATIO if ratio is None else ratio
+    rule = AUTO_CLOSE_RULES.get(state.current_stage)
+    if rule is None or (seconds <= 0 and ratio <= 0):
+        return None
+    close_to, vote_phase = rule
+
+    deadline = None
+    if seconds > 0:
+        deadline = await manager.start_countdown(state.class_id, seconds, on_complete=PHASE_CLOSE_HANDLER)
+    plan = PhaseClosePlan(
+        class_id=state.class_id,
+        stage=state.current_stage,
+        close_to=close_to,
+        vote_phase=vote_phase,
+        contest_id=state.contest_id,
+        update_time=state.update_time,
+        ratio=ratio,
+        deadline=deadline
+    )
+    await backplane.publish("phase_close.armed", {"plan": plan.to_dict()})
+    return plan
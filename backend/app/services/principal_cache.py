@@ -0,0 +1,161 @@
+"""
+登录用户缓存
+按 token 缓存解码后的用户快照，命中时不再解码 JWT、不再查询 users 表。
+快照是不可变的，只包含鉴权和业务判断需要的字段；管理员修改用户后需要显式失效。
+多 worker 部署时通过 invalidate_principals 经广播总线通知所有进程。
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Set, Tuple
+
+from app.config import settings
+from app.models.user import User, UserRole
+from app.websocket.backplane import backplane
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """当前登录用户的只读快照"""
+    id: int
+    username: str
+    role: UserRole
+    display_name: str
+    workspace_id: int | None = None
+    class_id: int | None = None
+    team_side: str | None = None
+    debater_position: str | None = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            display_name=user.display_name,
+            workspace_id=user.workspace_id,
+            class_id=user.class_id,
+            team_side=user.team_side,
+            debater_position=user.debater_position
+        )
+
+
+class PrincipalCache:
+    """有容量上限的 TTL + LRU 缓存：token -> (过期时间, UserPrincipal)"""
+
+    def __init__(self, ttl_seconds: int, max_size: int):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, UserPrincipal]]" = OrderedDict()
+        # user_id -> 该用户的 token 集合，用于按用户失效
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> UserPrincipal | None:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return principal
+
+    def put(self, token: str, principal: UserPrincipal, token_exp: float | None = None):
+        """
+        缓存用户快照
+
+        Args:
+            token: JWT 字符串
+            principal: 用户快照
+            token_exp: token 的过期时间戳（秒），缓存不会比 token 活得更久
+        """
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (time.monotonic() + ttl, principal)
+        self._tokens_by_user.setdefault(principal.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def invalidate_user(self, user_id: int):
+        """用户被修改或删除后调用，丢弃该用户的所有缓存"""
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+        self.invalidations += 1
+
+    def invalidate_class(self, class_id: int):
+        """批量修改某班级用户后调用，丢弃该班级所有用户的缓存"""
+        for token, (_, principal) in list(self._entries.items()):
+            if principal.class_id == class_id:
+                self._remove(token)
+        self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等指标"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+# 模块级别的缓存实例
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE
+)
+
+
+def _on_principal_invalidated(data: Dict[str, Any]):
+    if data.get("user_id") is not None:
+        principal_cache.invalidate_user(data["user_id"])
+    if data.get("class_id") is not None:
+        principal_cache.invalidate_class(data["class_id"])
+
+
+backplane.subscribe("auth.principal_invalidated", _on_principal_invalidated)
+backplane.on_resync(principal_cache.clear)
+
+
+async def invalidate_principals(user_id: int | None = None, class_id: int | None = None):
+    """通知所有 worker 丢弃指定用户或班级的缓存"""
+    await backplane.publish("auth.principal_invalidated", {"user_id": user_id, "class_id": class_id})
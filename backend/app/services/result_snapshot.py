@@ -0,0 +1,116 @@
+"""
+比赛结果快照
+进入结果封存阶段后投票和评分都已关闭，结果不会再变化，
+因此在封存时计算一次完整结果并落表，揭晓和查询接口直接读取快照。
+"""
+import json
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.contest import Contest
+from app.models.contest_result_snapshot import ContestResultSnapshot
+from app.services.calculation import ContestResult, get_calculation_service
+
+
+def serialize_contest_result(contest: Contest, contest_result: ContestResult) -> Dict[str, Any]:
+    """将比赛结果转换为可直接下发的字典"""
+    return {
+        "contest_id": contest_result.contest_id,
+        "topic": contest.topic,
+        "pro_team_name": contest.pro_team_name,
+        "con_team_name": contest.con_team_name,
+        "winning_team": contest_result.winning_team,
+        "pro_team_swing": contest_result.pro_team_swing,
+        "con_team_swing": contest_result.con_team_swing,
+        "total_votes_cast": contest_result.total_votes_cast,
+        "debater_rankings": [
+            {
+                "debater_id": ranking.debater_id,
+                "debater_name": ranking.debater_name,
+                "team_side": ranking.team_side,
+                "final_score": ranking.final_score,
+                "logical_reasoning_avg": ranking.logical_reasoning_avg,
+                "debate_skills_avg": ranking.debate_skills_avg,
+                "rank": ranking.rank
+            }
+            for ranking in contest_result.debater_rankings
+        ],
+        "vote_analysis": [
+            {
+                "team_side": analysis.team_side,
+                "team_name": analysis.team_name,
+                "pre_debate_votes": analysis.pre_debate_votes,
+                "post_debate_votes": analysis.post_debate_votes,
+                "swing_vote": analysis.swing_vote,
+                "growth_rate": analysis.growth_rate,
+                "vote_percentage_change": analysis.vote_percentage_change
+            }
+            for analysis in contest_result.vote_analysis
+        ]
+    }
+
+
+async def compute_contest_results(db: AsyncSession, contest_id: int) -> Dict[str, Any]:
+    """从原始投票和评分记录实时计算结果（不落表）"""
+    contest = await db.get(Contest, contest_id)
+    if not contest:
+        raise ValueError(f"Contest with id {contest_id} not found")
+
+    calc_service = get_calculation_service(db)
+    contest_result = await calc_service.calculate_contest_result(contest_id)
+    return serialize_contest_result(contest, contest_result)
+
+
+async def seal_contest_results(db: AsyncSession, contest_id: int) -> Dict[str, Any]:
+    """
+    计算并保存比赛结果快照（覆盖已有快照）
+
+    快照与调用方的阶段变更处于同一事务中，由调用方负责提交。
+
+    Args:
+        db: 数据库会话
+        contest_id: 比赛ID
+
+    Returns:
+        Dict[str, Any]: 快照内容
+    """
+    payload = await compute_contest_results(db, contest_id)
+    contest = await db.get(Contest, contest_id)
+
+    await db.execute(delete(ContestResultSnapshot).where(ContestResultSnapshot.contest_id == contest_id))
+    db.add(ContestResultSnapshot(
+        contest_id=contest_id,
+        class_id=contest.class_id,
+        payload=json.dumps(payload, ensure_ascii=False)
+    ))
+    await db.flush()
+    return payload
+
+
+async def get_sealed_results(db: AsyncSession, contest_id: int) -> Optional[Dict[str, Any]]:
+    """读取已封存的比赛结果，不存在时返回 None"""
+    result = await db.execute(
+        select(ContestResultSnapshot.payload).where(ContestResultSnapshot.contest_id == contest_id)
+    )
+    payload = result.scalar_one_or_none()
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+async def read_contest_results(db: AsyncSession, contest_id: int) -> Dict[str, Any]:
+    """
+    读取封存结果；没有快照时（例如升级前已封存的比赛）实时计算但不落表。
+    只读：快照只在进入 RESULTS_SEALED / RESULTS_REVEALED 阶段时由阶段状态机写入
+    """
+    payload = await get_sealed_results(db, contest_id)
+    if payload is None:
+        payload = await compute_contest_results(db, contest_id)
+    return payload
+
+
+async def discard_sealed_results(db: AsyncSession, contest_id: int):
+    """管理员重新开启投票或评分阶段时作废快照，由调用方负责提交"""
+    await db.execute(delete(ContestResultSnapshot).where(ContestResultSnapshot.contest_id == contest_id))
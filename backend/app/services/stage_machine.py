@@ -0,0 +1,288 @@
+"""
+阶段状态机
+所有修改班级阶段的入口（辩论阶段切换、旧版答辩阶段、揭晓结果、重置）都经过同一张转换表：
+允许从哪些阶段进入、进入后投票/评分开关的取值，以及结果快照的处理方式。
+
+转换以 update_time 作为版本号，用一条 UPDATE ... WHERE update_time = :expected 完成比较并写入，
+两个管理员同时操作（或倒计时回调与管理员同时操作）时只有一个写入成功，
+另一个重新读取最新状态后再按转换表校验，仍然允许则重试，否则拒绝。
+"""
+import dataclasses
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.system_settings import SystemSettings, SystemStage
+from app.services.class_state_cache import ClassState, class_state_cache, load_current_team
+from app.services.result_snapshot import seal_contest_results, get_sealed_results, discard_sealed_results
+
+
+# 结果快照的处理方式
+RESULTS_SEAL = "seal"  # 重新计算并封存
+RESULTS_ENSURE_SEALED = "ensure_sealed"  # 没有快照时补算一次
+RESULTS_DISCARD = "discard"  # 重新开启投票或评分，作废已封存的结果
+
+# 状态变化后的广播方式
+BROADCAST_DEBATE = "debate"  # debate_update（辩论赛各端）
+BROADCAST_STATE = "state"  # state_update（旧版答辩流程）
+
+ALL_STAGES = frozenset(SystemStage)
+# 结果揭晓后只能重置，不能再回到投票或评分阶段
+OPEN_STAGES = ALL_STAGES - {SystemStage.RESULTS_REVEALED}
+LEGACY_STAGES = frozenset({
+    SystemStage.PRESENTATION,
+    SystemStage.QNA_SNATCH,
+    SystemStage.QNA_INPUT,
+    SystemStage.SCORING_TEACHER,
+    SystemStage.SCORING_STUDENT,
+    SystemStage.FINISHED
+})
+
+CHANNELS_CLOSED = {
+    "pre_voting_enabled": False,
+    "post_voting_enabled": False,
+    "judge_scoring_enabled": False,
+    "results_revealed": False
+}
+
+
+@dataclass(frozen=True)
+class StageTransition:
+    """进入某个阶段的规则"""
+    allowed_from: FrozenSet[SystemStage]
+    # 进入后各开关的取值，未列出的开关保持原值
+    flags: Dict[str, bool]
+    results: str | None = None
+    broadcast: str = BROADCAST_DEBATE
+    requires_contest: bool = False
+
+
+def _flags(**enabled: bool) -> Dict[str, bool]:
+    return {**CHANNELS_CLOSED, **enabled}
+
+
+TRANSITIONS: Dict[SystemStage, StageTransition] = {
+    SystemStage.IDLE: StageTransition(ALL_STAGES, _flags()),
+    SystemStage.PRE_VOTING: StageTransition(OPEN_STAGES, _flags(pre_voting_enabled=True), RESULTS_DISCARD),
+    SystemStage.DEBATE_IN_PROGRESS: StageTransition(OPEN_STAGES, _flags()),
+    SystemStage.POST_VOTING: StageTransition(OPEN_STAGES, _flags(post_voting_enabled=True), RESULTS_DISCARD),
+    SystemStage.JUDGE_SCORING: StageTransition(OPEN_STAGES, _flags(judge_scoring_enabled=True), RESULTS_DISCARD),
+    SystemStage.RESULTS_SEALED: StageTransition(OPEN_STAGES, _flags(), RESULTS_SEAL),
+    SystemStage.RESULTS_REVEALED: StageTransition(
+        frozenset({
+            SystemStage.DEBATE_IN_PROGRESS,
+            SystemStage.POST_VOTING,
+            SystemStage.JUDGE_SCORING,
+            SystemStage.RESULTS_SEALED,
+            SystemStage.RESULTS_REVEALED
+        }),
+        _flags(results_revealed=True),
+        RESULTS_ENSURE_SEALED,
+        requires_contest=True
+    ),
+    # 旧版答辩流程与辩论赛开关无关：任何阶段都可以进入，投票/评分开关和揭晓状态保持原值
+    **{
+        stage: StageTransition(ALL_STAGES, {}, broadcast=BROADCAST_STATE)
+        for stage in LEGACY_STAGES
+    }
+}
+
+# 未传入的参数保持原值
+UNCHANGED: Any = object()
+
+
+@dataclass
+class TransitionResult:
+    """一次阶段转换的结果"""
+    state: ClassState
+    previous: ClassState
+    rule: StageTransition
+    # 为 False 时目标状态与当前状态完全相同，没有写入也不需要广播
+    changed: bool = True
+    # 揭晓结果时的结果快照
+    results: Dict[str, Any] | None = None
+
+
+class StageMachine:
+    """按转换表修改班级阶段"""
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max_retries
+        # 指标
+        self.applied = 0
+        self.unchanged = 0
+        self.conflicts = 0
+        self.rejected = 0
+
+    async def _load(self, db: AsyncSession, class_id: int) -> ClassState:
+        """从数据库读取最新状态（绕过会话中已加载的对象），班级没有系统设置时创建"""
+        for _ in range(2):
+            result = await db.execute(
+                select(SystemSettings)
+                .where(SystemSettings.class_id == class_id)
+                .execution_options(populate_existing=True)
+            )
+            row = result.scalar_one_or_none()
+            if row is not None:
+                return await load_current_team(db, ClassState.from_settings(row))
+            try:
+                async with db.begin_nested():
+                    db.add(SystemSettings(class_id=class_id))
+            except IntegrityError:
+                # 另一个请求刚创建了同一班级的设置，重新读取
+                continue
+        raise HTTPException(status_code=409, detail="系统状态正在被修改，请重试")
+
+    @staticmethod
+    async def _compare_and_set(db: AsyncSession, state: ClassState, values: Dict[str, Any]) -> bool:
+        """以 state.update_time 为期望版本写入 values（会补上新的 update_time），版本已变化时返回 False"""
+        # 新版本号严格递增，保证每个版本只对应一次写入
+        values["update_time"] = max(int(time.time() * 1000), state.update_time + 1)
+        result = await db.execute(
+            update(SystemSettings)
+            .where(SystemSettings.class_id == state.class_id)
+            .where(SystemSettings.update_time == state.update_time)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def _reject(self, status_code: int, detail: str):
+        self.rejected += 1
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    async def apply(
+        self,
+        db: AsyncSession,
+        class_id: int,
+        stage: SystemStage,
+        contest_id: int | None = UNCHANGED,
+        current_team_id: int | None = UNCHANGED,
+        expected_update_time: int | None = None
+    ) -> TransitionResult:
+        """
+        执行阶段转换并提交
+
+        Args:
+            db: 数据库会话；调用方在同一事务中的其他修改会一起提交
+            class_id: 班级ID
+            stage: 目标阶段
+            contest_id: 同时设置当前比赛（None 表示清除）
+            current_team_id: 同时设置当前团队（旧版答辩流程）
+            expected_update_time: 客户端看到的版本；传入时版本不一致直接返回 409，不重试
+
+        Returns:
+            TransitionResult: 转换前后的状态
+
+        Raises:
+            HTTPException: 400 不允许的转换；409 并发修改冲突
+        """
+        rule = TRANSITIONS[stage]
+        state = await class_state_cache.get(db, class_id)
+        if state is None:
+            state = await self._load(db, class_id)
+
+        for _ in range(self.max_retries + 1):
+            if expected_update_time is not None and state.update_time != expected_update_time:
+                self.conflicts += 1
+                self._reject(409, "系统状态已被其他操作修改，请刷新后重试")
+            if state.current_stage != stage and state.current_stage not in rule.allowed_from:
+                self._reject(400, f"不能从 {state.current_stage.value} 切换到 {stage.value}")
+
+            values = {"current_stage": stage, **rule.flags}
+            if contest_id is not UNCHANGED:
+                values["contest_id"] = contest_id
+            if current_team_id is not UNCHANGED:
+                values["current_team_id"] = current_team_id
+            target_contest_id = values.get("contest_id", state.contest_id)
+            if rule.requires_contest and not target_contest_id:
+                self._reject(400, "当前没有比赛")
+
+            if all(getattr(state, field) == value for field, value in values.items()):
+                # 重复点击或并发的相同操作：状态已经是目标状态，只提交调用方的其他修改
+                await db.commit()
+                self.unchanged += 1
+                return TransitionResult(state=state, previous=state, rule=rule, changed=False)
+
+            if await self._compare_and_set(db, state, values):
+                break
+
+            # 比较失败：读取最新状态，按转换表重新校验后重试
+            self.conflicts += 1
+            state = await self._load(db, class_id)
+        else:
+            self._reject(409, "系统状态正在被修改，请重试")
+
+        results = None
+        if target_contest_id:
+            if rule.results == RESULTS_SEAL:
+                await seal_contest_results(db, target_contest_id)
+            elif rule.results == RESULTS_ENSURE_SEALED:
+                results = await get_sealed_results(db, target_contest_id)
+                if results is None:
+                    results = await seal_contest_results(db, target_contest_id)
+            elif rule.results == RESULTS_DISCARD:
+                await discard_sealed_results(db, target_contest_id)
+
+        new_state = dataclasses.replace(state, **values)
+        if "current_team_id" in values:
+            new_state = await load_current_team(db, new_state)
+        await db.commit()
+        self.applied += 1
+        return TransitionResult(state=new_state, previous=state, rule=rule, results=results)
+
+    async def update(self, db: AsyncSession, class_id: int, **values: Any) -> ClassState:
+        """
+        不改变阶段，按同样的比较并写入方式修改其他字段（如创建比赛后设置当前比赛）并提交；
+        不传入字段时只递增版本，用于状态快照中缓存的当前团队信息被修改后
+
+        Args:
+            db: 数据库会话；调用方在同一事务中的其他修改会一起提交
+            class_id: 班级ID
+            **values: 要修改的 SystemSettings 字段
+
+        Returns:
+            ClassState: 修改后的状态
+
+        Raises:
+            HTTPException: 409 重试后仍然冲突
+        """
+        state = await class_state_cache.get(db, class_id)
+        if state is None:
+            state = await self._load(db, class_id)
+
+        for _ in range(self.max_retries + 1):
+            if values and all(getattr(state, field) == value for field, value in values.items()):
+                await db.commit()
+                self.unchanged += 1
+                return state
+            pending = dict(values)
+            if await self._compare_and_set(db, state, pending):
+                new_state = dataclasses.replace(state, **pending)
+                if not values or "current_team_id" in values:
+                    new_state = await load_current_team(db, new_state)
+                await db.commit()
+                self.applied += 1
+                return new_state
+            self.conflicts += 1
+            state = await self._load(db, class_id)
+
+        self._reject(409, "系统状态正在被修改，请重试")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "applied": self.applied,
+            "unchanged": self.unchanged,
+            "conflicts": self.conflicts,
+            "rejected": self.rejected
+        }
+
+
+# 模块级别的状态机实例
+stage_machine = StageMachine(max_retries=settings.STAGE_TRANSITION_RETRIES)
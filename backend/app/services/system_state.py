@@ -1,34 +1,25 @@
-from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, Optional
 
-from app.models.system_settings import SystemSettings, SystemStage
-from app.models.user import User
-
-from app.models.contest import Contest
-from app.models.vote_record import VoteRecord
-from app.models.judge_score import JudgeScore
+from app.models.system_settings import SystemStage
 
+from app.services.debate_progress import debate_progress
+from app.services.class_state_cache import class_state_cache, publish_class_state
+from app.services.stage_machine import stage_machine, TransitionResult, BROADCAST_STATE, UNCHANGED
 from app.websocket import manager
 
 async def broadcast_latest_state(db: AsyncSession, class_id: int):
     """获取最新系统状态并广播"""
-    # 1. 获取系统设置
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
+    # 1. 获取系统设置（读取缓存）
+    settings = await class_state_cache.get(db, class_id)
     
     if not settings:
         return
 
     # 2. 获取当前团队信息
     team_info = None
-    team_name = None
-    if settings.current_team_id:
-        team_result = await db.execute(select(User).where(User.id == settings.current_team_id))
-        team = team_result.scalar_one_or_none()
-        if team:
-            team_info = {"id": team.id, "name": team.display_name}
-            team_name = team.display_name
+    if settings.current_team_id and settings.current_team_name is not None:
+        team_info = {"id": settings.current_team_id, "name": settings.current_team_name}
 
     # 3. 计算平均分
     teacher_avg_score = None
@@ -63,7 +54,56 @@ async def broadcast_latest_state(db: AsyncSession, class_id: int):
         update_time=settings.update_time
     )
 
-async def update_debate_stage(db: AsyncSession, class_id: int, stage: SystemStage, contest_id: Optional[int] = None) -> bool:
+async def transition_stage(
+    db: AsyncSession,
+    class_id: int,
+    stage: SystemStage,
+    contest_id: Optional[int] = UNCHANGED,
+    current_team_id: Optional[int] = UNCHANGED,
+    expected_update_time: Optional[int] = None
+) -> TransitionResult:
+    """
+    按转换表切换阶段，提交后同步缓存并广播一次状态
+
+    Args:
+        db: 数据库会话
+        class_id: 班级ID
+        stage: 目标阶段
+        contest_id: 同时设置当前比赛（None 表示清除）
+        current_team_id: 同时设置当前团队（旧版答辩流程）
+        expected_update_time: 客户端看到的版本，不一致时返回 409
+
+    Returns:
+        TransitionResult: 转换前后的状态
+    """
+    transition = await stage_machine.apply(
+        db,
+        class_id,
+        stage,
+        contest_id=contest_id,
+        current_team_id=current_team_id,
+        expected_update_time=expected_update_time
+    )
+    if not transition.changed:
+        return transition
+
+    await publish_class_state(transition.state)
+    if transition.rule.broadcast == BROADCAST_STATE:
+        await broadcast_latest_state(db, class_id)
+    else:
+        await broadcast_debate_state(db, class_id)
+    if transition.results is not None:
+        await manager.broadcast_results_reveal(class_id, transition.results)
+    return transition
+
+
+async def update_debate_stage(
+    db: AsyncSession,
+    class_id: int,
+    stage: SystemStage,
+    contest_id: Optional[int] = None,
+    expected_update_time: Optional[int] = None
+) -> bool:
     """
     更新辩论阶段，确保互斥性
     
@@ -72,62 +112,18 @@ async def update_debate_stage(db: AsyncSession, class_id: int, stage: SystemStag
         class_id: 班级ID
         stage: 新的系统阶段
         contest_id: 比赛ID（可选）
+        expected_update_time: 客户端看到的版本（可选）
         
     Returns:
         bool: 是否成功更新
     """
-    # 获取当前系统设置
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
-    
-    if not settings:
-        # 如果不存在设置，创建新的
-        settings = SystemSettings(
-            class_id=class_id,
-            current_stage=stage,
-            contest_id=contest_id
-        )
-        db.add(settings)
-    else:
-        # 更新现有设置
-        settings.current_stage = stage
-        if contest_id:
-            settings.contest_id = contest_id
-    
-    # 根据阶段设置互斥控制
-    if stage == SystemStage.PRE_VOTING:
-        settings.pre_voting_enabled = True
-        settings.post_voting_enabled = False
-        settings.judge_scoring_enabled = False
-    elif stage == SystemStage.POST_VOTING:
-        settings.pre_voting_enabled = False
-        settings.post_voting_enabled = True
-        settings.judge_scoring_enabled = False
-    elif stage == SystemStage.JUDGE_SCORING:
-        settings.pre_voting_enabled = False
-        settings.post_voting_enabled = False
-        settings.judge_scoring_enabled = True
-    elif stage == SystemStage.RESULTS_SEALED:
-        settings.pre_voting_enabled = False
-        settings.post_voting_enabled = False
-        settings.judge_scoring_enabled = False
-        settings.results_revealed = False
-    elif stage == SystemStage.RESULTS_REVEALED:
-        settings.pre_voting_enabled = False
-        settings.post_voting_enabled = False
-        settings.judge_scoring_enabled = False
-        settings.results_revealed = True
-    else:
-        # 其他阶段关闭所有投票和评分
-        settings.pre_voting_enabled = False
-        settings.post_voting_enabled = False
-        settings.judge_scoring_enabled = False
-    
-    await db.commit()
-    
-    # 广播状态更新
-    await broadcast_debate_state(db, class_id)
-    
+    await transition_stage(
+        db,
+        class_id,
+        stage,
+        contest_id=contest_id if contest_id else UNCHANGED,
+        expected_update_time=expected_update_time
+    )
     return True
 
 
@@ -140,90 +136,18 @@ async def get_debate_progress(db: AsyncSession, class_id: int) -> Dict[str, Any]
         class_id: 班级ID
         
     Returns:
-        Dict[str, Any]: 进度信息
+        Dict[str, Any]: 进度信息，读取内存计数
     """
-    # 获取系统设置
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
-    
-    if not settings or not settings.contest_id:
+    progress = await debate_progress.get(db, class_id)
+    if not progress:
         return {"error": "No active contest found"}
-    
-    contest_id = settings.contest_id
-    
-    # 统计投票进度
-    pre_vote_count = await db.execute(
-        select(func.count(VoteRecord.id)).where(
-            VoteRecord.contest_id == contest_id,
-            VoteRecord.vote_phase == "pre_debate"
-        )
-    )
-    pre_votes = pre_vote_count.scalar() or 0
-    
-    post_vote_count = await db.execute(
-        select(func.count(VoteRecord.id)).where(
-            VoteRecord.contest_id == contest_id,
-            VoteRecord.vote_phase == "post_debate"
-        )
-    )
-    post_votes = post_vote_count.scalar() or 0
-    
-    # 统计评委评分进度
-    judge_score_count = await db.execute(
-        select(func.count(func.distinct(JudgeScore.judge_id))).where(
-            JudgeScore.contest_id == contest_id
-        )
-    )
-    judges_submitted = judge_score_count.scalar() or 0
-    
-    # 统计总评委数
-    total_judges_count = await db.execute(
-        select(func.count(User.id)).where(
-            User.role == "judge"
-        )
-    )
-    total_judges = total_judges_count.scalar() or 0
-    
-    # 统计总观众数
-    total_audience_count = await db.execute(
-        select(func.count(User.id)).where(
-            User.role == "audience"
-        )
-    )
-    total_audience = total_audience_count.scalar() or 0
-    
-    return {
-        "contest_id": contest_id,
-        "current_stage": settings.current_stage.value,
-        "pre_voting_progress": {
-            "submitted": pre_votes,
-            "total": total_audience,
-            "percentage": (pre_votes / total_audience * 100) if total_audience > 0 else 0
-        },
-        "post_voting_progress": {
-            "submitted": post_votes,
-            "total": total_audience,
-            "percentage": (post_votes / total_audience * 100) if total_audience > 0 else 0
-        },
-        "judge_scoring_progress": {
-            "submitted": judges_submitted,
-            "total": total_judges,
-            "percentage": (judges_submitted / total_judges * 100) if total_judges > 0 else 0
-        },
-        "voting_enabled": {
-            "pre_voting": settings.pre_voting_enabled,
-            "post_voting": settings.post_voting_enabled,
-            "judge_scoring": settings.judge_scoring_enabled
-        },
-        "results_revealed": settings.results_revealed
-    }
+    return progress
 
 
 async def broadcast_debate_state(db: AsyncSession, class_id: int):
     """广播辩论状态更新"""
-    # 获取系统设置
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
+    # 获取系统设置（读取缓存）
+    settings = await class_state_cache.get(db, class_id)
     
     if not settings:
         return
@@ -231,8 +155,7 @@ async def broadcast_debate_state(db: AsyncSession, class_id: int):
     # 获取比赛信息
     contest_info = None
     if settings.contest_id:
-        contest_result = await db.execute(select(Contest).where(Contest.id == settings.contest_id))
-        contest = contest_result.scalar_one_or_none()
+        contest = await class_state_cache.get_contest(db, settings.contest_id)
         if contest:
             contest_info = {
                 "id": contest.id,
@@ -249,11 +172,7 @@ async def broadcast_debate_state(db: AsyncSession, class_id: int):
         stage=settings.current_stage.value,
         contest=contest_info,
         class_id=class_id,
-        voting_enabled={
-            "pre_voting": settings.pre_voting_enabled,
-            "post_voting": settings.post_voting_enabled,
-            "judge_scoring": settings.judge_scoring_enabled
-        },
+        voting_enabled=settings.voting_enabled,
         results_revealed=settings.results_revealed,
         progress=progress_info,
         update_time=settings.update_time
@@ -271,9 +190,8 @@ async def can_reveal_results(db: AsyncSession, class_id: int) -> bool:
     Returns:
         bool: 是否可以揭晓结果
     """
-    # 获取系统设置
-    result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == class_id))
-    settings = result.scalar_one_or_none()
+    # 获取系统设置（读取缓存）
+    settings = await class_state_cache.get(db, class_id)
     
     if not settings:
         return False
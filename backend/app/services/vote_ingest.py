@@ -0,0 +1,442 @@
+"""
+投票写入
+依赖唯一索引 idx_vote_unique_per_voter_phase，使用 INSERT ... ON CONFLICT DO NOTHING RETURNING
+一次往返完成"查重 + 写入"，没有返回行即表示该观众在该阶段已经投过票。
+
+开启 VOTE_WRITE_BEHIND 后，投票先进入进程内队列，由后台任务每 N 毫秒或每 M 行
+合并为一条多行 INSERT 写入并提交，每张选票通过 future 得到写入或冲突结果。
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session_maker
+from app.models.user import UserRole
+from app.models.vote_record import VoteRecord
+from app.schemas.vote import VoteSubmission
+from app.services.class_changes import class_changes
+from app.services.class_state_cache import class_state_cache
+from app.services.debate_progress import debate_progress
+from app.services.phase_closer import phase_closer
+from app.services.principal_cache import UserPrincipal
+from app.services.vote_tally import vote_tally
+from app.websocket import manager
+from app.websocket.backplane import backplane
+
+# 唯一索引 idx_vote_unique_per_voter_phase 的列
+VOTE_CONFLICT_COLUMNS = ["contest_id", "voter_id", "vote_phase"]
+
+
+def vote_insert(db: AsyncSession):
+    """根据当前数据库方言构造支持 ON CONFLICT 的 INSERT"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(VoteRecord)
+    return sqlite.insert(VoteRecord)
+
+
+async def insert_vote(
+    db: AsyncSession,
+    contest_id: int,
+    voter_id: int,
+    team_side: str,
+    vote_phase: str
+) -> Optional[Dict[str, Any]]:
+    """
+    写入一条投票记录并提交
+
+    Args:
+        db: 数据库会话
+        contest_id: 比赛ID
+        voter_id: 投票人ID
+        team_side: 支持的队伍
+        vote_phase: 投票阶段
+
+    Returns:
+        Optional[Dict[str, Any]]: 新记录的字段；已投过票时返回 None
+    """
+    stmt = (
+        vote_insert(db)
+        .values(
+            contest_id=contest_id,
+            voter_id=voter_id,
+            team_side=team_side,
+            vote_phase=vote_phase
+        )
+        .on_conflict_do_nothing(index_elements=VOTE_CONFLICT_COLUMNS)
+        .returning(VoteRecord.id, VoteRecord.created_at)
+    )
+    result = await db.execute(stmt)
+    row = result.first()
+    await db.commit()
+
+    if row is None:
+        return None
+
+    return {
+        "id": row.id,
+        "contest_id": contest_id,
+        "voter_id": voter_id,
+        "team_side": team_side,
+        "vote_phase": vote_phase,
+        "created_at": row.created_at
+    }
+
+
+class _PendingVote:
+    """等待批量写入的选票"""
+    __slots__ = ("values", "future", "enqueued_at")
+
+    def __init__(self, values: Dict[str, Any], future: asyncio.Future):
+        self.values = values
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+    @property
+    def key(self) -> Tuple[int, int, str]:
+        return (self.values["contest_id"], self.values["voter_id"], self.values["vote_phase"])
+
+
+class VoteWriteBehindQueue:
+    """投票批量写入队列（group commit）"""
+
+    def __init__(self, flush_interval_ms: int, max_rows: int, max_size: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self.max_size = max_size
+        self._queue: asyncio.Queue | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        # 指标
+        self.restarts = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.conflicts = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """
+        启动后台写入任务（需要在事件循环中调用）；stop() 之后可以再次启动
+
+        队列只在首次启动或事件循环更换时创建，重新启动时沿用原队列，已排队的选票不会丢失。
+        """
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._loop = loop
+        elif self._task is not None:
+            self.restarts += 1
+        self._closing = False
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """停止接收新选票，写完队列中剩余的选票后退出"""
+        if not self.running:
+            return
+        self._closing = True
+        try:
+            await self._queue.put(None)
+            await self._task
+        finally:
+            self._task = None
+            self._closing = False
+
+    async def submit(
+        self,
+        contest_id: int,
+        voter_id: int,
+        team_side: str,
+        vote_phase: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        将选票放入队列并等待所在批次写入
+
+        Returns:
+            Optional[Dict[str, Any]]: 新记录的字段；已投过票时返回 None
+        """
+        if self._closing:
+            raise RuntimeError("投票写入队列正在关闭")
+        if not self.running:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingVote({
+            "contest_id": contest_id,
+            "voter_id": voter_id,
+            "team_side": team_side,
+            "vote_phase": vote_phase
+        }, future))
+        return await future
+
+    def metrics(self) -> Dict[str, Any]:
+        """队列深度与写入延迟指标"""
+        return {
+            "enabled": settings.VOTE_WRITE_BEHIND,
+            "running": self.running,
+            "restarts": self.restarts,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "conflicts": self.conflicts,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2)
+        }
+
+    async def _run(self):
+        batch: List[_PendingVote] = []
+        try:
+            await self._collect_and_flush(batch)
+        finally:
+            # 被取消或异常退出时，尚未写入的选票立即失败，提交方不会一直等待
+            self._fail_pending(batch)
+
+    def _fail_pending(self, batch: List[_PendingVote]):
+        error = RuntimeError("投票写入队列已停止")
+        pending = list(batch)
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                pending.append(item)
+        for item in pending:
+            if not item.future.done():
+                self.failures += 1
+                item.future.set_exception(error)
+
+    async def _collect_and_flush(self, batch: List[_PendingVote]):
+        """攒批写入；batch 为当前批次，由调用方在退出时检查未完成的选票"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch.clear()
+            item = await self._queue.get()
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+                deadline = loop.time() + self.flush_interval
+                # 攒批：直到达到行数上限或等待时间用完
+                while len(batch) < self.max_rows:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+            if stopping:
+                # 关闭时把队列剩余选票全部写完
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+
+            for start in range(0, len(batch), self.max_rows):
+                await self._flush(batch[start:start + self.max_rows])
+
+    async def _flush(self, batch: List[_PendingVote]):
+        if not batch:
+            return
+        started = time.perf_counter()
+
+        # 同一批内的重复选票只写第一张，其余直接判定为冲突
+        unique: Dict[Tuple[int, int, str], _PendingVote] = {}
+        duplicates: List[_PendingVote] = []
+        for pending in batch:
+            if pending.key in unique:
+                duplicates.append(pending)
+            else:
+                unique[pending.key] = pending
+
+        try:
+            async with async_session_maker() as db:
+                stmt = (
+                    vote_insert(db)
+                    .values([pending.values for pending in unique.values()])
+                    .on_conflict_do_nothing(index_elements=VOTE_CONFLICT_COLUMNS)
+                    .returning(
+                        VoteRecord.id, VoteRecord.created_at,
+                        VoteRecord.contest_id, VoteRecord.voter_id, VoteRecord.vote_phase
+                    )
+                )
+                result = await db.execute(stmt)
+                inserted = {(row.contest_id, row.voter_id, row.vote_phase): row for row in result.all()}
+                await db.commit()
+        except Exception as e:
+            self.failures += len(batch)
+            print(f"投票批量写入失败: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for key, pending in unique.items():
+            row = inserted.get(key)
+            if pending.future.done():
+                continue
+            if row is None:
+                self.conflicts += 1
+                pending.future.set_result(None)
+            else:
+                pending.future.set_result({**pending.values, "id": row.id, "created_at": row.created_at})
+        for pending in duplicates:
+            self.conflicts += 1
+            if not pending.future.done():
+                pending.future.set_result(None)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.rows_written += len(inserted)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        oldest_wait_ms = (started - min(pending.enqueued_at for pending in batch)) * 1000
+        self.max_wait_ms = max(self.max_wait_ms, oldest_wait_ms)
+
+
+# 模块级别的写入队列实例
+vote_write_queue = VoteWriteBehindQueue(
+    flush_interval_ms=settings.VOTE_FLUSH_INTERVAL_MS,
+    max_rows=settings.VOTE_FLUSH_MAX_ROWS,
+    max_size=settings.VOTE_QUEUE_MAX_SIZE
+)
+
+
+async def ingest_vote(
+    db: AsyncSession,
+    contest_id: int,
+    voter_id: int,
+    team_side: str,
+    vote_phase: str
+) -> Optional[Dict[str, Any]]:
+    """
+    写入一张已通过校验的选票：开启 VOTE_WRITE_BEHIND 时走批量写入队列，否则直接写入
+
+    Returns:
+        Optional[Dict[str, Any]]: 新记录的字段；已投过票时返回 None
+    """
+    if settings.VOTE_WRITE_BEHIND:
+        return await vote_write_queue.submit(contest_id, voter_id, team_side, vote_phase)
+    return await insert_vote(db, contest_id, voter_id, team_side, vote_phase)
+
+
+async def cast_vote(db: AsyncSession, current_user: UserPrincipal, vote_data: VoteSubmission) -> Dict[str, Any]:
+    """
+    校验并写入一张选票，HTTP 接口和 WebSocket VOTE 消息共用同一套规则
+
+    Args:
+        db: 数据库会话
+        current_user: 投票人
+        vote_data: 投票内容
+
+    Returns:
+        Dict[str, Any]: 新投票记录的字段
+
+    Raises:
+        HTTPException: 校验失败或已经投过票
+    """
+    # 验证用户角色
+    if current_user.role not in [UserRole.audience, UserRole.student, UserRole.admin]:
+        raise HTTPException(status_code=403, detail="只有观众可以投票")
+    
+    # 验证比赛存在（读取缓存）
+    contest = await class_state_cache.get_contest(db, vote_data.contest_id)
+    if not contest:
+        raise HTTPException(status_code=404, detail="比赛不存在")
+    
+    # 验证用户有权限访问该班级的比赛
+    if current_user.class_id != contest.class_id:
+        raise HTTPException(status_code=403, detail="无权访问该比赛")
+    
+    # 检查系统状态是否允许投票（读取缓存，不查询数据库）
+    system_settings = await class_state_cache.get(db, contest.class_id)
+    if not system_settings:
+        raise HTTPException(status_code=404, detail="系统设置不存在")
+    
+    # 验证投票阶段
+    if vote_data.vote_phase == "pre_debate":
+        if not system_settings.pre_voting_enabled:
+            raise HTTPException(status_code=400, detail="赛前投票未开启")
+    elif vote_data.vote_phase == "post_debate":
+        if not system_settings.post_voting_enabled:
+            raise HTTPException(status_code=400, detail="赛后投票未开启")
+    else:
+        raise HTTPException(status_code=400, detail="无效的投票阶段")
+    
+    # 写入投票：依赖唯一索引做冲突判断，没有返回行说明已经投过票
+    vote_record = await ingest_vote(
+        db,
+        contest_id=vote_data.contest_id,
+        voter_id=current_user.id,
+        team_side=vote_data.team_side,
+        vote_phase=vote_data.vote_phase
+    )
+    if vote_record is None:
+        raise HTTPException(status_code=400, detail=f"您已经在{vote_data.vote_phase}阶段投过票了")
+    
+    # 通知所有 worker 更新内存计数并标记投票进度，请求不等待 WebSocket 发送
+    await backplane.publish("vote.recorded", {
+        "contest_id": vote_data.contest_id,
+        "class_id": contest.class_id,
+        "voter_id": current_user.id,
+        "vote_phase": vote_data.vote_phase,
+        "team_side": vote_data.team_side
+    })
+    
+    return vote_record
+
+
+async def _on_vote_recorded(data: Dict[str, Any]):
+    """
+    任一 worker 写入选票后在每个 worker 上执行：更新内存计数，
+    当前阶段的投票人数直接从计数读取，由定时任务合并后广播给本进程的大屏连接，
+    并检查是否达到投票阶段的自动结束比例
+    """
+    class_id, contest_id, vote_phase = data["class_id"], data["contest_id"], data["vote_phase"]
+    if vote_tally.record_vote(contest_id, data["voter_id"], vote_phase, data["team_side"]):
+        class_changes.notify(class_id)
+
+    # 计数和名单都已预热时不打开数据库会话
+    tally = vote_tally.peek(contest_id)
+    plan = phase_closer.watching(class_id, contest_id, vote_phase)
+    roster = debate_progress.peek_roster(class_id) if plan is not None else None
+    if tally is None or (plan is not None and roster is None):
+        async with async_session_maker() as db:
+            tally = await vote_tally.get(db, contest_id)
+            if plan is not None:
+                roster = await debate_progress.roster(db, class_id)
+
+    # 达到自动结束比例时关闭当前投票阶段（只在 leader 上判断）
+    if plan is not None:
+        phase_closer.on_vote(plan, tally, roster)
+    manager.mark_vote_progress(
+        class_id=class_id,
+        total_votes=tally.phase_total(vote_phase),
+        contest_id=contest_id
+    )
+
+
+backplane.subscribe("vote.recorded", _on_vote_recorded)
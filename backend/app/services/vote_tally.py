@@ -0,0 +1,178 @@
+"""
+进程内投票计数
+按 (contest_id, vote_phase, team_side) 维护票数，首次访问时从数据库预热，
+之后由投票成功的路径递增，进度、统计和广播都直接读取内存计数。
+多 worker 部署时，每张选票和对账结果都经广播总线同步到所有进程的计数。
+"""
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.vote_record import VoteRecord
+from app.websocket.backplane import backplane
+
+
+class ContestVoteTally:
+    """单场比赛的投票计数"""
+
+    def __init__(self, contest_id: int):
+        self.contest_id = contest_id
+        # (voter_id, vote_phase) -> team_side，用于保证重复记录不会重复计数
+        self.ballots: Dict[Tuple[int, str], str] = {}
+        # (vote_phase, team_side) -> 票数
+        self.counts: Dict[Tuple[str, str], int] = {}
+        # voter_id -> 已投阶段数，用于 O(1) 得到去重投票人数
+        self.voter_phases: Dict[int, int] = {}
+        self.warmed = False
+        # 每次计数变化递增，供缓存/条件请求判断是否有变化
+        self.version = 0
+
+    def add(self, voter_id: int, vote_phase: str, team_side: str) -> bool:
+        """记录一张选票，已记录过的选票返回 False"""
+        key = (voter_id, vote_phase)
+        if key in self.ballots:
+            return False
+        self.ballots[key] = team_side
+        count_key = (vote_phase, team_side)
+        self.counts[count_key] = self.counts.get(count_key, 0) + 1
+        self.voter_phases[voter_id] = self.voter_phases.get(voter_id, 0) + 1
+        self.version += 1
+        return True
+
+    def votes(self, team_side: str, vote_phase: str) -> int:
+        return self.counts.get((vote_phase, team_side), 0)
+
+    def phase_total(self, vote_phase: str) -> int:
+        return self.votes("pro", vote_phase) + self.votes("con", vote_phase)
+
+    @property
+    def total_voters(self) -> int:
+        return len(self.voter_phases)
+
+    def snapshot(self) -> Dict[str, int]:
+        """计数快照，用于对账"""
+        return {
+            "pro_pre_votes": self.votes("pro", "pre_debate"),
+            "con_pre_votes": self.votes("con", "pre_debate"),
+            "pro_post_votes": self.votes("pro", "post_debate"),
+            "con_post_votes": self.votes("con", "post_debate"),
+            "total_voters": self.total_voters
+        }
+
+
+class VoteTallyStore:
+    """进程级投票计数存储"""
+
+    def __init__(self):
+        self._tallies: Dict[int, ContestVoteTally] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _tally(self, contest_id: int) -> ContestVoteTally:
+        tally = self._tallies.get(contest_id)
+        if tally is None:
+            tally = ContestVoteTally(contest_id)
+            self._tallies[contest_id] = tally
+        return tally
+
+    @staticmethod
+    async def _load_ballots(db: AsyncSession, contest_id: int):
+        result = await db.execute(
+            select(VoteRecord.voter_id, VoteRecord.vote_phase, VoteRecord.team_side)
+            .where(VoteRecord.contest_id == contest_id)
+        )
+        return result.all()
+
+    async def get(self, db: AsyncSession, contest_id: int) -> ContestVoteTally:
+        """获取比赛计数，首次访问时从数据库预热"""
+        tally = self._tally(contest_id)
+        if tally.warmed:
+            return tally
+
+        lock = self._locks.setdefault(contest_id, asyncio.Lock())
+        async with lock:
+            if not tally.warmed:
+                # 预热期间到达的选票已经通过 record_vote 记入，add 是幂等的
+                for voter_id, vote_phase, team_side in await self._load_ballots(db, contest_id):
+                    tally.add(voter_id, vote_phase, team_side)
+                tally.warmed = True
+        return tally
+
+    def peek(self, contest_id: int) -> ContestVoteTally | None:
+        """已预热的比赛计数，未预热时返回 None（不访问数据库）"""
+        tally = self._tallies.get(contest_id)
+        return tally if tally is not None and tally.warmed else None
+
+    def record_vote(self, contest_id: int, voter_id: int, vote_phase: str, team_side: str) -> bool:
+        """
+        投票写入成功后调用。同步执行、中间没有 await，因此在事件循环内是原子的
+        """
+        return self._tally(contest_id).add(voter_id, vote_phase, team_side)
+
+    def invalidate(self, contest_id: int):
+        """丢弃某场比赛的计数，下次访问时重新预热"""
+        self._tallies.pop(contest_id, None)
+        self._locks.pop(contest_id, None)
+
+    def clear(self):
+        """丢弃所有比赛的计数（总线重连后）"""
+        self._tallies.clear()
+        self._locks.clear()
+
+    async def reconcile(self, db: AsyncSession, contest_id: int) -> Dict[str, Any]:
+        """
+        与数据库对账，不一致时以数据库为准重建计数
+
+        Args:
+            db: 数据库会话
+            contest_id: 比赛ID
+
+        Returns:
+            Dict[str, Any]: 内存计数、数据库计数以及是否一致
+        """
+        memory = (await self.get(db, contest_id)).snapshot()
+
+        rebuilt = ContestVoteTally(contest_id)
+        for voter_id, vote_phase, team_side in await self._load_ballots(db, contest_id):
+            rebuilt.add(voter_id, vote_phase, team_side)
+        rebuilt.warmed = True
+        database = rebuilt.snapshot()
+
+        consistent = memory == database
+        if not consistent:
+            print(f"投票计数与数据库不一致，已重建: contest={contest_id} memory={memory} database={database}")
+            rebuilt.version = self._tally(contest_id).version + 1
+            self._tallies[contest_id] = rebuilt
+            # 其他 worker 丢弃各自的计数，下次访问时从数据库重新预热
+            await backplane.publish("vote.tally_invalidated", {
+                "contest_id": contest_id,
+                "origin": backplane.instance_id
+            })
+
+        return {
+            "contest_id": contest_id,
+            "memory": memory,
+            "database": database,
+            "consistent": consistent
+        }
+
+
+# 模块级别的计数实例
+vote_tally = VoteTallyStore()
+
+
+def _on_tally_invalidated(data: Dict[str, Any]):
+    if data.get("origin") != backplane.instance_id:
+        for contest_id in data.get("contest_ids") or [data["contest_id"]]:
+            vote_tally.invalidate(contest_id)
+
+
+backplane.subscribe("vote.tally_invalidated", _on_tally_invalidated)
+backplane.on_resync(vote_tally.clear)
+
+
+async def release_tallies(contest_ids: List[int]):
+    """通知所有 worker 释放这些比赛的计数（删除场次或重置后），之后再访问时重新预热"""
+    if contest_ids:
+        await backplane.publish("vote.tally_invalidated", {"contest_ids": list(contest_ids)})
@@ -1,5 +1,3 @@
-from app.websocket.manager import ConnectionManager
+from app.websocket.manager import ConnectionManager, manager
 
-manager = ConnectionManager()
-
-__all__ = ["manager"]
+__all__ = ["ConnectionManager", "manager"]
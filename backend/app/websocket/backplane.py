@@ -0,0 +1,340 @@
+"""
+广播总线
+多个 uvicorn worker 各自持有一部分 WebSocket 连接。所有广播和需要跨进程同步的事件
+（投票计数、缓存失效、倒计时）都先发布到总线，每个 worker 订阅总线后在本进程内分发。
+
+- local：进程内总线，经队列异步分发，单 worker 部署和测试使用
+- postgres：基于 PostgreSQL LISTEN/NOTIFY；同时用 advisory lock 选出唯一的 leader，
+  倒计时等只能有一个执行者的任务只在 leader 上运行
+"""
+import asyncio
+import inspect
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.config import settings
+
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None] | None]
+
+
+class Backplane:
+    """广播总线基类：publish 的事件会送达每个进程（包括自己）上订阅该事件的处理函数"""
+    name = "base"
+
+    def __init__(self):
+        # 当前进程的唯一标识，事件中可用来识别发布者
+        self.instance_id = uuid.uuid4().hex
+        self._handlers: Dict[str, List[EventHandler]] = {}
+        # 总线连接（重新）建立后调用，丢弃由事件维护的进程内缓存
+        self._resync_handlers: List[Callable[[], Any]] = []
+        # 指标
+        self.published = 0
+        self.delivered = 0
+        self.failures = 0
+        self.resyncs = 0
+
+    def subscribe(self, event_type: str, handler: EventHandler):
+        """订阅事件，处理函数可以是普通函数或协程函数"""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def on_resync(self, handler: Callable[[], Any]):
+        """
+        注册重新同步回调：连接中断期间发布的事件无法补收，
+        由事件维护的缓存（班级状态、投票计数、进度计数、身份缓存）在连接建立后全部丢弃，下次访问时从数据库重新预热
+        """
+        self._resync_handlers.append(handler)
+
+    def resync(self):
+        for handler in self._resync_handlers:
+            try:
+                handler()
+            except Exception as e:
+                print(f"广播总线重新同步失败: {e}")
+        self.resyncs += 1
+
+    async def dispatch(self, event_type: str, data: Dict[str, Any]):
+        """在本进程内调用事件的所有处理函数"""
+        for handler in self._handlers.get(event_type, ()):
+            try:
+                result = handler(data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"广播总线事件处理失败: {event_type}: {e}")
+        self.delivered += 1
+
+    async def publish(self, event_type: str, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @property
+    def is_leader(self) -> bool:
+        """当前进程是否负责运行只能有一个执行者的任务（如倒计时）"""
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "instance_id": self.instance_id,
+            "is_leader": self.is_leader,
+            "published": self.published,
+            "delivered": self.delivered,
+            "failures": self.failures,
+            "resyncs": self.resyncs
+        }
+
+
+class LocalBackplane(Backplane):
+    """
+    进程内总线：发布的事件放入队列，由分发任务按发布顺序在本进程分发，
+    发布方（如投票请求）不等待处理函数执行完
+    """
+    name = "local"
+
+    def __init__(self):
+        super().__init__()
+        self._inbox: asyncio.Queue | None = None
+        self._dispatch_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 首次使用，或事件循环已更换（旧循环上的队列和任务都已不可用）
+            self._loop = loop
+            self._inbox = asyncio.Queue()
+            self._dispatch_task = None
+        if self._dispatch_task is None or self._dispatch_task.done():
+            self._dispatch_task = loop.create_task(self._dispatch_loop())
+
+    async def _dispatch_loop(self):
+        while True:
+            event = await self._inbox.get()
+            if event is None:
+                return
+            await self.dispatch(*event)
+
+    async def start(self):
+        self._ensure_dispatcher()
+
+    async def stop(self):
+        """分发完已发布的事件后停止分发任务"""
+        if self._dispatch_task is None or self._dispatch_task.done():
+            return
+        self._inbox.put_nowait(None)
+        await self._dispatch_task
+        self._dispatch_task = None
+
+    async def publish(self, event_type: str, data: Dict[str, Any]):
+        self.published += 1
+        self._ensure_dispatcher()
+        self._inbox.put_nowait((event_type, data))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **super().metrics(),
+            "pending": self._inbox.qsize() if self._inbox else 0
+        }
+
+
+class PostgresBackplane(Backplane):
+    """
+    基于 PostgreSQL LISTEN/NOTIFY 的总线
+
+    NOTIFY 的负载上限约 8000 字节，较大的事件（如结果揭晓）会被拆分为多段发送，
+    同一连接上的通知按发送顺序送达，接收方按消息ID重新拼接。
+    """
+    name = "postgres"
+    # 每段最多字符数（UTF-8 下最坏 4 字节/字符，留出分段头的空间）
+    CHUNK_CHARS = 1800
+    # 未当选 leader 时重新尝试获取 advisory lock 的间隔（秒）
+    ELECTION_INTERVAL = 5
+
+    def __init__(self, connect_kwargs: Dict[str, Any], channel: str, leader_lock_key: int):
+        super().__init__()
+        self.connect_kwargs = connect_kwargs
+        self.channel = channel
+        self.leader_lock_key = leader_lock_key
+        self._listen_conn = None
+        self._publish_conn = None
+        self._publish_lock = asyncio.Lock()
+        # 按到达顺序分发事件
+        self._inbox: asyncio.Queue | None = None
+        self._dispatch_task: asyncio.Task | None = None
+        self._election_task: asyncio.Task | None = None
+        # 分段消息拼接缓冲：消息ID -> 各段内容
+        self._partial: Dict[str, List[str | None]] = {}
+        self._leader = False
+        self._started = False
+
+    async def start(self):
+        import asyncpg
+
+        self._inbox = asyncio.Queue()
+        self._dispatch_task = asyncio.create_task(self._dispatch_loop())
+        await self._connect(asyncpg)
+        self._election_task = asyncio.create_task(self._election_loop(asyncpg))
+        self._started = True
+        print(f"广播总线已启动: postgres channel={self.channel} instance={self.instance_id}")
+
+    def _connected(self) -> bool:
+        return all(conn is not None and not conn.is_closed() for conn in (self._listen_conn, self._publish_conn))
+
+    async def _close_connections(self):
+        for conn in (self._listen_conn, self._publish_conn):
+            if conn is not None and not conn.is_closed():
+                # 关闭连接会同时释放 advisory lock
+                try:
+                    await conn.close()
+                except Exception:
+                    conn.terminate()
+        self._listen_conn = None
+        self._publish_conn = None
+
+    async def _connect(self, asyncpg):
+        """
+        （重新）建立监听和发布连接。任一连接断开都两者一起重建：
+        旧的监听连接可能仍持有 leader 锁，不关闭会导致没有进程能当选
+        """
+        await self._close_connections()
+        self._leader = False
+        self._partial.clear()
+        self._listen_conn = await asyncpg.connect(**self.connect_kwargs)
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+        self._publish_conn = await asyncpg.connect(**self.connect_kwargs)
+        # 断开期间的通知已经丢失，丢弃由事件维护的缓存
+        self.resync()
+
+    async def stop(self):
+        for task in (self._election_task, self._dispatch_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self._close_connections()
+        self._leader = False
+        self._started = False
+
+    @property
+    def is_leader(self) -> bool:
+        # 总线未启动（如启动失败）时退化为单进程行为
+        return self._leader if self._started else True
+
+    async def _election_loop(self, asyncpg):
+        while True:
+            try:
+                if not self._connected():
+                    print("广播总线连接已断开，正在重连")
+                    await self._connect(asyncpg)
+                if not self._leader:
+                    self._leader = await self._listen_conn.fetchval(
+                        "SELECT pg_try_advisory_lock($1)", self.leader_lock_key
+                    )
+                    if self._leader:
+                        print(f"当前进程成为广播总线 leader: {self.instance_id}")
+            except Exception as e:
+                self._leader = False
+                print(f"广播总线 leader 选举失败: {e}")
+            await asyncio.sleep(self.ELECTION_INTERVAL)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        try:
+            message_id, index, total, chunk = payload.split(":", 3)
+            index, total = int(index), int(total)
+        except ValueError:
+            return
+
+        if total == 1:
+            text = chunk
+        else:
+            parts = self._partial.setdefault(message_id, [None] * total)
+            parts[index] = chunk
+            if any(part is None for part in parts):
+                return
+            del self._partial[message_id]
+            text = "".join(parts)
+
+        event = json.loads(text)
+        self._inbox.put_nowait((event["type"], event["data"]))
+
+    async def _dispatch_loop(self):
+        while True:
+            event_type, data = await self._inbox.get()
+            await self.dispatch(event_type, data)
+
+    async def publish(self, event_type: str, data: Dict[str, Any]):
+        self.published += 1
+        if not self._started:
+            await self.dispatch(event_type, data)
+            return
+
+        text = json.dumps({"type": event_type, "data": data}, ensure_ascii=False, default=str)
+        chunks = [text[i:i + self.CHUNK_CHARS] for i in range(0, len(text), self.CHUNK_CHARS)] or [""]
+        message_id = uuid.uuid4().hex
+        try:
+            async with self._publish_lock:
+                if len(chunks) == 1:
+                    # 绝大多数事件只有一段，单条语句即可，不需要显式事务的额外往返
+                    await self._publish_conn.execute(
+                        "SELECT pg_notify($1, $2)",
+                        self.channel,
+                        f"{message_id}:0:1:{chunks[0]}"
+                    )
+                else:
+                    # 多段在同一事务中提交，保证各段连续送达
+                    async with self._publish_conn.transaction():
+                        for index, chunk in enumerate(chunks):
+                            await self._publish_conn.execute(
+                                "SELECT pg_notify($1, $2)",
+                                self.channel,
+                                f"{message_id}:{index}:{len(chunks)}:{chunk}"
+                            )
+        except Exception as e:
+            # 总线不可用时至少保证本进程的连接能收到
+            self.failures += 1
+            print(f"广播总线发布失败，仅在本进程分发: {event_type}: {e}")
+            await self.dispatch(event_type, data)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **super().metrics(),
+            "channel": self.channel,
+            "started": self._started,
+            "pending_chunks": len(self._partial)
+        }
+
+
+def create_backplane() -> Backplane:
+    """
+    根据 BROADCAST_BACKEND 创建总线；auto 时只有多 worker 才使用 postgres，
+    单 worker 不需要跨进程同步，避免每张选票多一次 NOTIFY 往返
+    """
+    backend = settings.BROADCAST_BACKEND
+    if backend == "auto":
+        backend = "postgres" if settings.UVICORN_WORKERS > 1 else "local"
+    if backend == "postgres":
+        return PostgresBackplane(
+            connect_kwargs={
+                "host": settings.DATABASE_HOST,
+                "port": settings.DATABASE_PORT,
+                "user": settings.DATABASE_USER,
+                "password": settings.DATABASE_PASSWORD,
+                "database": settings.DATABASE_NAME
+            },
+            channel=settings.BROADCAST_CHANNEL,
+            leader_lock_key=settings.BROADCAST_LEADER_LOCK_KEY
+        )
+    return LocalBackplane()
+
+
+# 模块级别的总线实例
+backplane = create_backplane()
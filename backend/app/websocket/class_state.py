@@ -0,0 +1,133 @@
+"""
+班级当前状态帧
+由经过本进程的状态广播（debate_update、STATE_UPDATE、state_update）和倒计时合并维护，
+编码结果缓存到下一次状态变化，新连接建立时直接发送，不访问数据库。
+"""
+from typing import Any, Dict
+
+from app.websocket.encoding import EncodedFrame
+
+
+# 合并进班级状态的消息类型
+CLASS_STATE_SOURCES = {"debate_update", "STATE_UPDATE", "state_update"}
+# progress 中的投票、评分计数，只发给大屏和管理员；voting_enabled 等开关所有角色都需要
+PROGRESS_COUNT_FIELDS = ("pre_voting_progress", "post_voting_progress", "judge_scoring_progress")
+
+
+def public_progress(progress: Any) -> Any:
+    """去掉计数后的进度信息，发给观众和评委"""
+    if not isinstance(progress, dict):
+        return progress
+    return {k: v for k, v in progress.items() if k not in PROGRESS_COUNT_FIELDS}
+
+
+class ClassStateFrames:
+    """每个班级的当前状态及其编码后的 CLASS_STATE 帧"""
+
+    def __init__(self, epoch: str):
+        self.epoch = epoch
+        self._states: Dict[int, Dict[str, Any]] = {}
+        # 最近一次改变状态的消息序号
+        self._seqs: Dict[int, int] = {}
+        # (class_id, 是否包含进度计数) -> 帧；观众和评委收到的帧不含计数
+        self._frames: Dict[tuple[int, bool], EncodedFrame] = {}
+        # 指标
+        self.builds = 0
+        self.hits = 0
+
+    def _state(self, class_id: int) -> Dict[str, Any]:
+        state = self._states.get(class_id)
+        if state is None:
+            state = self._states[class_id] = {
+                "class_id": class_id,
+                "stage": None,
+                "contest": None,
+                "voting_enabled": None,
+                "results_revealed": False,
+                "progress": None,
+                "current_team": None,
+                "snatch_slots_remaining": None,
+                "snatch_start_time": None,
+                "countdown_deadline": None,
+                "update_time": None
+            }
+        return state
+
+    def apply(self, class_id: int, message_type: str, data: Dict[str, Any], seq: int | None = None):
+        """把一条状态广播合并进班级状态；消息缺少的字段保持原值"""
+        if message_type not in CLASS_STATE_SOURCES:
+            return
+        state = self._state(class_id)
+
+        if message_type == "debate_update":
+            for field in ("stage", "contest", "voting_enabled", "results_revealed", "progress"):
+                if field in data:
+                    state[field] = data[field]
+        else:
+            stage = data.get("current_stage") or data.get("stage")
+            if stage is not None:
+                state["stage"] = stage
+            if "current_team" in data:
+                state["current_team"] = data["current_team"]
+            elif "current_team_id" in data:
+                state["current_team"] = {
+                    "id": data["current_team_id"],
+                    "name": data.get("current_team_name"),
+                    "topic": data.get("current_team_topic")
+                } if data["current_team_id"] else None
+            for field in ("snatch_slots_remaining", "snatch_start_time"):
+                if field in data:
+                    state[field] = data[field]
+
+        if data.get("update_time") is not None:
+            state["update_time"] = data["update_time"]
+        if seq is not None:
+            self._seqs[class_id] = seq
+        self._discard_frames(class_id)
+
+    def set_countdown_deadline(self, class_id: int, deadline: int | None):
+        state = self._state(class_id)
+        if state["countdown_deadline"] != deadline:
+            state["countdown_deadline"] = deadline
+            self._discard_frames(class_id)
+
+    def _discard_frames(self, class_id: int):
+        self._frames.pop((class_id, True), None)
+        self._frames.pop((class_id, False), None)
+
+    def frame(self, class_id: int, include_progress: bool = True) -> EncodedFrame | None:
+        """班级的 CLASS_STATE 帧；本进程还没有收到过该班级的状态时返回 None"""
+        state = self._states.get(class_id)
+        if state is None or state["stage"] is None:
+            return None
+        frame = self._frames.get((class_id, include_progress))
+        if frame is not None:
+            self.hits += 1
+            return frame
+        # 复制一份，之后的状态变化不会影响已经放入发送队列的帧
+        data = dict(state)
+        if not include_progress:
+            data["progress"] = public_progress(data["progress"])
+        frame = EncodedFrame({
+            "type": "CLASS_STATE",
+            "data": data,
+            "seq": self._seqs.get(class_id, 0),
+            "epoch": self.epoch
+        })
+        # 立即编码，之后各连接直接复用
+        frame.text
+        self._frames[(class_id, include_progress)] = frame
+        self.builds += 1
+        return frame
+
+    def clear(self, class_id: int):
+        self._states.pop(class_id, None)
+        self._seqs.pop(class_id, None)
+        self._discard_frames(class_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "classes": len(self._states),
+            "builds": self.builds,
+            "hits": self.hits
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable
+
+from fastapi import WebSocket
+
+from app.websocket.encoding import ENCODING_JSON, EncodedFrame
+
+
+# 慢连接被断开时使用的关闭码（1013: Try Again Later）
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# 发送失败后关闭连接使用的关闭码（1011: Internal Error）
+SEND_FAILED_CLOSE_CODE = 1011
+# 清理半开连接时使用的关闭码（1001: Going Away）
+SWEPT_CLOSE_CODE = 1001
+
+
+class OutboundMessage:
+    """待发送的消息"""
+    __slots__ = ("frame", "key", "enqueued_at")
+
+    def __init__(self, frame: EncodedFrame, key: str | None):
+        self.frame = frame
+        self.key = key
+        self.enqueued_at = time.perf_counter()
+
+
+class ClientConnection:
+    """
+    单个 WebSocket 连接的发送队列
+
+    广播只把消息放入队列，由每个连接自己的写协程依次发送，一个卡住的连接不会拖慢其他连接。
+    队列有上限：带 key 的消息（如倒计时、投票进度、状态快照）只保留最新一条；
+    队列满时丢弃最旧的消息；若此时当前这条消息已经发送了超过 stall_timeout 秒仍未完成，
+    说明客户端已经跟不上，直接断开该连接。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        class_id: int | None,
+        max_queue: int,
+        stall_timeout: float,
+        on_close: Callable[["ClientConnection"], None],
+        encoding: str = ENCODING_JSON,
+        role: str | None = None
+    ):
+        self.websocket = websocket
+        self.class_id = class_id
+        self.role = role
+        self.max_queue = max_queue
+        self.stall_timeout = stall_timeout
+        self.on_close = on_close
+        self.encoding = encoding
+        self.connected_at = time.time()
+        self.closed = False
+        self._queue: deque[OutboundMessage] = deque()
+        self._keyed: dict[str, OutboundMessage] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # 当前正在发送的消息开始发送的时间，空闲时为 None
+        self._sending_since: float | None = None
+        # 最近一次收到客户端消息的时间（monotonic），从未收到过时为 None
+        self.last_seen: float | None = None
+        # 指标
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, frame: EncodedFrame, key: str | None = None) -> bool:
+        """放入一条消息，不等待发送；连接已关闭时返回 False"""
+        if self.closed:
+            return False
+
+        if key is not None:
+            pending = self._keyed.pop(key, None)
+            if pending is not None:
+                # 同类消息还没发出去，丢弃旧的，新消息排到队尾以保持顺序
+                self._queue.remove(pending)
+                self.coalesced += 1
+
+        if len(self._queue) >= self.max_queue:
+            oldest = self._queue.popleft()
+            if oldest.key is not None:
+                self._keyed.pop(oldest.key, None)
+            self.dropped += 1
+            if self.stalled_seconds > self.stall_timeout:
+                print(f"WebSocket 连接消费过慢，已断开: class_id={self.class_id} dropped={self.dropped}")
+                self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+                return False
+
+        message = OutboundMessage(frame, key)
+        self._queue.append(message)
+        if key is not None:
+            self._keyed[key] = message
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                message = self._queue.popleft()
+                if message.key is not None:
+                    self._keyed.pop(message.key, None)
+
+                data = message.frame.encode_for(self.encoding)
+                self._sending_since = time.perf_counter()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                self._sending_since = None
+
+                lag_ms = (time.perf_counter() - message.enqueued_at) * 1000
+                self.sent += 1
+                self.last_lag_ms = lag_ms
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送失败说明连接已不可用，立即移除并关闭
+            self.close(code=SEND_FAILED_CLOSE_CODE)
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    @property
+    def stalled_seconds(self) -> float:
+        """当前这条消息已经发送了多久，空闲时为 0"""
+        if self._sending_since is None:
+            return 0.0
+        return time.perf_counter() - self._sending_since
+
+    def close(self, code: int | None = None):
+        """停止写协程并通知管理器移除该连接；传入 code 时同时关闭底层 socket"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+        self.on_close(self)
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=5)
+        except Exception:
+            pass
+
+    def metrics(self) -> dict:
+        return {
+            "class_id": self.class_id,
+            "role": self.role,
+            "encoding": self.encoding,
+            "connected_seconds": int(time.time() - self.connected_at),
+            "idle_seconds": round(time.monotonic() - self.last_seen, 2) if self.last_seen is not None else None,
+            "queue_depth": len(self._queue),
+            "stalled_seconds": round(self.stalled_seconds, 2),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2)
+        }
@@ -0,0 +1,86 @@
+"""
+WebSocket 消息编码
+每条广播只构造一次 EncodedFrame，各连接共享同一份编码结果：
+JSON 文本在第一次被取用时编码一次，MessagePack 二进制同理。
+安装了 orjson 时使用 orjson 编码 JSON；客户端通过 /ws?encoding=msgpack 协商二进制帧（需要安装 msgpack）。
+"""
+import hashlib
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj: Any) -> str:
+    """编码为 JSON 文本"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
+
+
+def negotiate_encoding(requested: str | None) -> str:
+    """根据客户端请求的编码返回实际使用的编码，不支持时回退为 JSON"""
+    if requested == ENCODING_MSGPACK and msgpack is not None:
+        return ENCODING_MSGPACK
+    return ENCODING_JSON
+
+
+class EncodedFrame:
+    """一条待发送的消息及其各编码格式的缓存"""
+    __slots__ = ("payload", "_text", "_binary", "_digest")
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+        self._text: str | None = payload if isinstance(payload, str) else None
+        self._binary: bytes | None = None
+        self._digest: bytes | None = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self.payload)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = msgpack.packb(self.payload, default=str)
+        return self._binary
+
+    @property
+    def digest(self) -> bytes:
+        """内容摘要，用于跳过与上一条完全相同的状态消息"""
+        if self._digest is None:
+            self._digest = hashlib.blake2b(self.text.encode(), digest_size=16).digest()
+        return self._digest
+
+    def extend(self, **fields: Any) -> "EncodedFrame":
+        """
+        追加字段（如 seq、epoch）得到新帧；本帧的 JSON 文本已经编码过时直接在末尾拼接新字段，
+        不重新编码整条消息
+        """
+        frame = EncodedFrame({**self.payload, **fields})
+        text = self._text
+        if text is not None and len(text) > 2 and text.endswith("}") and not any(key in self.payload for key in fields):
+            frame._text = text[:-1] + "".join(f",{dumps(key)}:{dumps(value)}" for key, value in fields.items()) + "}"
+        return frame
+
+    def encode_for(self, encoding: str) -> str | bytes:
+        """按连接协商的编码返回要发送的数据；纯文本消息（如 pong）始终按文本发送"""
+        if encoding == ENCODING_MSGPACK and not isinstance(self.payload, str):
+            return self.binary
+        return self.text
@@ -1,48 +1,394 @@
 
-import json
 import asyncio
+import math
+import time
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict, List, Callable, Awaitable
+from starlette.websockets import WebSocketState
+from typing import Dict, Set, Callable, Awaitable
+
+from app.config import settings
+from app.services.deadline_scheduler import deadline_scheduler
+from app.websocket.backplane import Backplane, backplane
+from app.websocket.class_state import ClassStateFrames, public_progress
+from app.websocket.connection import ClientConnection, SWEPT_CLOSE_CODE
+from app.websocket.encoding import EncodedFrame, JSON_BACKEND, negotiate_encoding
+
+
+# 只需要最新值的消息类型：同一连接上尚未发出的旧消息直接被新消息替换
+COALESCED_MESSAGE_TYPES = {"TIMER_UPDATE", "STATE_UPDATE", "SCORE_PROGRESS", "IMPORT_PROGRESS", "debate_update"}
+# 完整状态类消息：与该班级上一条同类消息内容完全相同时不再广播
+STATE_MESSAGE_TYPES = {"state_update", "debate_update", "STATE_UPDATE", "SCORE_PROGRESS"}
+
+# 订阅角色：每个连接按 (class_id, 角色) 订阅，角色由连接时携带的 token 决定，未登录的连接视为大屏
+ROLE_SCREEN = "screen"
+ROLE_AUDIENCE = "audience"
+ROLE_JUDGE = "judge"
+ROLE_ADMIN = "admin"
+ALL_ROLES = (ROLE_SCREEN, ROLE_AUDIENCE, ROLE_JUDGE, ROLE_ADMIN)
+# 只发给部分角色的消息类型，未列出的类型发给班级内所有角色
+MESSAGE_ROLES = {
+    "IMPORT_PROGRESS": (ROLE_ADMIN,),
+    "SCORE_PROGRESS": (ROLE_SCREEN, ROLE_ADMIN),
+    "vote_progress": (ROLE_SCREEN, ROLE_ADMIN)
+}
+# 可以看到进度计数的角色，其他角色收到的消息中 progress 只保留投票开关等字段
+PROGRESS_ROLES = (ROLE_SCREEN, ROLE_ADMIN)
+
+
+def connection_role(user_role: str | None) -> str:
+    """根据用户角色确定订阅角色；未携带 token 的连接（大屏）为 screen"""
+    if user_role is None:
+        return ROLE_SCREEN
+    if user_role == "admin":
+        return ROLE_ADMIN
+    if user_role in ("judge", "teacher"):
+        return ROLE_JUDGE
+    return ROLE_AUDIENCE
 
 
 class ConnectionManager:
     """WebSocket 连接管理器 - 支持按班级隔离"""
     
     def __init__(self):
-        # 存储所有活跃连接：class_id -> list[WebSocket]
-        self.active_connections: dict[int, list[WebSocket]] = {}
-        # 存储倒计时任务：class_id -> asyncio.Task
-        self.countdown_tasks: dict[int, asyncio.Task] = {}
-        # 存储当前倒计时数值：class_id -> int
-        self.current_countdowns: dict[int, int] = {}
-        # 不指定班级的全局连接（用于大屏等）
-        self.global_connections: List[WebSocket] = []
-        # 倒计时结束回调：class_id -> callback
-        self.countdown_callbacks: dict[int, Callable[[int], Awaitable[None]]] = {}
+        # 存储所有活跃连接：class_id -> set[WebSocket]
+        self.active_connections: dict[int, Set[WebSocket]] = {}
+        # 按订阅主题划分的连接：(class_id, 角色) -> set[WebSocket]，广播只发给目标主题
+        self.topics: dict[tuple[int, str], Set[WebSocket]] = {}
+        # 当前倒计时的截止时间：class_id -> 服务器时间戳（毫秒）
+        self.countdown_deadlines: dict[int, int] = {}
+        # 尚未选择班级的连接，通过 SUBSCRIBE 消息加入某个班级后才会收到广播
+        self.global_connections: Set[WebSocket] = set()
+        # 倒计时结束回调：名称 -> callback。倒计时由 leader 进程执行，回调按名称注册，各进程一致
+        self.countdown_handlers: dict[str, Callable[[int], Awaitable[None]]] = {}
+        # 每个连接的发送队列：WebSocket -> ClientConnection
+        self.connections: dict[WebSocket, ClientConnection] = {}
+        # 因消费过慢或发送失败被移除的连接数
+        self.evicted_connections = 0
+        # 清理半开连接的后台任务
+        self.sweeper_task: asyncio.Task | None = None
+        self.swept_connections = 0
+        # 每个班级上一条状态消息的内容摘要：(消息类型, class_id) -> digest
+        self.last_state_digests: dict[tuple[str, int | None], bytes] = {}
+        # 班级消息序号：每个 worker 进程独立编号，epoch 标识当前进程，重连到其他进程时无法补发
+        self.epoch = backplane.instance_id
+        self.class_seq: dict[int, int] = {}
+        # 最近的班级消息，用于断线重连后补发：class_id -> deque[(seq, {角色: frame})]
+        self.replay_buffers: dict[int, deque[tuple[int, dict[str, EncodedFrame]]]] = {}
+        # 每个班级的当前状态帧：新连接建立时发送，补发不了时作为快照
+        self.class_states = ClassStateFrames(self.epoch)
+        # 重连指标
+        self.resumes_replayed = 0
+        self.resumes_snapshot = 0
+        self.resumes_reset = 0
+        # 编码指标
+        self.frames_encoded = 0
+        self.duplicate_states_skipped = 0
+        # 待广播的投票进度：contest_id -> (class_id, total_votes)，只保留最新值
+        self.pending_progress: dict[int, tuple[int, int]] = {}
+        self.progress_task: asyncio.Task | None = None
+        # 投票进度广播间隔，限制在 200~500 毫秒
+        self.progress_interval = min(max(settings.VOTE_PROGRESS_INTERVAL_MS, 200), 500) / 1000
+        # 投票进度指标
+        self.progress_marks = 0
+        self.progress_broadcasts = 0
+        self.progress_coalesced = 0
     
     def get_countdown(self, class_id: int) -> int | None:
-        """获取指定班级当前的倒计时值"""
-        return self.current_countdowns.get(class_id)
+        """获取指定班级当前的倒计时剩余秒数"""
+        deadline = self.countdown_deadlines.get(class_id)
+        if deadline is None:
+            return None
+        return max(0, math.ceil((deadline - time.time() * 1000) / 1000))
     
-    async def connect(self, websocket: WebSocket, class_id: int | None = None):
-        """连接 WebSocket"""
+    async def connect(
+        self,
+        websocket: WebSocket,
+        class_id: int | None = None,
+        encoding: str | None = None,
+        resume_from: int | None = None,
+        epoch: str | None = None,
+        role: str = ROLE_SCREEN
+    ):
+        """
+        连接 WebSocket；encoding 为客户端请求的帧编码（json 或 msgpack），
+        role 为订阅角色，连接只收到发给 (class_id, role) 主题的消息
+
+        新连接先收到班级当前状态（CLASS_STATE，不访问数据库）；
+        重连的客户端传入上次收到的 seq 和 epoch，服务端补发之后的消息，
+        缺口超出缓冲区（或 epoch 不一致）时改为发送当前状态快照。
+        """
         await websocket.accept()
-        if class_id is not None:
-            if class_id not in self.active_connections:
-                self.active_connections[class_id] = []
-            self.active_connections[class_id].append(websocket)
+        connection = ClientConnection(
+            websocket,
+            class_id,
+            max_queue=settings.WS_SEND_QUEUE_SIZE,
+            stall_timeout=settings.WS_SLOW_CLIENT_TIMEOUT_SECONDS,
+            on_close=self._on_connection_closed,
+            encoding=negotiate_encoding(encoding),
+            role=role
+        )
+        self.connections[websocket] = connection
+        connection.start()
+        self._ensure_sweeper()
+        if class_id is None:
+            self.global_connections.add(websocket)
+            return
+        self._join(connection, class_id)
+        if resume_from is not None:
+            self._resume(connection, class_id, resume_from, epoch)
         else:
-            self.global_connections.append(websocket)
+            for frame in self._snapshot_frames(class_id, role):
+                connection.enqueue(frame)
+    
+    def _join(self, connection: ClientConnection, class_id: int):
+        connection.class_id = class_id
+        self.active_connections.setdefault(class_id, set()).add(connection.websocket)
+        self.topics.setdefault((class_id, connection.role), set()).add(connection.websocket)
+    
+    def _leave(self, websocket: WebSocket, class_id: int, role: str | None):
+        for key, sockets in ((class_id, self.active_connections), ((class_id, role), self.topics)):
+            members = sockets.get(key)
+            if members is not None:
+                members.discard(websocket)
+                if not members:
+                    del sockets[key]
+    
+    def subscribe(self, websocket: WebSocket, class_id: int):
+        """连接选择（或切换）要接收的班级，随后发送该班级的当前状态"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        if connection.class_id is not None:
+            self._leave(websocket, connection.class_id, connection.role)
+        self.global_connections.discard(websocket)
+        self._join(connection, class_id)
+        for frame in self._snapshot_frames(class_id, connection.role):
+            connection.enqueue(frame)
+    
+    def _snapshot_frames(self, class_id: int, role: str) -> list[EncodedFrame]:
+        """班级当前状态帧，倒计时进行中时附带一条最新的 TIMER_UPDATE"""
+        frame = self.class_states.frame(class_id, include_progress=role in PROGRESS_ROLES)
+        if frame is None:
+            return []
+        frames = [frame]
+        deadline = self.countdown_deadlines.get(class_id)
+        if deadline is not None:
+            frames.append(EncodedFrame(self._timer_message(class_id, deadline)))
+        return frames
+    
+    def _resume(self, connection: ClientConnection, class_id: int, resume_from: int, epoch: str | None):
+        """向重连的客户端补发错过的消息，最后发送 RESUME 说明补发方式"""
+        current = self.class_seq.get(class_id, 0)
+        buffer = self.replay_buffers.get(class_id, ())
+        oldest = buffer[0][0] if buffer else current + 1
+        if epoch == self.epoch and oldest - 1 <= resume_from <= current:
+            # 缓冲区覆盖了缺口，逐条补发该角色能收到的消息
+            frames = [
+                frames_by_role[connection.role]
+                for seq, frames_by_role in buffer
+                if seq > resume_from and connection.role in frames_by_role
+            ]
+            mode = "replay"
+            self.resumes_replayed += 1
+        else:
+            # 缺口太大：改为发送当前状态；本进程还没有该班级的状态时客户端需要重新拉取
+            frames = self._snapshot_frames(class_id, connection.role)
+            mode = "snapshot" if frames else "reset"
+            if frames:
+                self.resumes_snapshot += 1
+            else:
+                self.resumes_reset += 1
+        for frame in frames:
+            connection.enqueue(frame)
+        connection.enqueue(EncodedFrame({
+            "type": "RESUME",
+            "data": {"mode": mode, "frames": len(frames), "seq": current, "epoch": self.epoch}
+        }))
     
     def disconnect(self, websocket: WebSocket, class_id: int | None = None):
         """断开 WebSocket 连接"""
-        if class_id is not None:
-            if class_id in self.active_connections:
-                if websocket in self.active_connections[class_id]:
-                    self.active_connections[class_id].remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            connection.close()
+            # 连接可能通过 SUBSCRIBE 切换过班级，以连接当前的班级为准
+            class_id = connection.class_id
+            roles = (connection.role,)
         else:
-            if websocket in self.global_connections:
-                self.global_connections.remove(websocket)
+            roles = ALL_ROLES
+        self.global_connections.discard(websocket)
+        if class_id is not None:
+            for role in roles:
+                self._leave(websocket, class_id, role)
+    
+    def touch(self, websocket: WebSocket):
+        """收到客户端消息（包括心跳）时调用，记录连接仍然存活"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.touch()
+    
+    def _on_connection_closed(self, connection: ClientConnection):
+        """连接的写协程因消费过慢或发送失败而停止时，从管理器中移除"""
+        if self.connections.get(connection.websocket) is connection:
+            self.evicted_connections += 1
+            self.disconnect(connection.websocket, connection.class_id)
+    
+    def _fanout(self, websockets, frame: EncodedFrame, key: str | None = None):
+        """把同一个消息帧放入每个连接的发送队列，不等待发送；各编码格式只编码一次"""
+        # 入队时可能因慢连接被移除而修改集合，先取快照
+        for websocket in tuple(websockets):
+            connection = self.connections.get(websocket)
+            if connection is not None:
+                connection.enqueue(frame, key)
+    
+    def _encode(self, message: dict) -> EncodedFrame:
+        self.frames_encoded += 1
+        return EncodedFrame(message)
+    
+    def _role_frames(self, message: dict, base: EncodedFrame | None = None, **fields) -> dict[str, EncodedFrame]:
+        """
+        按角色编码消息：只发给部分角色的类型只为这些角色编码；
+        带 progress 的消息为其他角色去掉其中的计数，同一内容的角色共享同一个帧
+
+        base 为已经编码过的 message（如用于去重摘要的帧），fields（如 seq、epoch）追加在其后，不再重新编码
+        """
+        roles = MESSAGE_ROLES.get(message.get("type"), ALL_ROLES)
+        data = message.get("data")
+        full = base or self._encode(message)
+        if fields:
+            full = full.extend(**fields)
+        if not isinstance(data, dict) or "progress" not in data or all(role in PROGRESS_ROLES for role in roles):
+            return {role: full for role in roles}
+        public = self._encode({**message, "data": {**data, "progress": public_progress(data["progress"])}, **fields})
+        return {role: full if role in PROGRESS_ROLES else public for role in roles}
+    
+    def _prepare_class_frame(self, class_id: int | None, message: dict) -> dict[str, EncodedFrame] | None:
+        """
+        为班级消息分配序号并按角色编码，同时写入补发缓冲区；
+        状态消息与该班级上一条同类消息内容相同、或没有班级时返回 None
+        """
+        message_type = message.get("type")
+        if class_id is None:
+            return None
+        # 去重摘要和发送的帧共用同一次编码，seq/epoch 拼接在编码结果之后
+        base = self._encode(message)
+        if message_type in STATE_MESSAGE_TYPES and self._is_duplicate_state(message_type, class_id, base):
+            return None
+
+        seq = self.class_seq.get(class_id, 0) + 1
+        self.class_seq[class_id] = seq
+        frames = self._role_frames(message, base, seq=seq, epoch=self.epoch)
+        buffer = self.replay_buffers.get(class_id)
+        if buffer is None:
+            buffer = self.replay_buffers[class_id] = deque(maxlen=settings.WS_REPLAY_BUFFER_SIZE)
+        buffer.append((seq, frames))
+        self.class_states.apply(class_id, message_type, message.get("data") or {}, seq)
+        return frames
+    
+    def _fanout_class(self, class_id: int, frames: dict[str, EncodedFrame], key: str | None = None):
+        """把各角色的帧放入 (class_id, 角色) 主题下每个连接的发送队列"""
+        for role, frame in frames.items():
+            sockets = self.topics.get((class_id, role))
+            if sockets:
+                self._fanout(sockets, frame, key)
+    
+    def _is_duplicate_state(self, message_type: str, class_id: int | None, frame: EncodedFrame) -> bool:
+        """状态消息与该班级上一条同类消息内容相同时返回 True，否则记录新的摘要"""
+        digest_key = (message_type, class_id)
+        if self.last_state_digests.get(digest_key) == frame.digest:
+            self.duplicate_states_skipped += 1
+            return True
+        self.last_state_digests[digest_key] = frame.digest
+        return False
+    
+    def _ensure_sweeper(self):
+        if self.sweeper_task is None or self.sweeper_task.done():
+            self.sweeper_task = asyncio.create_task(self._sweeper())
+    
+    async def _sweeper(self):
+        """定期清理半开连接，没有连接时退出，下次有连接时重新启动"""
+        while self.connections:
+            await asyncio.sleep(settings.WS_SWEEP_INTERVAL_SECONDS)
+            self.sweep()
+    
+    def sweep(self) -> int:
+        """
+        移除已经失效的连接，返回移除数量
+
+        - 底层 socket 已处于断开状态
+        - 单条消息发送卡住超过慢连接阈值
+        - 客户端发送过心跳，但超过 WS_IDLE_TIMEOUT_SECONDS 没有再收到任何消息
+          （大屏等从不发送心跳的连接不按空闲时间判断）
+        """
+        now = time.monotonic()
+        swept = 0
+        for connection in list(self.connections.values()):
+            websocket = connection.websocket
+            disconnected = (
+                getattr(websocket, "client_state", None) == WebSocketState.DISCONNECTED
+                or getattr(websocket, "application_state", None) == WebSocketState.DISCONNECTED
+            )
+            stalled = connection.stalled_seconds > connection.stall_timeout
+            idle = (
+                connection.last_seen is not None
+                and now - connection.last_seen > settings.WS_IDLE_TIMEOUT_SECONDS
+            )
+            if disconnected or stalled or idle:
+                swept += 1
+                connection.close(code=None if disconnected else SWEPT_CLOSE_CODE)
+        self.swept_connections += swept
+        return swept
+    
+    async def stop_sweeper(self):
+        if self.sweeper_task is not None and not self.sweeper_task.done():
+            self.sweeper_task.cancel()
+            try:
+                await self.sweeper_task
+            except asyncio.CancelledError:
+                pass
+        self.sweeper_task = None
+    
+    def connection_gauges(self) -> dict:
+        """各班级当前的连接数"""
+        return {
+            "total": len(self.connections),
+            "global": len(self.global_connections),
+            "by_class": {class_id: len(sockets) for class_id, sockets in self.active_connections.items()},
+            "by_topic": {f"{class_id}:{role}": len(sockets) for (class_id, role), sockets in self.topics.items()}
+        }
+    
+    def send_personal(self, websocket: WebSocket, message: dict | str):
+        """向单个连接发送消息（经过该连接的发送队列）"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.enqueue(EncodedFrame(message))
+    
+    def connection_metrics(self) -> dict:
+        """每个连接的队列深度、丢弃数和发送延迟"""
+        return {
+            **self.connection_gauges(),
+            "evicted": self.evicted_connections,
+            "swept": self.swept_connections,
+            "json_backend": JSON_BACKEND,
+            "frames_encoded": self.frames_encoded,
+            "duplicate_states_skipped": self.duplicate_states_skipped,
+            "class_states": self.class_states.metrics(),
+            "resumes": {
+                "replayed": self.resumes_replayed,
+                "snapshot": self.resumes_snapshot,
+                "reset": self.resumes_reset
+            },
+            "connections": [connection.metrics() for connection in self.connections.values()]
+        }
+    
+    def subscribe_to(self, bus: Backplane):
+        """订阅广播总线：其他 worker（以及本进程）发布的广播都在这里分发给本进程的连接"""
+        bus.subscribe("ws.state_update", self._deliver_state_update)
+        bus.subscribe("ws.class_message", self._deliver_to_class)
+        bus.subscribe("ws.debate_update", self._deliver_debate_update)
+        bus.subscribe("ws.results_reveal", self._deliver_results_reveal)
+        bus.subscribe("ws.countdown_start", self._on_countdown_start)
+        bus.subscribe("ws.countdown_stop", self._on_countdown_stop)
     
     async def broadcast_state_update(
         self, 
@@ -58,7 +404,7 @@ class ConnectionManager:
         update_time: int | None = None
     ):
         """广播系统状态更新"""
-        message = json.dumps({
+        await backplane.publish("ws.state_update", {
             "type": "state_update",
             "data": {
                 "stage": stage,
@@ -73,104 +419,120 @@ class ConnectionManager:
                 "update_time": update_time
             }
         })
+    
+    def _deliver_state_update(self, message: dict):
+        class_id = message["data"]["class_id"]
+        frames = self._prepare_class_frame(class_id, message)
+        if frames is None:
+            return
         
         # 发送到指定班级的连接
-        if class_id is not None and class_id in self.active_connections:
-            for connection in self.active_connections[class_id]:
-                try:
-                    await connection.send_text(message)
-                except Exception:
-                    pass
-        
-        # 发送到全局连接
-        for connection in self.global_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                pass
+        self._fanout_class(class_id, frames, key="state_update")
     
     async def broadcast_to_class(self, class_id: int, message: dict):
         """向指定班级广播消息"""
-        if class_id not in self.active_connections:
+        await backplane.publish("ws.class_message", {"class_id": class_id, "message": message})
+    
+    def _deliver_to_class(self, data: dict):
+        class_id, message = data["class_id"], data["message"]
+        # 即使班级当前没有连接也要编号并缓存，整个场馆断网重连后才能补发
+        frames = self._prepare_class_frame(class_id, message)
+        if frames is None:
             return
-        
-        text = json.dumps(message)
-        for connection in self.active_connections[class_id]:
-            try:
-                await connection.send_text(text)
-            except Exception:
-                pass
-        
-        # 同时广播到全局连接
-        for connection in self.global_connections:
-            try:
-                await connection.send_text(text)
-            except Exception:
-                pass
+        message_type = message.get("type")
+        key = message_type if message_type in COALESCED_MESSAGE_TYPES else None
+        self._fanout_class(class_id, frames, key=key)
 
-    async def _countdown_task(self, class_id: int):
-        """倒计时协程"""
-        while True:
-            remaining = self.current_countdowns.get(class_id, 0)
-            if remaining < 0:
-                self._cleanup_countdown(class_id)
-                break
-            
-            # 广播当前倒计时
-            await self.broadcast_to_class(class_id, {
-                "type": "TIMER_UPDATE",
-                "data": {
-                    "countdown": remaining
-                }
-            })
-            
-            if remaining == 0:
-                # 倒计时结束，触发回调
-                callback = self.countdown_callbacks.get(class_id)
-                self._cleanup_countdown(class_id)
-                if callback:
-                    try:
-                        await callback(class_id)
-                    except Exception as e:
-                        print(f"倒计时回调执行失败: {e}")
-                break
-                
-            await asyncio.sleep(1)
-            self.current_countdowns[class_id] -= 1
-
-    def _cleanup_countdown(self, class_id: int):
-        """清理倒计时相关资源"""
-        if class_id in self.countdown_tasks:
-            del self.countdown_tasks[class_id]
-        if class_id in self.current_countdowns:
-            del self.current_countdowns[class_id]
-        if class_id in self.countdown_callbacks:
-            del self.countdown_callbacks[class_id]
-
-    def start_countdown(self, class_id: int, duration: int = 30, on_complete: Callable[[int], Awaitable[None]] | None = None):
-        """开始倒计时"""
-        # 如果已有任务在运行，先停止
-        self.stop_countdown(class_id)
-        
-        self.current_countdowns[class_id] = duration
-        if on_complete:
-            self.countdown_callbacks[class_id] = on_complete
-        # 创建新的后台任务
-        task = asyncio.create_task(self._countdown_task(class_id))
-        self.countdown_tasks[class_id] = task
-
-    def stop_countdown(self, class_id: int):
+    def register_countdown_handler(self, name: str, handler: Callable[[int], Awaitable[None]]):
+        """注册倒计时结束回调，start_countdown 通过名称引用"""
+        self.countdown_handlers[name] = handler
+
+    async def start_countdown(self, class_id: int, duration: int = 30, on_complete: str | None = None) -> int:
+        """
+        开始倒计时；on_complete 为 register_countdown_handler 注册的回调名称
+
+        只广播一次带截止时间的 TIMER_UPDATE，客户端按截止时间在本地倒数，
+        之后每 TIMER_RESYNC_SECONDS 秒校准一次，到期时发送 countdown=0。
+
+        Returns:
+            int: 截止时间（毫秒时间戳），可与 countdown_deadlines 对比判断倒计时是否仍是这一次
+        """
+        deadline = int(time.time() * 1000) + duration * 1000
+        await backplane.publish("ws.countdown_start", {
+            "class_id": class_id,
+            "deadline": deadline,
+            "on_complete": on_complete
+        })
+        return deadline
+
+    async def stop_countdown(self, class_id: int):
         """停止倒计时"""
-        if class_id in self.countdown_tasks:
-            task = self.countdown_tasks[class_id]
-            task.cancel()
-            del self.countdown_tasks[class_id]
-        
-        if class_id in self.current_countdowns:
-            del self.current_countdowns[class_id]
-        
-        if class_id in self.countdown_callbacks:
-            del self.countdown_callbacks[class_id]
+        await backplane.publish("ws.countdown_stop", {"class_id": class_id})
+
+    def _timer_message(self, class_id: int, deadline: int) -> dict:
+        now = int(time.time() * 1000)
+        return {
+            "type": "TIMER_UPDATE",
+            "data": {
+                "countdown": max(0, math.ceil((deadline - now) / 1000)),
+                # 客户端用 server_time 估算本地时钟偏差，再按 deadline 本地倒数
+                "deadline": deadline,
+                "server_time": now
+            }
+        }
+
+    def _cancel_countdown(self, class_id: int):
+        deadline_scheduler.cancel(f"countdown:{class_id}")
+        deadline_scheduler.cancel(f"countdown_resync:{class_id}")
+        self.countdown_deadlines.pop(class_id, None)
+        self.class_states.set_countdown_deadline(class_id, None)
+
+    def _on_countdown_start(self, data: dict):
+        class_id, deadline = data["class_id"], data["deadline"]
+        # 如果已有倒计时，先停止
+        self._cancel_countdown(class_id)
+        self.countdown_deadlines[class_id] = deadline
+        self.class_states.set_countdown_deadline(class_id, deadline)
+        self._deliver_to_class({"class_id": class_id, "message": self._timer_message(class_id, deadline)})
+
+        # 截止时间换算为事件循环的单调时钟，不受系统时间调整影响
+        remaining = max(0.0, (deadline - time.time() * 1000) / 1000)
+        deadline_scheduler.schedule_in(
+            f"countdown:{class_id}",
+            remaining,
+            lambda: self._complete_countdown(class_id, deadline, data.get("on_complete"))
+        )
+        self._schedule_resync(class_id, deadline)
+
+    def _schedule_resync(self, class_id: int, deadline: int):
+        interval = settings.TIMER_RESYNC_SECONDS
+        if interval > 0 and (deadline - time.time() * 1000) / 1000 > interval:
+            deadline_scheduler.schedule_in(
+                f"countdown_resync:{class_id}",
+                interval,
+                lambda: self._resync_countdown(class_id, deadline)
+            )
+
+    def _resync_countdown(self, class_id: int, deadline: int):
+        if self.countdown_deadlines.get(class_id) != deadline:
+            return
+        self._deliver_to_class({"class_id": class_id, "message": self._timer_message(class_id, deadline)})
+        self._schedule_resync(class_id, deadline)
+
+    def _complete_countdown(self, class_id: int, deadline: int, on_complete: str | None):
+        """到达截止时间：每个 worker 通知本进程的连接，只有 leader 执行结束回调"""
+        if self.countdown_deadlines.get(class_id) != deadline:
+            return None
+        self._cancel_countdown(class_id)
+        self._deliver_to_class({"class_id": class_id, "message": self._timer_message(class_id, deadline)})
+
+        callback = self.countdown_handlers.get(on_complete) if on_complete else None
+        if callback and backplane.is_leader:
+            return callback(class_id)
+        return None
+
+    def _on_countdown_stop(self, data: dict):
+        self._cancel_countdown(data["class_id"])
 
     async def broadcast_debate_update(
         self,
@@ -183,7 +545,7 @@ class ConnectionManager:
         update_time: int
     ):
         """广播辩论状态更新"""
-        message = json.dumps({
+        await backplane.publish("ws.debate_update", {
             "type": "debate_update",
             "data": {
                 "stage": stage,
@@ -195,25 +557,23 @@ class ConnectionManager:
                 "update_time": update_time
             }
         })
+    
+    def _deliver_debate_update(self, message: dict):
+        class_id = message["data"]["class_id"]
+        frames = self._prepare_class_frame(class_id, message)
+        if frames is None:
+            return
         
-        # 发送到指定班级的连接
-        if class_id in self.active_connections:
-            for connection in self.active_connections[class_id]:
-                try:
-                    await connection.send_text(message)
-                except Exception:
-                    pass
-        
-        # 发送到全局连接（大屏等）
-        for connection in self.global_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                pass
+        # 发送到指定班级的连接，进度信息只发给管理端和大屏
+        self._fanout_class(class_id, frames, key="debate_update")
 
     async def broadcast_vote_progress(self, class_id: int, total_votes: int, contest_id: int):
-        """广播投票进度更新（不显示具体分布）"""
-        message = json.dumps({
+        """
+        广播投票进度更新（不显示具体分布）
+
+        不经过广播总线：每个 worker 都通过 vote_recorded 事件维护完整的计数，只发送给本进程的连接。
+        """
+        frames = self._role_frames({
             "type": "vote_progress",
             "data": {
                 "total_votes": total_votes,
@@ -222,37 +582,80 @@ class ConnectionManager:
             }
         })
         
-        # 只发送到全局连接（大屏显示）
-        for connection in self.global_connections:
+        # 只发送给该班级的大屏和管理端
+        self._fanout_class(class_id, frames, key=f"vote_progress:{contest_id}")
+
+    def mark_vote_progress(self, class_id: int, total_votes: int, contest_id: int):
+        """
+        记录比赛的最新投票进度，由定时任务合并后统一广播
+
+        同步执行，调用方不等待任何发送；两次广播之间的多次更新只发送最后一次。
+        """
+        if contest_id in self.pending_progress:
+            self.progress_coalesced += 1
+        self.pending_progress[contest_id] = (class_id, total_votes)
+        self.progress_marks += 1
+        if self.progress_task is None or self.progress_task.done():
+            self.progress_task = asyncio.create_task(self._progress_ticker())
+
+    async def _progress_ticker(self):
+        """投票进度广播协程，没有待广播的进度时退出，下次标记时重新启动"""
+        while self.pending_progress:
+            await asyncio.sleep(self.progress_interval)
+            await self.flush_vote_progress()
+
+    async def flush_vote_progress(self):
+        """立即广播所有待发送的投票进度"""
+        pending, self.pending_progress = self.pending_progress, {}
+        for contest_id, (class_id, total_votes) in pending.items():
+            self.progress_broadcasts += 1
             try:
-                await connection.send_text(message)
-            except Exception:
+                await self.broadcast_vote_progress(class_id, total_votes, contest_id)
+            except Exception as e:
+                print(f"投票进度广播失败: {e}")
+
+    async def stop_progress_ticker(self):
+        """停止投票进度广播任务，并发送剩余的进度"""
+        if self.progress_task is not None and not self.progress_task.done():
+            self.progress_task.cancel()
+            try:
+                await self.progress_task
+            except asyncio.CancelledError:
                 pass
+        self.progress_task = None
+        await self.flush_vote_progress()
+
+    def progress_metrics(self) -> dict:
+        """投票进度合并广播指标"""
+        return {
+            "interval_ms": int(self.progress_interval * 1000),
+            "running": self.progress_task is not None and not self.progress_task.done(),
+            "pending": len(self.pending_progress),
+            "marks": self.progress_marks,
+            "broadcasts": self.progress_broadcasts,
+            "coalesced": self.progress_coalesced
+        }
 
     async def broadcast_results_reveal(self, class_id: int, results: dict):
         """广播结果揭晓"""
-        message = json.dumps({
+        await backplane.publish("ws.results_reveal", {
             "type": "results_reveal",
             "data": {
                 "class_id": class_id,
                 "results": results
             }
         })
+    
+    def _deliver_results_reveal(self, message: dict):
+        class_id = message["data"]["class_id"]
+        frames = self._prepare_class_frame(class_id, message)
+        if frames is None:
+            return
         
-        # 广播到所有连接
-        if class_id in self.active_connections:
-            for connection in self.active_connections[class_id]:
-                try:
-                    await connection.send_text(message)
-                except Exception:
-                    pass
-        
-        for connection in self.global_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                pass
+        # 广播到该班级的所有连接
+        self._fanout_class(class_id, frames)
 
 
 # 模块级别的 manager 实例
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
+manager.subscribe_to(backplane)
\ No newline at end of file
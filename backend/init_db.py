@@ -15,7 +15,7 @@ from app.models.workspace import Workspace
 from app.models.teacher_class import TeacherClass
 from app.models.class_ import Class
 from app.models.system_settings import SystemSettings, SystemStage
-from app.services.auth import get_password_hash
+from app.services.auth import get_password_hash, DEFAULT_PASSWORD
 
 
 async def create_default_admin():
@@ -110,7 +110,8 @@ async def create_test_data(workspace_id: int):
             for i in range(1, 5):
                 team = User(
                     username=f"team{i:02d}_{class_.id}",
-                    password_hash=get_password_hash("123456"),
+                    password_hash=get_password_hash(DEFAULT_PASSWORD),
+                    must_change_password=True,
                     role=UserRole.student,
                     display_name=f"团队{i}",
                     workspace_id=workspace_id,
@@ -1,5 +1,8 @@
 """
 数据库优化：增强场次数据隔离
+
+注意：这些索引已作为 Alembic 迁移 333d93894882 发布，`alembic upgrade head` 会自动创建；
+本脚本仅保留给未使用 Alembic 的旧 SQLite 库手动执行。
 """
 
 # 1. 添加复合唯一索引，防止跨场次数据污染
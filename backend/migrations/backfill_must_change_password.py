@@ -0,0 +1,44 @@
+"""
+回填 users.must_change_password
+
+迁移 5c2e8d41a7b3 新增该列时，已有账号一律为 False。本脚本对每个账号做一次 bcrypt 校验，
+仍在使用默认密码的账号标记为需要修改密码。校验在哈希线程池中并行执行，可重复运行。
+
+用法（在 backend 目录下）：
+    python -m migrations.backfill_must_change_password
+"""
+import asyncio
+
+from sqlalchemy import select, update
+
+from app.database import async_session
+from app.models.user import User
+from app.services.auth import DEFAULT_PASSWORD, verify_password_async
+from app.services.password_hasher import password_hasher
+
+
+async def backfill():
+    async with async_session() as db:
+        result = await db.execute(
+            select(User.id, User.password_hash).where(User.must_change_password.is_(False))
+        )
+        rows = result.all()
+        print(f"待检查账号: {len(rows)}")
+
+        matches = await asyncio.gather(*[
+            verify_password_async(DEFAULT_PASSWORD, password_hash) for _, password_hash in rows
+        ])
+        user_ids = [user_id for (user_id, _), is_default in zip(rows, matches) if is_default]
+
+        if user_ids:
+            await db.execute(
+                update(User).where(User.id.in_(user_ids)).values(must_change_password=True)
+            )
+            await db.commit()
+        print(f"✅ 已标记 {len(user_ids)} 个仍在使用默认密码的账号")
+
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,26 @@
+"""
+测试共用的数据库夹具
+
+每个测试使用 tmp_path 下独立的 SQLite 数据库；测试函数内部用 asyncio.run 执行协程。
+"""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.models  # noqa: F401  注册所有表
+from app.database import Base
+
+
+@pytest.fixture
+def database(tmp_path):
+    """建好全部表的空数据库，返回会话工厂"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    asyncio.run(engine.dispose())
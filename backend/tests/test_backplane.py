@@ -0,0 +1,77 @@
+"""
+广播总线测试：进程内总线按发布顺序分发，以及 auto 模式的选择
+"""
+import asyncio
+
+from app.config import settings
+from app.websocket.backplane import LocalBackplane, PostgresBackplane, create_backplane
+
+
+def test_local_backplane_dispatches_in_publish_order():
+    async def run():
+        bus = LocalBackplane()
+        received = []
+
+        async def slow_handler(data):
+            # 前一个事件的处理函数还没完成时，后一个事件不会开始分发
+            await asyncio.sleep(0.01 if data["n"] % 2 else 0)
+            received.append(("slow", data["n"]))
+
+        bus.subscribe("vote", slow_handler)
+        bus.subscribe("vote", lambda data: received.append(("sync", data["n"])))
+        bus.subscribe("other", lambda data: received.append(("other", data["n"])))
+
+        for n in range(4):
+            await bus.publish("vote", {"n": n})
+        await bus.publish("other", {"n": 4})
+        # 发布方不等待处理函数
+        assert received == []
+
+        await bus.stop()
+        assert received == [
+            ("slow", 0), ("sync", 0),
+            ("slow", 1), ("sync", 1),
+            ("slow", 2), ("sync", 2),
+            ("slow", 3), ("sync", 3),
+            ("other", 4)
+        ]
+        assert bus.published == bus.delivered == 5
+
+    asyncio.run(run())
+
+
+def test_failing_handler_does_not_block_others():
+    async def run():
+        bus = LocalBackplane()
+        received = []
+
+        def broken(data):
+            raise ValueError("boom")
+
+        bus.subscribe("vote", broken)
+        bus.subscribe("vote", lambda data: received.append(data["n"]))
+        await bus.publish("vote", {"n": 1})
+        await bus.publish("vote", {"n": 2})
+        await bus.stop()
+        assert received == [1, 2]
+
+    asyncio.run(run())
+
+
+def test_resync_runs_every_handler():
+    bus = LocalBackplane()
+    calls = []
+    bus.on_resync(lambda: calls.append("state"))
+    bus.on_resync(lambda: 1 / 0)
+    bus.on_resync(lambda: calls.append("tally"))
+    bus.resync()
+    assert calls == ["state", "tally"]
+    assert bus.resyncs == 1
+
+
+def test_auto_backend_uses_postgres_only_with_several_workers(monkeypatch):
+    monkeypatch.setattr(settings, "BROADCAST_BACKEND", "auto")
+    monkeypatch.setattr(settings, "UVICORN_WORKERS", 1)
+    assert isinstance(create_backplane(), LocalBackplane)
+    monkeypatch.setattr(settings, "UVICORN_WORKERS", 4)
+    assert isinstance(create_backplane(), PostgresBackplane)
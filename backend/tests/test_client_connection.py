@@ -0,0 +1,105 @@
+"""
+单连接发送队列测试：队列满时丢弃最旧的消息，发送卡住的连接被断开
+"""
+import asyncio
+import json
+
+from app.websocket.connection import ClientConnection, SLOW_CONSUMER_CLOSE_CODE
+from app.websocket.encoding import EncodedFrame
+
+
+class BlockingWebSocket:
+    """send_text 在 release 之前一直挂起的 WebSocket"""
+
+    def __init__(self):
+        self.sent = []
+        self.close_codes = []
+        self.released = asyncio.Event()
+
+    async def send_text(self, text: str):
+        await self.released.wait()
+        self.sent.append(json.loads(text)["n"])
+
+    async def close(self, code: int = 1000):
+        self.close_codes.append(code)
+
+
+def _connection(websocket, closed, max_queue=2, stall_timeout=10.0) -> ClientConnection:
+    connection = ClientConnection(
+        websocket,
+        class_id=1,
+        max_queue=max_queue,
+        stall_timeout=stall_timeout,
+        on_close=closed.append
+    )
+    connection.start()
+    return connection
+
+
+def _frame(n: int) -> EncodedFrame:
+    return EncodedFrame({"type": "TEST", "n": n})
+
+
+def test_full_queue_drops_oldest_message():
+    async def run():
+        websocket, closed = BlockingWebSocket(), []
+        connection = _connection(websocket, closed)
+        connection.enqueue(_frame(1))
+        await asyncio.sleep(0)  # 写协程取出第 1 条并卡在发送上
+
+        for n in (2, 3, 4):
+            assert connection.enqueue(_frame(n))
+        assert connection.dropped == 1
+
+        websocket.released.set()
+        await asyncio.sleep(0.01)
+        assert websocket.sent == [1, 3, 4]
+        assert not closed
+        connection.close()
+
+    asyncio.run(run())
+
+
+def test_keyed_messages_keep_only_the_latest():
+    async def run():
+        websocket, closed = BlockingWebSocket(), []
+        connection = _connection(websocket, closed, max_queue=10)
+        connection.enqueue(_frame(1))
+        await asyncio.sleep(0)
+
+        connection.enqueue(_frame(2), key="timer")
+        connection.enqueue(_frame(3))
+        connection.enqueue(_frame(4), key="timer")
+        assert connection.coalesced == 1
+
+        websocket.released.set()
+        await asyncio.sleep(0.01)
+        # 被替换的消息排到队尾，保持与其他消息的先后顺序
+        assert websocket.sent == [1, 3, 4]
+        connection.close()
+
+    asyncio.run(run())
+
+
+def test_stalled_connection_is_evicted_when_queue_is_full():
+    async def run():
+        websocket, closed = BlockingWebSocket(), []
+        connection = _connection(websocket, closed, stall_timeout=0.05)
+        connection.enqueue(_frame(1))
+        await asyncio.sleep(0)
+        connection.enqueue(_frame(2))
+        connection.enqueue(_frame(3))
+
+        # 队列满但发送还没卡够 stall_timeout：只丢弃最旧的
+        assert connection.enqueue(_frame(4))
+        assert not connection.closed
+
+        await asyncio.sleep(0.1)
+        assert connection.enqueue(_frame(5)) is False
+        assert connection.closed
+        assert closed == [connection]
+        await asyncio.sleep(0.01)
+        assert websocket.close_codes == [SLOW_CONSUMER_CLOSE_CODE]
+        assert connection.enqueue(_frame(6)) is False
+
+    asyncio.run(run())
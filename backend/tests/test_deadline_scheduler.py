@@ -0,0 +1,89 @@
+"""
+截止时间调度器测试：按到期顺序触发、同一 key 替换、取消
+"""
+import asyncio
+
+from app.services.deadline_scheduler import DeadlineScheduler
+
+
+def test_events_fire_in_deadline_order():
+    async def run():
+        scheduler = DeadlineScheduler()
+        fired = []
+        scheduler.schedule_in("class-2", 0.03, lambda: fired.append(2))
+        scheduler.schedule_in("class-1", 0.01, lambda: fired.append(1))
+        scheduler.schedule_in("class-3", 0.05, lambda: fired.append(3))
+
+        await asyncio.sleep(0.1)
+        assert fired == [1, 2, 3]
+        assert scheduler.fired == 3
+        assert scheduler.metrics()["scheduled"] == 0
+
+    asyncio.run(run())
+
+
+def test_schedule_same_key_replaces_event():
+    async def run():
+        scheduler = DeadlineScheduler()
+        fired = []
+        scheduler.schedule_in("countdown", 0.01, lambda: fired.append("old"))
+        # 提前和推后都只保留最后一次调度
+        scheduler.schedule_in("countdown", 0.03, lambda: fired.append("new"))
+
+        await asyncio.sleep(0.02)
+        assert fired == []
+        assert scheduler.has("countdown")
+
+        await asyncio.sleep(0.03)
+        assert fired == ["new"]
+        assert not scheduler.has("countdown")
+        assert scheduler.fired == 1
+
+    asyncio.run(run())
+
+
+def test_cancel_removes_event():
+    async def run():
+        scheduler = DeadlineScheduler()
+        fired = []
+        scheduler.schedule_in("a", 0.01, lambda: fired.append("a"))
+        scheduler.schedule_in("b", 0.02, lambda: fired.append("b"))
+
+        assert scheduler.cancel("a") is True
+        assert scheduler.cancel("a") is False
+        assert scheduler.cancel("missing") is False
+
+        await asyncio.sleep(0.05)
+        assert fired == ["b"]
+
+        # 取消唯一的事件后不再保留定时器
+        scheduler.schedule_in("c", 0.01, lambda: fired.append("c"))
+        scheduler.cancel("c")
+        scheduler._arm()
+        assert scheduler._timer is None
+
+    asyncio.run(run())
+
+
+def test_coroutine_callbacks_run_as_tasks_and_failures_are_counted():
+    async def run():
+        scheduler = DeadlineScheduler()
+        fired = []
+
+        async def close_phase():
+            await asyncio.sleep(0)
+            fired.append("closed")
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        scheduler.schedule_in("close", 0, close_phase)
+        scheduler.schedule_in("broken", 0, broken)
+        scheduler.schedule_in("sync-broken", 0, lambda: 1 / 0)
+
+        await asyncio.sleep(0.02)
+        assert fired == ["closed"]
+        assert scheduler.fired == 3
+        assert scheduler.failures == 2
+
+    asyncio.run(run())
@@ -0,0 +1,141 @@
+"""
+断线重连测试：缺口在缓冲区内时逐条补发，补发不了时发送状态快照，本进程没有班级状态时要求客户端重新拉取
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.websocket.manager import ConnectionManager, ROLE_AUDIENCE, ROLE_SCREEN
+
+CLASS_ID = 1
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.messages.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _notice(manager: ConnectionManager, n: int):
+    manager._deliver_to_class({"class_id": CLASS_ID, "message": {"type": "NOTICE", "data": {"n": n}}})
+
+
+def _debate_update(manager: ConnectionManager, stage: str):
+    manager._deliver_to_class({
+        "class_id": CLASS_ID,
+        "message": {
+            "type": "debate_update",
+            "data": {
+                "class_id": CLASS_ID,
+                "stage": stage,
+                "progress": {"voting_enabled": True, "pre_voting_progress": 5}
+            }
+        }
+    })
+
+
+async def _reconnect(manager: ConnectionManager, resume_from: int, epoch: str | None, role: str = ROLE_SCREEN):
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, CLASS_ID, resume_from=resume_from, epoch=epoch, role=role)
+    await asyncio.sleep(0.01)
+    manager.disconnect(websocket)
+    await manager.stop_sweeper()
+    *frames, resume = websocket.messages
+    assert resume["type"] == "RESUME"
+    return frames, resume["data"]
+
+
+@pytest.fixture
+def small_replay_buffer(monkeypatch):
+    monkeypatch.setattr(settings, "WS_REPLAY_BUFFER_SIZE", 3)
+
+
+def test_gap_inside_buffer_is_replayed(small_replay_buffer):
+    async def run():
+        manager = ConnectionManager()
+        for n in range(1, 6):
+            _notice(manager, n)
+
+        # 缓冲区保留 seq 3~5，客户端收到过 seq 2，缺口正好在缓冲区内
+        frames, resume = await _reconnect(manager, 2, manager.epoch)
+        assert [f["data"]["n"] for f in frames] == [3, 4, 5]
+        assert [f["seq"] for f in frames] == [3, 4, 5]
+        assert resume == {"mode": "replay", "frames": 3, "seq": 5, "epoch": manager.epoch}
+
+        # 没有错过任何消息
+        frames, resume = await _reconnect(manager, 5, manager.epoch)
+        assert frames == []
+        assert resume["mode"] == "replay"
+        assert manager.resumes_replayed == 2
+
+    asyncio.run(run())
+
+
+def test_replay_only_sends_frames_for_the_connection_role(small_replay_buffer):
+    async def run():
+        manager = ConnectionManager()
+        _notice(manager, 1)
+        manager._deliver_to_class({
+            "class_id": CLASS_ID,
+            "message": {"type": "vote_progress", "data": {"total_votes": 3}}
+        })
+        _notice(manager, 2)
+
+        frames, resume = await _reconnect(manager, 0, manager.epoch, role=ROLE_AUDIENCE)
+        assert [f["type"] for f in frames] == ["NOTICE", "NOTICE"]
+        assert resume["frames"] == 2
+
+    asyncio.run(run())
+
+
+def test_gap_beyond_buffer_or_other_epoch_sends_snapshot(small_replay_buffer):
+    async def run():
+        manager = ConnectionManager()
+        _debate_update(manager, "PRE_VOTING")
+        for n in range(1, 6):
+            _notice(manager, n)
+
+        # 缓冲区只剩 seq 4~6，seq 2 之后的消息已经补发不了
+        frames, resume = await _reconnect(manager, 2, manager.epoch)
+        assert [f["type"] for f in frames] == ["CLASS_STATE"]
+        assert frames[0]["data"]["stage"] == "PRE_VOTING"
+        assert frames[0]["seq"] == 1
+        assert resume == {"mode": "snapshot", "frames": 1, "seq": 6, "epoch": manager.epoch}
+
+        # 重连到了其他进程：序号不可比较，即使在范围内也发送快照
+        frames, resume = await _reconnect(manager, 5, "other-worker", role=ROLE_AUDIENCE)
+        assert resume["mode"] == "snapshot"
+        # 观众收到的快照不含投票计数
+        assert frames[0]["data"]["progress"] == {"voting_enabled": True}
+        assert manager.resumes_snapshot == 2
+
+    asyncio.run(run())
+
+
+def test_missing_class_state_requires_reset(small_replay_buffer):
+    async def run():
+        manager = ConnectionManager()
+        for n in range(1, 6):
+            _notice(manager, n)
+
+        frames, resume = await _reconnect(manager, 1, manager.epoch)
+        assert frames == []
+        assert resume == {"mode": "reset", "frames": 0, "seq": 5, "epoch": manager.epoch}
+
+        # 本进程刚启动，还没有任何消息
+        fresh = ConnectionManager()
+        frames, resume = await _reconnect(fresh, 7, "old-worker")
+        assert resume["mode"] == "reset"
+        assert fresh.resumes_reset == 1
+
+    asyncio.run(run())
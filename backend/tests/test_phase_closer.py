@@ -0,0 +1,118 @@
+"""
+投票阶段自动结束测试：按比例或超时结束，以及与管理员手动切换阶段的竞争
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.models.contest import Contest
+from app.models.system_settings import SystemSettings, SystemStage
+from app.services import phase_closer as phase_closer_module
+from app.services.class_state_cache import class_state_cache
+from app.services.phase_closer import PhaseClosePlan, PhaseCloser, REASON_RATIO, REASON_TIMEOUT
+from app.services.system_state import transition_stage
+
+CLASS_ID = 1
+CONTEST_ID = 1
+OPENED_AT = 1000
+
+
+@pytest.fixture
+def session_maker(database, monkeypatch):
+    async def setup():
+        async with database() as db:
+            db.add(Contest(id=CONTEST_ID, class_id=CLASS_ID, topic="辩题", pro_team_name="正方", con_team_name="反方"))
+            db.add(SystemSettings(
+                class_id=CLASS_ID,
+                current_stage=SystemStage.PRE_VOTING,
+                contest_id=CONTEST_ID,
+                pre_voting_enabled=True,
+                update_time=OPENED_AT
+            ))
+            await db.commit()
+
+    asyncio.run(setup())
+    # 自动结束使用模块级的 async_session_maker
+    monkeypatch.setattr(phase_closer_module, "async_session_maker", database)
+    class_state_cache.clear()
+    yield database
+    class_state_cache.clear()
+
+
+def _plan() -> PhaseClosePlan:
+    return PhaseClosePlan(
+        class_id=CLASS_ID,
+        stage=SystemStage.PRE_VOTING,
+        close_to=SystemStage.DEBATE_IN_PROGRESS,
+        vote_phase="pre_debate",
+        contest_id=CONTEST_ID,
+        update_time=OPENED_AT,
+        ratio=0.5,
+        deadline=None
+    )
+
+
+async def _stage(maker) -> SystemStage:
+    async with maker() as db:
+        result = await db.execute(select(SystemSettings.current_stage).where(SystemSettings.class_id == CLASS_ID))
+        return result.scalar_one()
+
+
+async def _run_scheduled_close():
+    """trigger 把转换交给调度器，等待其在独立任务中完成"""
+    await asyncio.sleep(0.05)
+
+
+def test_ratio_closes_voting(session_maker):
+    async def run():
+        closer = PhaseCloser()
+        closer.put(_plan())
+        closer.trigger(CLASS_ID, REASON_RATIO)
+        assert closer.get(CLASS_ID) is None
+
+        await _run_scheduled_close()
+        assert await _stage(session_maker) == SystemStage.DEBATE_IN_PROGRESS
+        assert closer.closed_by_ratio == 1
+        assert closer.skipped == 0
+
+    asyncio.run(run())
+
+
+def test_manual_transition_wins_over_auto_close(session_maker):
+    async def run():
+        closer = PhaseCloser()
+        closer.put(_plan())
+
+        # 管理员先手动结束了投票并进入下一阶段，再回到赛前投票
+        async with session_maker() as db:
+            await transition_stage(db, CLASS_ID, SystemStage.DEBATE_IN_PROGRESS, expected_update_time=OPENED_AT)
+        async with session_maker() as db:
+            await transition_stage(db, CLASS_ID, SystemStage.PRE_VOTING)
+
+        # 旧条件的倒计时随后到期：版本已变，放弃，不覆盖管理员的操作
+        closer.trigger(CLASS_ID, REASON_TIMEOUT)
+        await _run_scheduled_close()
+        assert await _stage(session_maker) == SystemStage.PRE_VOTING
+        assert closer.skipped == 1
+        assert closer.closed_by_timeout == 0
+
+    asyncio.run(run())
+
+
+def test_ratio_and_timeout_close_only_once(session_maker):
+    async def run():
+        closer = PhaseCloser()
+        closer.put(_plan())
+
+        # 比例达到后倒计时也恰好结束：条件已被取出，第二次触发不做任何事
+        closer.trigger(CLASS_ID, REASON_RATIO)
+        closer.trigger(CLASS_ID, REASON_TIMEOUT)
+        await _run_scheduled_close()
+
+        assert await _stage(session_maker) == SystemStage.DEBATE_IN_PROGRESS
+        assert closer.closed_by_ratio == 1
+        assert closer.closed_by_timeout == 0
+        assert closer.skipped == 0
+
+    asyncio.run(run())
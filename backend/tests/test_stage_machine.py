@@ -0,0 +1,169 @@
+"""
+阶段状态机的比较并写入（CAS）测试
+
+每个测试使用独立的 SQLite 数据库（conftest.database）和 StageMachine 实例；
+并发修改通过在状态机读到缓存快照之后、写入之前直接更新数据库来模拟。
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+from app.models.system_settings import SystemSettings, SystemStage
+from app.models.user import User, UserRole
+from app.services.class_state_cache import class_state_cache
+from app.services.stage_machine import StageMachine
+
+CLASS_ID = 1
+
+
+@pytest.fixture
+def session_maker(database):
+    async def setup():
+        async with database() as db:
+            db.add(SystemSettings(class_id=CLASS_ID, current_stage=SystemStage.IDLE, contest_id=1, update_time=1000))
+            await db.commit()
+
+    asyncio.run(setup())
+    class_state_cache.clear()
+    yield database
+    class_state_cache.clear()
+
+
+async def _warm_cache(maker):
+    """让状态机从缓存读到当前版本的快照"""
+    async with maker() as db:
+        return await class_state_cache.get(db, CLASS_ID)
+
+
+async def _concurrent_write(maker, **values):
+    """模拟另一个请求抢先提交的修改（不经过缓存）"""
+    async with maker() as db:
+        await db.execute(update(SystemSettings).where(SystemSettings.class_id == CLASS_ID).values(**values))
+        await db.commit()
+
+
+async def _stored(maker) -> SystemSettings:
+    async with maker() as db:
+        result = await db.execute(select(SystemSettings).where(SystemSettings.class_id == CLASS_ID))
+        return result.scalar_one()
+
+
+def test_lost_race_reloads_and_retries(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=3)
+        await _warm_cache(session_maker)
+        await _concurrent_write(session_maker, current_stage=SystemStage.DEBATE_IN_PROGRESS, update_time=2000)
+
+        async with session_maker() as db:
+            result = await machine.apply(db, CLASS_ID, SystemStage.POST_VOTING)
+
+        stored = await _stored(session_maker)
+        assert machine.conflicts == 1
+        assert machine.applied == 1
+        assert result.previous.update_time == 2000
+        assert result.state.update_time == stored.update_time > 2000
+        assert stored.current_stage == SystemStage.POST_VOTING
+        assert stored.post_voting_enabled is True
+
+    asyncio.run(run())
+
+
+def test_lost_race_rechecks_transition_table(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=3)
+        await _warm_cache(session_maker)
+        await _concurrent_write(
+            session_maker,
+            current_stage=SystemStage.RESULTS_REVEALED,
+            results_revealed=True,
+            update_time=2000
+        )
+
+        async with session_maker() as db:
+            with pytest.raises(HTTPException) as exc:
+                await machine.apply(db, CLASS_ID, SystemStage.PRE_VOTING)
+
+        assert exc.value.status_code == 400
+        assert (await _stored(session_maker)).current_stage == SystemStage.RESULTS_REVEALED
+
+    asyncio.run(run())
+
+
+def test_conflict_after_retries_returns_409(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=0)
+        await _warm_cache(session_maker)
+        await _concurrent_write(session_maker, update_time=2000)
+
+        async with session_maker() as db:
+            with pytest.raises(HTTPException) as exc:
+                await machine.apply(db, CLASS_ID, SystemStage.PRE_VOTING)
+
+        assert exc.value.status_code == 409
+        assert (await _stored(session_maker)).current_stage == SystemStage.IDLE
+
+    asyncio.run(run())
+
+
+def test_expected_update_time_mismatch_returns_409_without_retry(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=3)
+        state = await _warm_cache(session_maker)
+
+        async with session_maker() as db:
+            with pytest.raises(HTTPException) as exc:
+                await machine.apply(db, CLASS_ID, SystemStage.PRE_VOTING, expected_update_time=state.update_time - 1)
+
+        stored = await _stored(session_maker)
+        assert exc.value.status_code == 409
+        assert machine.applied == 0
+        assert stored.current_stage == SystemStage.IDLE
+        assert stored.update_time == state.update_time
+
+    asyncio.run(run())
+
+
+def test_legacy_stage_keeps_debate_flags(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=3)
+        await _concurrent_write(
+            session_maker,
+            current_stage=SystemStage.RESULTS_REVEALED,
+            results_revealed=True,
+            update_time=2000
+        )
+
+        async with session_maker() as db:
+            await machine.apply(db, CLASS_ID, SystemStage.PRESENTATION)
+
+        stored = await _stored(session_maker)
+        assert stored.current_stage == SystemStage.PRESENTATION
+        assert stored.results_revealed is True
+
+    asyncio.run(run())
+
+
+def test_update_without_values_bumps_version_and_reloads_team(session_maker):
+    async def run():
+        machine = StageMachine(max_retries=3)
+        async with session_maker() as db:
+            team = User(username="team", password_hash="x", role=UserRole.student, display_name="队伍", topic="旧主题")
+            db.add(team)
+            await db.commit()
+            team_id = team.id
+        await _concurrent_write(session_maker, current_team_id=team_id, update_time=2000)
+        state = await _warm_cache(session_maker)
+        assert state.current_team_topic == "旧主题"
+
+        async with session_maker() as db:
+            team = await db.get(User, team_id)
+            team.topic = "新主题"
+            result = await machine.update(db, CLASS_ID)
+
+        assert result.update_time == (await _stored(session_maker)).update_time > 2000
+        assert result.current_team_name == "队伍"
+        assert result.current_team_topic == "新主题"
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+"""
+投票批量写入队列测试：攒批写入、冲突判断，以及停止时不会让提交方一直等待
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.vote_record import VoteRecord
+from app.services import vote_ingest
+from app.services.vote_ingest import VoteWriteBehindQueue
+
+CONTEST_ID = 1
+
+
+@pytest.fixture
+def queue_database(database, monkeypatch):
+    """批量写入使用模块级的 async_session_maker，替换为测试数据库"""
+    monkeypatch.setattr(vote_ingest, "async_session_maker", database)
+    return database
+
+
+async def _count_votes(maker) -> int:
+    async with maker() as db:
+        return (await db.execute(select(func.count(VoteRecord.id)))).scalar()
+
+
+def test_flush_batches_votes_and_reports_conflicts(queue_database):
+    async def run():
+        queue = VoteWriteBehindQueue(flush_interval_ms=20, max_rows=2, max_size=100)
+        queue.start()
+        results = await asyncio.gather(
+            queue.submit(CONTEST_ID, 1, "pro", "pre_debate"),
+            queue.submit(CONTEST_ID, 2, "con", "pre_debate"),
+            queue.submit(CONTEST_ID, 3, "pro", "pre_debate"),
+            # 同一批内的重复选票
+            queue.submit(CONTEST_ID, 1, "con", "pre_debate")
+        )
+        # 已经写入过的选票
+        repeated = await queue.submit(CONTEST_ID, 2, "pro", "pre_debate")
+        await queue.stop()
+
+        assert [r["voter_id"] for r in results[:3]] == [1, 2, 3]
+        assert all(r["id"] for r in results[:3])
+        assert results[3] is None
+        assert repeated is None
+        assert queue.rows_written == 3
+        assert queue.conflicts == 2
+        assert queue.batches >= 2  # max_rows=2
+        assert await _count_votes(queue_database) == 3
+
+    asyncio.run(run())
+
+
+def test_stop_flushes_queued_votes(queue_database):
+    async def run():
+        # 攒批时间远大于测试时长：只有 stop 能让这批选票写入
+        queue = VoteWriteBehindQueue(flush_interval_ms=60_000, max_rows=100, max_size=100)
+        queue.start()
+        pending = [asyncio.ensure_future(queue.submit(CONTEST_ID, voter_id, "pro", "post_debate")) for voter_id in (1, 2)]
+        await asyncio.sleep(0.01)
+
+        await queue.stop()
+        results = await asyncio.wait_for(asyncio.gather(*pending), 1)
+        assert [r["voter_id"] for r in results] == [1, 2]
+        assert await _count_votes(queue_database) == 2
+
+        # 停止后再次提交会重新启动写入任务
+        resubmitted = asyncio.ensure_future(queue.submit(CONTEST_ID, 3, "pro", "post_debate"))
+        await asyncio.sleep(0.01)
+        assert queue.running
+        await queue.stop()
+        assert (await asyncio.wait_for(resubmitted, 1))["voter_id"] == 3
+
+    asyncio.run(run())
+
+
+def test_cancelled_writer_fails_pending_submitters(queue_database):
+    async def run():
+        queue = VoteWriteBehindQueue(flush_interval_ms=60_000, max_rows=100, max_size=100)
+        queue.start()
+        pending = [asyncio.ensure_future(queue.submit(CONTEST_ID, voter_id, "pro", "pre_debate")) for voter_id in (1, 2)]
+        await asyncio.sleep(0.01)
+
+        # 写入任务被取消（如事件循环关闭）：攒批中的选票立即失败，而不是一直等待
+        queue._task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 1)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert queue.failures == 2
+        assert await _count_votes(queue_database) == 0
+
+    asyncio.run(run())
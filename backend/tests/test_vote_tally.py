@@ -0,0 +1,92 @@
+"""
+进程内投票计数测试：预热、记录和失效
+"""
+import asyncio
+
+from app.models.vote_record import VoteRecord
+from app.services.vote_tally import VoteTallyStore
+
+CONTEST_ID = 1
+
+
+async def _insert_votes(maker, *votes):
+    async with maker() as db:
+        db.add_all(
+            VoteRecord(contest_id=CONTEST_ID, voter_id=voter_id, vote_phase=vote_phase, team_side=team_side)
+            for voter_id, vote_phase, team_side in votes
+        )
+        await db.commit()
+
+
+def test_get_warms_from_database_once(database):
+    async def run():
+        store = VoteTallyStore()
+        await _insert_votes(database, (1, "pre_debate", "pro"), (2, "pre_debate", "con"), (1, "post_debate", "con"))
+        assert store.peek(CONTEST_ID) is None
+
+        async with database() as db:
+            tally = await store.get(db, CONTEST_ID)
+        assert tally.warmed
+        assert tally.votes("pro", "pre_debate") == 1
+        assert tally.phase_total("pre_debate") == 2
+        assert tally.total_voters == 2
+        assert store.peek(CONTEST_ID) is tally
+
+        # 已预热：之后写入数据库的选票只通过 record_vote 进入计数
+        await _insert_votes(database, (3, "pre_debate", "pro"))
+        async with database() as db:
+            assert (await store.get(db, CONTEST_ID)).phase_total("pre_debate") == 2
+
+    asyncio.run(run())
+
+
+def test_record_vote_is_idempotent_and_survives_warm(database):
+    async def run():
+        store = VoteTallyStore()
+        await _insert_votes(database, (1, "pre_debate", "pro"))
+
+        # 预热前到达的选票先计入，预热时同一张选票不会重复计数
+        assert store.record_vote(CONTEST_ID, 1, "pre_debate", "pro") is True
+        assert store.record_vote(CONTEST_ID, 1, "pre_debate", "pro") is False
+        assert store.peek(CONTEST_ID) is None
+
+        async with database() as db:
+            tally = await store.get(db, CONTEST_ID)
+        assert tally.phase_total("pre_debate") == 1
+
+        version = tally.version
+        assert store.record_vote(CONTEST_ID, 2, "pre_debate", "con") is True
+        assert tally.snapshot() == {
+            "pro_pre_votes": 1,
+            "con_pre_votes": 1,
+            "pro_post_votes": 0,
+            "con_post_votes": 0,
+            "total_voters": 2
+        }
+        assert tally.version == version + 1
+
+    asyncio.run(run())
+
+
+def test_invalidate_rewarms_from_database(database):
+    async def run():
+        store = VoteTallyStore()
+        async with database() as db:
+            tally = await store.get(db, CONTEST_ID)
+        # 只记在内存、没有写入数据库的选票在失效后消失
+        store.record_vote(CONTEST_ID, 9, "pre_debate", "pro")
+        assert tally.phase_total("pre_debate") == 1
+
+        store.invalidate(CONTEST_ID)
+        assert store.peek(CONTEST_ID) is None
+        await _insert_votes(database, (1, "pre_debate", "con"))
+        async with database() as db:
+            rewarmed = await store.get(db, CONTEST_ID)
+        assert rewarmed is not tally
+        assert rewarmed.votes("con", "pre_debate") == 1
+        assert rewarmed.votes("pro", "pre_debate") == 0
+
+        store.clear()
+        assert store.peek(CONTEST_ID) is None
+
+    asyncio.run(run())
@@ -15,9 +15,21 @@ export const useSystemStore = defineStore('system', () => {
 
     let ws = null
     let pingInterval = null
+    // 倒计时：按服务端下发的截止时间在本地倒数
+    let countdownTimer = null
+    let countdownDeadline = null
+    // 断线重连：最后收到的消息序号和服务端 epoch，重连时交给服务端补发错过的消息
+    let lastSeq = null
+    let lastEpoch = null
+    let seqClassId = null
+    // 等待连接建立后服务端下发的班级状态（CLASS_STATE）
+    let classStateWaiters = []
     // 标志位：是否正在连接中 / 是否手动断开
     let isConnecting = false
     let isManualDisconnect = false
+    // 通过 WebSocket 提交的投票：id -> { resolve, reject, timer }
+    const pendingVotes = new Map()
+    let voteSeq = 0
 
     async function fetchState() {
         const authStore = useAuthStore()
@@ -42,7 +54,9 @@ export const useSystemStore = defineStore('system', () => {
             // 设置倒计时（如果 API 返回了当前值）
             if (state.countdown !== null && state.countdown !== undefined) {
                 countdown.value = state.countdown
+                if (state.countdown > 0) startCountdown(Date.now() + state.countdown * 1000)
             } else if (currentStage.value !== 'QNA_SNATCH') {
+                stopCountdown()
                 countdown.value = 0
             }
         } catch (error) {
@@ -102,10 +116,26 @@ export const useSystemStore = defineStore('system', () => {
         // 如果前端是 5173，后端是 8000，则需要写死或配置
         // 之前代码是 `ws://${window.location.hostname}:8000/ws`，保持一致
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-        let wsUrl = `${protocol}//${window.location.host}/ws`
+        const params = new URLSearchParams()
         if (classId) {
-            wsUrl += `?class_id=${classId}`
+            params.set('class_id', classId)
         }
+        // 携带 token，连接建立时鉴权一次，之后可直接通过 socket 投票
+        if (authStore.token) {
+            params.set('token', authStore.token)
+        }
+        // 重连同一班级时携带上次的序号，服务端补发或发送快照，不必重新请求接口
+        if (seqClassId !== classId) {
+            lastSeq = null
+            lastEpoch = null
+            seqClassId = classId
+        }
+        if (lastSeq !== null && lastEpoch) {
+            params.set('resume_from', lastSeq)
+            params.set('epoch', lastEpoch)
+        }
+        const query = params.toString()
+        const wsUrl = `${protocol}//${window.location.host}/ws${query ? `?${query}` : ''}`
 
         // 如果已有连接，先关闭（标记为手动断开，防止触发自动重连）
         if (ws) {
@@ -177,6 +207,13 @@ export const useSystemStore = defineStore('system', () => {
     function handleMessage(message) {
         console.log('WebSocket 收到消息:', message)
 
+        if (message.seq !== undefined) {
+            if (message.epoch !== lastEpoch || lastSeq === null || message.seq > lastSeq) {
+                lastSeq = message.seq
+            }
+            lastEpoch = message.epoch
+        }
+
         switch (message.type) {
             case 'STATE_UPDATE':
             case 'state_update':
@@ -188,6 +225,7 @@ export const useSystemStore = defineStore('system', () => {
                 snatchStartTime.value = message.data.snatch_start_time || null
                 // 如果切换出提问阶段，倒计时归零
                 if (currentStage.value !== 'QNA_SNATCH') {
+                    stopCountdown()
                     countdown.value = 0
                 }
                 console.log('状态已更新, currentStage:', currentStage.value)
@@ -220,16 +258,114 @@ export const useSystemStore = defineStore('system', () => {
                 snatchSlotsRemaining.value = message.data.slots_remaining
                 break
             case 'TIMER_UPDATE':
-                // 收到后端实时倒计时更新
-                countdown.value = message.data.countdown
+                // 后端只在开始、定期校准和结束时下发截止时间，期间本地倒数
+                if (message.data.deadline) {
+                    startCountdown(message.data.deadline, message.data.server_time)
+                } else {
+                    stopCountdown()
+                    countdown.value = message.data.countdown
+                }
                 break
             case 'NEW_QUESTION':
                 // 触发自定义事件，让组件处理
                 window.dispatchEvent(new CustomEvent('new-question', { detail: message.data }))
                 break
+            case 'CLASS_STATE': {
+                // 连接建立时服务端直接下发的班级当前状态，无需再请求接口
+                const state = message.data
+                currentStage.value = state.stage
+                currentTeam.value = state.current_team
+                if (state.snatch_slots_remaining !== null && state.snatch_slots_remaining !== undefined) {
+                    snatchSlotsRemaining.value = state.snatch_slots_remaining
+                }
+                snatchStartTime.value = state.snatch_start_time || null
+                if (state.progress) {
+                    debateProgress.value = state.progress
+                }
+                if (!state.countdown_deadline) {
+                    stopCountdown()
+                    countdown.value = 0
+                }
+                classStateWaiters.forEach(resolve => resolve(true))
+                classStateWaiters = []
+                break
+            }
+            case 'RESUME':
+                // 服务端没有该班级的状态可补发时才重新请求接口
+                lastSeq = message.data.seq
+                lastEpoch = message.data.epoch
+                if (message.data.mode === 'reset') {
+                    fetchState()
+                    fetchDebateProgress()
+                }
+                break
+            case 'VOTE_ACK': {
+                const pending = pendingVotes.get(message.id)
+                if (pending) {
+                    clearTimeout(pending.timer)
+                    pendingVotes.delete(message.id)
+                    if (message.ok) {
+                        pending.resolve(message.data)
+                    } else {
+                        pending.reject({ detail: message.detail, status: message.status })
+                    }
+                }
+                break
+            }
+        }
+    }
+
+    // 按截止时间本地倒数；clockOffset 为服务器时间与本地时间之差
+    function startCountdown(deadline, serverTime) {
+        const clockOffset = serverTime ? serverTime - Date.now() : 0
+        countdownDeadline = deadline - clockOffset
+        const tick = () => {
+            countdown.value = Math.max(0, Math.ceil((countdownDeadline - Date.now()) / 1000))
+            if (countdown.value === 0) stopCountdown()
+        }
+        if (!countdownTimer) {
+            countdownTimer = setInterval(tick, 250)
+        }
+        tick()
+    }
+
+    function stopCountdown() {
+        if (countdownTimer) {
+            clearInterval(countdownTimer)
+            countdownTimer = null
         }
     }
 
+    // 等待服务端下发班级状态，超时（如服务端还没有该班级的状态）时返回 false，由调用方改为请求接口
+    function waitForClassState(timeoutMs = 1500) {
+        return new Promise(resolve => {
+            const done = (received) => {
+                clearTimeout(timer)
+                classStateWaiters = classStateWaiters.filter(waiter => waiter !== done)
+                resolve(received)
+            }
+            const timer = setTimeout(() => done(false), timeoutMs)
+            classStateWaiters.push(done)
+        })
+    }
+
+    function isSocketOpen() {
+        return !!ws && ws.readyState === WebSocket.OPEN
+    }
+
+    // 通过已建立的 WebSocket 提交投票，等待服务端按 id 回传确认
+    function sendVote(payload, timeoutMs = 5000) {
+        return new Promise((resolve, reject) => {
+            const id = `v${Date.now()}-${++voteSeq}`
+            const timer = setTimeout(() => {
+                pendingVotes.delete(id)
+                reject({ detail: '投票确认超时，请刷新后查看投票状态' })
+            }, timeoutMs)
+            pendingVotes.set(id, { resolve, reject, timer })
+            ws.send(JSON.stringify({ action: 'VOTE', id, data: payload }))
+        })
+    }
+
     function disconnect() {
         // 清除 ping 定时器
         if (pingInterval) {
@@ -259,6 +395,9 @@ export const useSystemStore = defineStore('system', () => {
         fetchState,
         fetchDebateProgress,
         connectWebSocket,
+        waitForClassState,
+        isSocketOpen,
+        sendVote,
         disconnect,
         reconnect
     }